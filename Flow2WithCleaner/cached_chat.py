@@ -0,0 +1,52 @@
+from promptflow.core import tool
+from gpt5_chat import StreamError, chat_with_gpt5, stream_gpt5
+from response_cache import fingerprint, get_response_cache
+from metrics import METRICS
+
+
+@tool
+def cached_chat_with_gpt5(system_prompt: str, user_input: str, context: str = "", prompt_variant: str = "", stream: bool = False):
+    """
+    chat_with_gpt5 behind the response cache.
+    The key is the normalized question, a fingerprint of the retrieved context and the
+    prompt variant. When no variant id is given, the rendered prompt minus the context
+    is fingerprinted instead, which also covers any chat history the template includes.
+    With stream=True a miss returns a generator of deltas; the full answer is cached once it completes.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return chat_with_gpt5(system_prompt, user_input, stream)
+
+    if not prompt_variant:
+        prompt_variant = fingerprint(system_prompt.replace(context, "") if context else system_prompt)
+
+    cached = cache.get(user_input, context, prompt_variant)
+    if cached is not None:
+        METRICS.inc("cache_total", cache="response", result="hit")
+        return cached
+    METRICS.inc("cache_total", cache="response", result="miss")
+
+    if stream:
+        return _stream_and_cache(cache, system_prompt, user_input, context, prompt_variant)
+
+    answer = chat_with_gpt5(system_prompt, user_input)
+
+    # Never cache failures
+    if not answer.startswith("Error"):
+        cache.set(user_input, context, prompt_variant, answer)
+    return answer
+
+
+def _stream_and_cache(cache, system_prompt, user_input, context, prompt_variant):
+    """Relay streamed deltas and cache the assembled answer once the stream completes without error."""
+    parts = []
+    failed = False
+    for delta in stream_gpt5(system_prompt, user_input):
+        # An error can arrive after part of the answer; such an answer is never cached
+        failed = failed or isinstance(delta, StreamError)
+        parts.append(delta)
+        yield delta
+
+    answer = "".join(parts).strip()
+    if answer and not failed:
+        cache.set(user_input, context, prompt_variant, answer)
@@ -1,114 +1,174 @@
-from promptflow.core import tool
-import json
-import ast
-
-@tool
-def clean_json_response(raw_response: str) -> str:
-    """
-    Cleans up raw JSON responses to extract just the text content.
-    Handles various GPT-5 response formats.
-    """
-    
-    # If it's already clean text (no JSON structure), return as-is
-    if not raw_response.strip().startswith('{') and not raw_response.strip().startswith('['):
-        return raw_response.strip()
-    
-    data = None
-    
-    # Try multiple parsing methods
-    # Method 1: Parse as JSON
-    try:
-        data = json.loads(raw_response)
-    except json.JSONDecodeError:
-        pass
-    
-    # Method 2: Parse as Python literal (handles single quotes)
-    if data is None:
-        try:
-            data = ast.literal_eval(raw_response)
-        except:
-            pass
-    
-    # If we successfully parsed the data
-    if data is not None:
-        # Helper function to extract text from nested structures
-        def extract_text_content(obj):
-            """Recursively extract text content from response object."""
-            if isinstance(obj, str):
-                return obj.strip()
-            
-            if isinstance(obj, list):
-                # Check if this is a list of output items
-                for item in obj:
-                    if isinstance(item, dict):
-                        # Look for message type items
-                        if item.get('type') == 'message':
-                            if 'content' in item and isinstance(item['content'], list):
-                                text_parts = []
-                                for content_item in item['content']:
-                                    if isinstance(content_item, dict) and content_item.get('type') == 'output_text':
-                                        if 'text' in content_item:
-                                            text_parts.append(content_item['text'])
-                                if text_parts:
-                                    return '\n'.join(text_parts).strip()
-                # Try first item if no message found
-                if len(obj) > 0:
-                    return extract_text_content(obj[0])
-            
-            if isinstance(obj, dict):
-                # GPT-5 specific: Check for output array with content
-                if 'output' in obj and isinstance(obj['output'], list):
-                    for output_item in obj['output']:
-                        if isinstance(output_item, dict) and output_item.get('type') == 'message':
-                            # Found message type, extract from content
-                            if 'content' in output_item and isinstance(output_item['content'], list):
-                                text_parts = []
-                                for content_item in output_item['content']:
-                                    if isinstance(content_item, dict) and content_item.get('type') == 'output_text':
-                                        if 'text' in content_item:
-                                            text_parts.append(content_item['text'])
-                                if text_parts:
-                                    return '\n'.join(text_parts).strip()
-                
-                # Check for direct text/content fields
-                if 'text' in obj and isinstance(obj['text'], str):
-                    return obj['text'].strip()
-                
-                # Handle content arrays (standard format)
-                if 'content' in obj:
-                    if isinstance(obj['content'], list):
-                        text_parts = []
-                        for item in obj['content']:
-                            if isinstance(item, dict):
-                                # Look for output_text type
-                                if item.get('type') == 'output_text' and 'text' in item:
-                                    text_parts.append(item['text'])
-                                elif 'text' in item:
-                                    text_parts.append(item['text'])
-                            elif isinstance(item, str):
-                                text_parts.append(item)
-                        if text_parts:
-                            return '\n'.join(text_parts).strip()
-                    elif isinstance(obj['content'], str):
-                        return obj['content'].strip()
-                
-                # Handle message format
-                if 'message' in obj and isinstance(obj['message'], dict):
-                    return extract_text_content(obj['message'])
-                
-                # Handle choices format (standard OpenAI)
-                if 'choices' in obj and isinstance(obj['choices'], list) and len(obj['choices']) > 0:
-                    return extract_text_content(obj['choices'][0])
-            
-            return None
-        
-        # Try to extract text
-        text = extract_text_content(data)
-        if text:
-            return text
-        
-        # If no text found, return formatted JSON (better than raw)
-        return json.dumps(data, indent=2)
-    
-    # Return original if we can't parse it
-    return raw_response.strip()
+from promptflow.core import tool
+import json
+import ast
+import os
+
+from metrics import METRICS
+
+# Optional faster JSON backend
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _JSON_ERRORS = (orjson.JSONDecodeError,)
+except ImportError:
+    _json_loads = json.loads
+    _JSON_ERRORS = (json.JSONDecodeError,)
+
+# ast.literal_eval is slow and memory hungry on big inputs; above this size we skip it
+LITERAL_EVAL_MAX_CHARS = int(os.environ.get("CLEAN_LITERAL_EVAL_MAX_CHARS", "1000000"))
+
+def clean_stream(chunks):
+    """
+    Incremental cleaner for streamed answers.
+    Plain-text streams are relayed delta by delta (leading whitespace trimmed);
+    a stream that starts with JSON is buffered and cleaned once complete.
+    """
+    buffered = []
+    plain_text = None
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if plain_text is None:
+            buffered.append(chunk)
+            head = "".join(buffered).lstrip()
+            if not head:
+                continue
+            plain_text = head[0] not in "{["
+            if plain_text:
+                buffered = []
+                yield head
+            continue
+        if plain_text:
+            yield chunk
+        else:
+            buffered.append(chunk)
+
+    if buffered:
+        yield extract_text("".join(buffered))[0]
+
+
+def _join_text_parts(content):
+    """Join the text of a content list (output_text items, {'text': ...} items or strings)."""
+    parts = []
+    for item in content:
+        if isinstance(item, str):
+            parts.append(item)
+        elif isinstance(item, dict):
+            text = item.get('text')
+            if isinstance(text, str):
+                parts.append(text)
+    return '\n'.join(parts).strip()
+
+
+def _messages_text(items):
+    """Text of all 'message' items in a Responses API output list, or '' if none."""
+    for item in items:
+        if isinstance(item, dict) and item.get('type') == 'message' and isinstance(item.get('content'), list):
+            text = _join_text_parts(item['content'])
+            if text:
+                return text
+    return ''
+
+
+def _extract(obj):
+    """Single pass over the known response shapes. Returns (text, shape) or (None, None)."""
+    if isinstance(obj, str):
+        return obj.strip(), 'string'
+
+    if isinstance(obj, list):
+        # Responses API output list (what chat_with_gpt5 stringifies)
+        text = _messages_text(obj)
+        if text:
+            return text, 'responses_output'
+        if obj:
+            return _extract(obj[0])
+        return None, None
+
+    if not isinstance(obj, dict):
+        return None, None
+
+    # Responses API body: {'output': [...]}
+    output = obj.get('output')
+    if isinstance(output, list):
+        text = _messages_text(output)
+        if text:
+            return text, 'responses'
+
+    # Responses API convenience field
+    if isinstance(obj.get('output_text'), str) and obj['output_text'].strip():
+        return obj['output_text'].strip(), 'responses'
+
+    text = obj.get('text')
+    if isinstance(text, str):
+        return text.strip(), 'text'
+
+    content = obj.get('content')
+    if isinstance(content, list):
+        text = _join_text_parts(content)
+        if text:
+            return text, 'content'
+    elif isinstance(content, str):
+        return content.strip(), 'content'
+
+    if isinstance(obj.get('message'), dict):
+        text, _ = _extract(obj['message'])
+        return text, 'chat_completions'
+
+    choices = obj.get('choices')
+    if isinstance(choices, list) and choices:
+        text, _ = _extract(choices[0])
+        return text, 'chat_completions'
+
+    return None, None
+
+
+def extract_text(raw_response):
+    """
+    Extract the answer text from a raw model response.
+    Returns (text, shape) where shape names the format that matched, for telemetry:
+    'plain', 'responses', 'responses_output', 'chat_completions', 'content', 'text',
+    'string', 'json' (parsed, no text found) or 'unparsed'.
+    """
+    stripped = raw_response.strip()
+
+    # If it's already clean text (no JSON structure), return as-is
+    if not stripped or stripped[0] not in '{[':
+        return stripped, 'plain'
+
+    # Parse as JSON, then as a Python literal (handles single-quoted reprs)
+    try:
+        data = _json_loads(stripped)
+    except _JSON_ERRORS:
+        data = None
+        if len(stripped) <= LITERAL_EVAL_MAX_CHARS:
+            try:
+                data = ast.literal_eval(stripped)
+            except (ValueError, SyntaxError, MemoryError, RecursionError):
+                pass
+
+    if data is None:
+        # Return original if we can't parse it
+        return stripped, 'unparsed'
+
+    text, shape = _extract(data)
+    if text:
+        return text, shape
+
+    # If no text found, return formatted JSON (better than raw)
+    return json.dumps(data, indent=2), 'json'
+
+
+@tool
+def clean_json_response(raw_response: object) -> str:
+    """
+    Cleans up raw JSON responses to extract just the text content.
+    Handles various GPT-5 response formats.
+    Streamed (generator) responses are cleaned incrementally via clean_stream.
+    """
+    if not isinstance(raw_response, str):
+        return clean_stream(raw_response)
+
+    with METRICS.stage("clean"):
+        text, shape = extract_text(raw_response)
+    METRICS.inc("clean_shape_total", shape=shape)
+    return text
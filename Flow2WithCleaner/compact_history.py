@@ -0,0 +1,123 @@
+from promptflow.core import tool
+from jinja2 import Template
+from context_builder import count_tokens, truncate_to_tokens
+from gpt5_chat import call_gpt5
+from history import normalize_history
+from metrics import METRICS
+from response_cache import MemoryCacheBackend, fingerprint
+import os
+import time
+
+# --- CONFIGURATION ---
+# Token budget for the history sent to the prompt (summary + recent turns)
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "1200"))
+# Most recent turns kept verbatim (fewer if they don't fit the budget)
+HISTORY_KEEP_TURNS = int(os.environ.get("HISTORY_KEEP_TURNS", "3"))
+HISTORY_SUMMARY_TOKENS = int(os.environ.get("HISTORY_SUMMARY_TOKENS", "300"))
+HISTORY_SUMMARY_TTL_SECONDS = float(os.environ.get("HISTORY_SUMMARY_TTL_SECONDS", "86400"))
+HISTORY_SUMMARY_MAX_CONVERSATIONS = int(os.environ.get("HISTORY_SUMMARY_MAX_CONVERSATIONS", "5000"))
+SUMMARY_TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "summarize_history.jinja2")
+
+SUMMARY_LABEL = "(Summary of the earlier conversation)"
+# Turn fingerprints remembered per conversation, to know what the summary already covers
+MAX_FOLDED_TURNS = 200
+
+with open(SUMMARY_TEMPLATE_PATH, encoding="utf-8") as f:
+    _SUMMARY_TEMPLATE = Template(f.read())
+
+# conversation -> {"summary", "folded"}; LRU-bounded and expiring
+_SUMMARIES = MemoryCacheBackend(max_entries=HISTORY_SUMMARY_MAX_CONVERSATIONS)
+
+
+def _turn_tokens(turn):
+    return count_tokens(turn["inputs"]["chat_input"]) + count_tokens(turn["outputs"]["output"])
+
+
+def _turn_key(turn):
+    return fingerprint(turn["inputs"]["chat_input"] + "\n" + turn["outputs"]["output"])
+
+
+def _fallback_summary(summary, turns):
+    """Extractive summary used when the model call fails: previous summary plus the new questions."""
+    lines = [summary] if summary else []
+    lines += [f"User asked: {turn['inputs']['chat_input']}" for turn in turns]
+    return " ".join(lines)
+
+
+def summarize_turns(summary, turns):
+    """Fold new turns into the running summary with one model call."""
+    prompt = _SUMMARY_TEMPLATE.render(summary=summary, turns=turns,
+                                      max_words=int(HISTORY_SUMMARY_TOKENS * 0.75))
+    with METRICS.stage("history_summary"):
+        result = call_gpt5(prompt, "Update the summary.")
+    if result.error or not result.text.strip():
+        METRICS.inc("errors_total", stage="history_summary")
+        return _fallback_summary(summary, turns)
+    return result.text.strip()
+
+
+def _fit_recent(turns, budget, keep_turns):
+    """The newest turns (at most keep_turns) that fit in budget; the newest is trimmed if needed."""
+    recent = []
+    for turn in reversed(turns[-keep_turns:] if keep_turns > 0 else []):
+        cost = _turn_tokens(turn)
+        if cost <= budget:
+            recent.insert(0, turn)
+            budget -= cost
+            continue
+        if not recent:
+            question_tokens = count_tokens(turn["inputs"]["chat_input"])
+            answer = truncate_to_tokens(turn["outputs"]["output"], max(0, budget - question_tokens))
+            recent.insert(0, {"inputs": turn["inputs"], "outputs": {"output": answer}})
+        break
+    return recent
+
+
+def compact_history(chat_history, conversation_id="", token_budget=HISTORY_TOKEN_BUDGET,
+                    keep_turns=HISTORY_KEEP_TURNS):
+    """
+    Bound chat history to token_budget: the most recent turns verbatim, preceded by a rolling
+    summary of everything older. The summary is cached per conversation and only updated
+    (one model call) when turns it doesn't cover yet have scrolled out of the recent window,
+    so sliding history windows from the bot are fine. Short new conversations pass through unchanged.
+    Returns turns in the flow's {inputs, outputs} shape, whatever shape came in.
+    """
+    turns = normalize_history(chat_history)
+    if not turns:
+        return turns
+
+    key = conversation_id or _turn_key(turns[0])
+    state = _SUMMARIES.get("history", key)
+    # Once a conversation has a summary keep using it, even if the bot's window now fits
+    if state is None and sum(_turn_tokens(turn) for turn in turns) <= token_budget:
+        return turns
+    state = state or {"summary": "", "folded": []}
+
+    recent = _fit_recent(turns, token_budget - HISTORY_SUMMARY_TOKENS, keep_turns)
+    older = turns[:len(turns) - len(recent)]
+    folded = set(state["folded"])
+    new_turns = [turn for turn in older if _turn_key(turn) not in folded]
+
+    if new_turns:
+        METRICS.inc("history_summaries_total", result="updated")
+        state = {
+            "summary": summarize_turns(state["summary"], new_turns),
+            "folded": (state["folded"] + [_turn_key(turn) for turn in new_turns])[-MAX_FOLDED_TURNS:],
+        }
+        _SUMMARIES.set("history", key, state, time.time() + HISTORY_SUMMARY_TTL_SECONDS)
+    else:
+        METRICS.inc("history_summaries_total", result="reused")
+
+    summary = truncate_to_tokens(state["summary"], HISTORY_SUMMARY_TOKENS)
+    return [{"inputs": {"chat_input": SUMMARY_LABEL}, "outputs": {"output": summary}}] + recent
+
+
+@tool
+def compact_chat_history(chat_history: list = None, conversation_id: str = "",
+                         token_budget: int = HISTORY_TOKEN_BUDGET) -> list:
+    """
+    Keep prompt history within token_budget: a rolling summary of older turns plus the
+    last HISTORY_KEEP_TURNS turns verbatim. Accepts flow ({inputs, outputs}) and
+    bot ({role, content}) history items.
+    """
+    return compact_history(chat_history, conversation_id or "", token_budget)
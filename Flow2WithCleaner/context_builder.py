@@ -0,0 +1,145 @@
+import os
+import re
+
+from response_cache import normalize_question, token_set_similarity
+from store_index import STORE_FIELDS
+from warmup import warm_up_on_load
+
+# --- CONFIGURATION ---
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))
+# Document chunks at least this similar (token-set Jaccard) to an already packed
+# document chunk are dropped. Store records are only deduplicated by id/exact content.
+DEDUP_SIMILARITY = float(os.environ.get("CONTEXT_DEDUP_SIMILARITY", "0.9"))
+# Don't bother truncating a chunk into less room than this
+MIN_TRUNCATED_TOKENS = int(os.environ.get("CONTEXT_MIN_TRUNCATED_TOKENS", "64"))
+CHUNK_SEPARATOR = "\n\n"
+
+_WHITESPACE = re.compile(r"\s+")
+# A store record already formatted by format_store_for_llm
+_FORMATTED_STORE = re.compile(r"^Store: .*\(ID: [^)]*\)")
+# Fields that identify a search document (one chunk, not its parent), in order of preference
+_ID_FIELDS = ("id", "chunk_id", STORE_FIELDS["storeId"])
+
+# Optional local tokenizer: tiktoken's o200k_base matches GPT-5. Loaded on first use
+# (it may download its vocabulary); without it we fall back to ~4 characters per token.
+_ENCODING = None
+_ENCODING_LOADED = False
+
+
+def get_encoding():
+    """The tiktoken encoding, or None when tiktoken (or its vocabulary) is unavailable."""
+    global _ENCODING, _ENCODING_LOADED
+    if not _ENCODING_LOADED:
+        try:
+            import tiktoken
+            _ENCODING = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _ENCODING = None
+        _ENCODING_LOADED = True
+    return _ENCODING
+
+
+def count_tokens(text):
+    """Number of tokens in text (exact with tiktoken, estimated otherwise)"""
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text down to at most max_tokens tokens"""
+    encoding = get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def document_id(doc):
+    """The id of a search document or hit, as a string (None if it has none)."""
+    return next((str(doc[f]) for f in _ID_FIELDS if doc.get(f) not in (None, "")), None)
+
+
+def _as_chunk(item, position):
+    """Normalize a search hit (dict or string) to {"content", "score", "position", "doc_id", "is_store"}"""
+    if isinstance(item, dict):
+        content = item.get("content") or item.get("chunk") or item.get("text") or ""
+        score = item.get("score") or item.get("@search.score") or 0.0
+        doc_id = document_id(item)
+        is_store = bool(item.get(STORE_FIELDS["storeId"]) or (item.get("City") and item.get("Address")))
+    else:
+        content, score, doc_id = str(item), 0.0, None
+        is_store = False
+    content = str(content).strip()
+    return {"content": content, "score": float(score), "position": position, "doc_id": doc_id,
+            "is_store": is_store or bool(_FORMATTED_STORE.match(content))}
+
+
+def build_context(search_results, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Pack search hits into a context string of at most token_budget tokens.
+    Hits are ranked by search score, repeats of a document id or of identical
+    content are dropped (plus near-duplicate document chunks, never store
+    records) and the last hit that fits is truncated. Returns the context plus what was kept/dropped.
+    """
+    chunks = [_as_chunk(item, i) for i, item in enumerate(search_results)]
+    chunks.sort(key=lambda c: (-c["score"], c["position"]))
+
+    separator_tokens = count_tokens(CHUNK_SEPARATOR)
+    packed, kept_signatures = [], []
+    seen_ids, seen_contents = set(), set()
+    included, dropped = [], []
+    used_tokens = 0
+
+    for chunk in chunks:
+        content = chunk["content"]
+        if not content:
+            dropped.append({"position": chunk["position"], "reason": "empty"})
+            continue
+
+        exact = _WHITESPACE.sub(" ", content).lower()
+        if chunk["doc_id"] in seen_ids or exact in seen_contents:
+            dropped.append({"position": chunk["position"], "reason": "duplicate"})
+            continue
+
+        # Store records differ in a name, id or hours line only; never treat them as near-duplicates
+        signature = None if chunk["is_store"] else normalize_question(exact)
+        if signature and any(token_set_similarity(signature, seen) >= DEDUP_SIMILARITY for seen in kept_signatures):
+            dropped.append({"position": chunk["position"], "reason": "duplicate"})
+            continue
+
+        tokens = count_tokens(content)
+        cost = tokens + (separator_tokens if packed else 0)
+        remaining = token_budget - used_tokens - (separator_tokens if packed else 0)
+
+        if cost <= token_budget - used_tokens:
+            packed.append(content)
+            used_tokens += cost
+            included.append({"position": chunk["position"], "score": chunk["score"], "tokens": tokens, "truncated": False})
+        elif remaining >= MIN_TRUNCATED_TOKENS:
+            content = truncate_to_tokens(content, remaining)
+            tokens = count_tokens(content)
+            packed.append(content)
+            used_tokens += tokens + (separator_tokens if len(packed) > 1 else 0)
+            included.append({"position": chunk["position"], "score": chunk["score"], "tokens": tokens, "truncated": True})
+        else:
+            dropped.append({"position": chunk["position"], "reason": "budget", "tokens": tokens})
+            continue
+
+        seen_contents.add(exact)
+        if chunk["doc_id"] is not None:
+            seen_ids.add(chunk["doc_id"])
+        if signature:
+            kept_signatures.append(signature)
+
+    return {
+        "context": CHUNK_SEPARATOR.join(packed),
+        "used_tokens": used_tokens,
+        "token_budget": token_budget,
+        "included": included,
+        "dropped": dropped,
+    }
+
+
+warm_up_on_load("tokenizer", get_encoding)
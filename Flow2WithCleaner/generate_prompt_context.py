@@ -1,20 +1,26 @@
 from promptflow.core import tool
+from context_builder import CONTEXT_TOKEN_BUDGET, build_context
+from metrics import METRICS
 
 @tool
-def generate_prompt_context(search_result: object) -> str:
+def generate_prompt_context(search_result: object, token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
     """
-    Simple pass-through. 
+    Packs search hits into the prompt context.
     If the search result is already text (from local lookup), return it.
+    Lists of hits are ranked by score, deduplicated and trimmed to token_budget.
     """
-    
+
     # Case 1: Input is already a clean string (Our Local Tool)
     if isinstance(search_result, str):
         return search_result
 
-    # Case 2: Input is a list (Legacy/Azure Search) - simple join
+    # Case 2: Input is a list (Azure Search hits) - rank, dedupe and pack to budget
     if isinstance(search_result, list):
-        # Join items with newlines, converting dicts to strings if needed
-        return "\n\n".join([str(item) for item in search_result])
+        with METRICS.stage("context"):
+            built = build_context(search_result, token_budget)
+        METRICS.inc("context_tokens_total", built["used_tokens"])
+        METRICS.inc("context_chunks_dropped_total", len(built["dropped"]))
+        return built["context"]
 
     # Fallback
     return str(search_result)
\ No newline at end of file
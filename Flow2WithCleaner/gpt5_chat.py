@@ -1,83 +1,322 @@
-from promptflow.core import tool
-import requests
-import json
-import os
-
-# --- CONFIGURATION ---
-# Get Secrets from Environment Variables (set by Azure or locally)
-API_KEY = os.environ.get("AZURE_OPENAI_API_KEY")
-API_BASE = os.environ.get("AZURE_OPENAI_ENDPOINT")
-
-# 2. Hardcoded Settings (Safe to keep here)
-DEPLOYMENT_NAME = "gpt-5-mini"
-API_VERSION = "2025-04-01-preview"
-
-@tool
-def chat_with_gpt5(system_prompt: str, user_input: str):
-    """
-    Manually calls the new GPT-5 'Responses' API using Environment Variables.
-    Requires AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT to be set.
-    """
-    
-    # Validation: Check if keys are missing
-    if not API_KEY or not API_BASE:
-        return "Error: Missing Environment Variables. Please set AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT in your .env file or environment."
-
-    # Clean up the URL (Remove trailing slash if present)
-    base_url = API_BASE.rstrip("/")
-    
-    # Construct the specific URL
-    url = f"{base_url}/openai/responses?api-version={API_VERSION}"
-    
-    headers = {
-        "Content-Type": "application/json",
-        "api-key": API_KEY
-    }
-    
-    # Build Payload (Using 'input' parameter)
-    payload = {
-        "model": DEPLOYMENT_NAME,
-        "input": [ 
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_input}
-        ]
-    }
-    
-    # Send Request
-    try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status() 
-        
-        # Parse Answer
-        data = response.json()
-        
-        # Format 1: Content List (Preview)
-        if 'content' in data and isinstance(data['content'], list):
-            for item in data['content']:
-                if 'text' in item:
-                    return str(item['text']).strip()
-        
-        # Format 2: Standard Chat
-        if 'choices' in data and len(data['choices']) > 0:
-            choice = data['choices'][0]
-            if 'message' in choice and 'content' in choice['message']:
-                return str(choice['message']['content']).strip()
-            elif 'text' in choice:
-                return str(choice['text']).strip()
-            
-        # Format 3: Output String
-        if 'output' in data:
-            return str(data['output']).strip()
-            
-        # Format 4: Direct result
-        if 'result' in data:
-            return str(data['result']).strip()
-        
-        # Last resort
-        return str(data).strip()
-        
-    except Exception as e:
-        error_msg = f"Error calling GPT-5: {e}"
-        if 'response' in locals():
-            error_msg += f"\nResponse: {response.text}"
-        return error_msg
\ No newline at end of file
+from promptflow.core import tool
+from requests.adapters import HTTPAdapter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import requests
+import threading
+import time
+import json
+import os
+
+from llm_router import LLMRouter
+from metrics import METRICS
+from warmup import warm_up_on_load
+
+# --- CONFIGURATION ---
+# Get Secrets from Environment Variables (set by Azure or locally)
+API_KEY = os.environ.get("AZURE_OPENAI_API_KEY")
+API_BASE = os.environ.get("AZURE_OPENAI_ENDPOINT")
+
+# 2. Hardcoded Settings (Safe to keep here)
+# Default deployment; set LLM_BACKENDS to spread load over several (see llm_router.py)
+DEPLOYMENT_NAME = "gpt-5-mini"
+API_VERSION = "2025-04-01-preview"
+
+# 3. Connection Pool / Retry Settings (override via environment)
+POOL_SIZE = int(os.environ.get("AZURE_OPENAI_POOL_SIZE", "20"))
+CONNECT_TIMEOUT = float(os.environ.get("AZURE_OPENAI_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("AZURE_OPENAI_READ_TIMEOUT", "60"))
+MAX_RETRIES = int(os.environ.get("AZURE_OPENAI_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.environ.get("AZURE_OPENAI_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.environ.get("AZURE_OPENAI_BACKOFF_MAX", "20"))
+
+MISSING_ENV_ERROR = "Error: Missing Environment Variables. Please set AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT in your .env file or environment."
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+# Backends from LLM_BACKENDS, or just AZURE_OPENAI_ENDPOINT / DEPLOYMENT_NAME
+ROUTER = LLMRouter.from_env(API_BASE, DEPLOYMENT_NAME, API_KEY, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX)
+
+
+def get_session():
+    """Return the process-wide pooled requests.Session (created on first use)."""
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _SESSION = session
+    return _SESSION
+
+
+def warm_up():
+    """Open a pooled connection to every LLM backend (DNS + TLS); any HTTP status will do."""
+    session = get_session()
+    for backend in ROUTER.backends:
+        session.head(backend.endpoint, timeout=(CONNECT_TIMEOUT, CONNECT_TIMEOUT)).close()
+
+
+def _build_request(system_prompt, user_input, backend=None):
+    """Build the Responses API url, headers and payload (for a router backend, or the default deployment)."""
+    # Clean up the URL (Remove trailing slash if present)
+    base_url = (backend.endpoint if backend else API_BASE).rstrip("/")
+
+    # Construct the specific URL
+    url = f"{base_url}/openai/responses?api-version={API_VERSION}"
+
+    headers = {
+        "Content-Type": "application/json",
+        "api-key": backend.api_key if backend else API_KEY
+    }
+
+    # Build Payload (Using 'input' parameter)
+    payload = {
+        "model": backend.deployment if backend else DEPLOYMENT_NAME,
+        "input": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_input}
+        ]
+    }
+    return url, headers, payload
+
+
+class StreamError(str):
+    """
+    Error chunk from stream_gpt5. It is still a str (the "Error calling GPT-5: ..." text, so
+    consumers that only join deltas keep working), but callers can tell it from answer text.
+    """
+
+
+@dataclass
+class ChatResult:
+    """Answer text plus the metadata of one Responses API call."""
+    text: str
+    response_id: str = None
+    model: str = None
+    usage: dict = field(default_factory=dict)
+    latency_ms: float = 0.0
+    error: bool = False
+
+
+def _parse_answer(data):
+    """Pull the answer text out of a parsed response body."""
+    # Format 0: Responses API (output_text convenience field, or message output items)
+    if isinstance(data.get('output_text'), str) and data['output_text'].strip():
+        return data['output_text'].strip()
+    if isinstance(data.get('output'), list):
+        parts = [
+            content['text']
+            for item in data['output']
+            if isinstance(item, dict) and item.get('type') == 'message'
+            for content in item.get('content') or []
+            if isinstance(content, dict) and content.get('type') == 'output_text' and isinstance(content.get('text'), str)
+        ]
+        if parts:
+            return '\n'.join(parts).strip()
+
+    # Format 1: Content List (Preview)
+    if 'content' in data and isinstance(data['content'], list):
+        for item in data['content']:
+            if 'text' in item:
+                return str(item['text']).strip()
+
+    # Format 2: Standard Chat
+    if 'choices' in data and len(data['choices']) > 0:
+        choice = data['choices'][0]
+        if 'message' in choice and 'content' in choice['message']:
+            return str(choice['message']['content']).strip()
+        elif 'text' in choice:
+            return str(choice['text']).strip()
+
+    # Format 3: Output String
+    if 'output' in data:
+        return str(data['output']).strip()
+
+    # Format 4: Direct result
+    if 'result' in data:
+        return str(data['result']).strip()
+
+    # Last resort
+    return str(data).strip()
+
+
+def _to_result(data, started):
+    """Build a ChatResult from a parsed response body and the request start time."""
+    usage = data.get('usage') or {}
+    return ChatResult(
+        text=_parse_answer(data),
+        response_id=data.get('id'),
+        model=data.get('model'),
+        usage={
+            "input_tokens": usage.get("input_tokens", usage.get("prompt_tokens", 0)),
+            "output_tokens": usage.get("output_tokens", usage.get("completion_tokens", 0)),
+            "total_tokens": usage.get("total_tokens", 0),
+        },
+        latency_ms=(time.perf_counter() - started) * 1000,
+    )
+
+
+def _post_with_failover(system_prompt, user_input, stream=False):
+    """
+    POST to a backend picked by ROUTER. 408/429/5xx and connection errors put that backend
+    in a cooldown and the retry fails over to another one; with a single backend (or all
+    cooling down) we wait out the shortest cooldown (Retry-After or jittered backoff), or
+    fail fast if that is longer than BACKOFF_MAX. Returns (response, RoutedCall); the
+    caller settles the call's usage and releases it when done.
+    """
+    session = get_session()
+    call = ROUTER.call(system_prompt, user_input, MAX_RETRIES, BACKOFF_MAX)
+    try:
+        while True:
+            wait = call.pick()
+            if wait > 0:
+                time.sleep(wait)
+            url, headers, payload = _build_request(system_prompt, user_input, call.backend)
+            if stream:
+                payload["stream"] = True
+                headers["Accept"] = "text/event-stream"
+
+            call.start()
+            try:
+                response = session.post(url, headers=headers, json=payload, stream=stream,
+                                        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            except (requests.ConnectionError, requests.Timeout):
+                if call.finish():
+                    continue
+                raise
+
+            if call.finish(response.status_code, response.headers):
+                response.close()
+                continue
+            return response, call
+    except BaseException:
+        call.release()
+        raise
+
+
+def iter_sse_events(lines):
+    """Yield the JSON payload of each server-sent event from an iterable of text lines."""
+    data_lines = []
+    for line in lines:
+        if line is None:
+            continue
+        if line == "":
+            if data_lines:
+                data = "\n".join(data_lines)
+                data_lines = []
+                if data.strip() == "[DONE]":
+                    return
+                yield json.loads(data)
+            continue
+        if line.startswith("data:"):
+            data_lines.append(line[5:].lstrip())
+    if data_lines and "\n".join(data_lines).strip() != "[DONE]":
+        yield json.loads("\n".join(data_lines))
+
+
+@contextmanager
+def _released(routed):
+    try:
+        yield routed
+    finally:
+        routed.release()
+
+
+def stream_gpt5(system_prompt, user_input):
+    """
+    Generator over answer text deltas from the Responses API ("stream": true).
+    Errors, including a stream that ends before "response.completed", are yielded as
+    a final StreamError chunk ("Error calling GPT-5: ..."), possibly after some text.
+    """
+    if not ROUTER.backends:
+        yield StreamError(MISSING_ENV_ERROR)
+        return
+
+    try:
+        response, routed = _post_with_failover(system_prompt, user_input, stream=True)
+    except Exception as e:
+        yield StreamError(f"Error calling GPT-5: {e}")
+        return
+
+    # finally: also runs when the consumer stops reading early (GeneratorExit)
+    with response, _released(routed):
+        if response.status_code >= 400:
+            yield StreamError(f"Error calling GPT-5: HTTP {response.status_code}\nResponse: {response.text}")
+            return
+        try:
+            for event in iter_sse_events(response.iter_lines(decode_unicode=True)):
+                event_type = event.get("type")
+                if event_type == "response.output_text.delta":
+                    yield event.get("delta", "")
+                elif event_type == "response.completed":
+                    routed.settle((event.get("response") or {}).get("usage") or {})
+                    return
+                elif event_type in ("response.failed", "error"):
+                    error = event.get("error") or event.get("response", {}).get("error")
+                    yield StreamError(f"Error calling GPT-5: {error}")
+                    return
+        except Exception as e:
+            yield StreamError(f"Error calling GPT-5: {e}")
+            return
+        yield StreamError("Error calling GPT-5: stream ended before the response completed")
+
+
+def call_gpt5(system_prompt, user_input):
+    """
+    Call the Responses API and return a ChatResult (text, usage tokens, response id, latency).
+    Failures come back as a ChatResult with error=True and the error message as text.
+    """
+    started = time.perf_counter()
+
+    # Validation: Check if keys are missing
+    if not ROUTER.backends:
+        return ChatResult(text=MISSING_ENV_ERROR, error=True)
+
+    # Send Request
+    routed = None
+    try:
+        with METRICS.stage("llm"):
+            response, routed = _post_with_failover(system_prompt, user_input)
+            response.raise_for_status()
+
+            # Parse Answer
+            result = _to_result(response.json(), started)
+
+        routed.settle(result.usage)
+        for kind in ("input", "output"):
+            METRICS.inc("tokens_total", result.usage.get(f"{kind}_tokens", 0), kind=kind,
+                        deployment=routed.backend.deployment)
+        return result
+
+    except Exception as e:
+        METRICS.inc("errors_total", stage="llm")
+        error_msg = f"Error calling GPT-5: {e}"
+        if 'response' in locals():
+            error_msg += f"\nResponse: {response.text}"
+        return ChatResult(text=error_msg, error=True, latency_ms=(time.perf_counter() - started) * 1000)
+    finally:
+        if routed is not None:
+            routed.release()
+
+
+@tool
+def chat_with_gpt5(system_prompt: str, user_input: str, stream: bool = False):
+    """
+    Manually calls the new GPT-5 'Responses' API using Environment Variables.
+    Requires AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT to be set.
+    Reuses a pooled keep-alive session and retries 408/429/5xx with backoff.
+    Returns the answer text (see call_gpt5 for usage/latency details).
+    With stream=True returns a generator of text deltas (see stream_gpt5).
+    """
+
+    if stream:
+        return stream_gpt5(system_prompt, user_input)
+
+    return call_gpt5(system_prompt, user_input).text
+
+
+warm_up_on_load("llm", warm_up)
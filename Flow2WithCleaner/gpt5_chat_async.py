@@ -0,0 +1,106 @@
+from promptflow.core import tool
+from gpt5_chat import (
+    BACKOFF_MAX,
+    CONNECT_TIMEOUT,
+    MAX_RETRIES,
+    MISSING_ENV_ERROR,
+    POOL_SIZE,
+    READ_TIMEOUT,
+    ROUTER,
+    _build_request,
+    _to_result,
+)
+import aiohttp
+import asyncio
+import json
+import time
+
+from metrics import METRICS
+
+# One aiohttp pool per event loop (sessions cannot be shared across loops): loop -> (session, closer).
+# A loop's session is closed when the loop shuts down (asyncio.run finalizes async generators
+# first); entries of loops closed some other way are dropped on the next call.
+_ASYNC_SESSIONS = {}
+
+
+async def _close_on_shutdown(loop, session):
+    """Parked async generator; the loop's shutdown_asyncgens() closes it, which closes the session."""
+    try:
+        yield
+    finally:
+        if _ASYNC_SESSIONS.get(loop, (session,))[0] is session:
+            _ASYNC_SESSIONS.pop(loop, None)
+        await session.close()
+
+
+async def get_async_session():
+    """Return a pooled aiohttp.ClientSession bound to the running event loop."""
+    for closed in [loop for loop in list(_ASYNC_SESSIONS) if loop.is_closed()]:
+        _ASYNC_SESSIONS.pop(closed, None)
+    loop = asyncio.get_running_loop()
+    session, _ = _ASYNC_SESSIONS.get(loop, (None, None))
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=POOL_SIZE, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+        )
+        closer = _close_on_shutdown(loop, session)
+        # Run it up to its yield (no awaits before it) so the loop tracks it for shutdown
+        await closer.asend(None)
+        _ASYNC_SESSIONS[loop] = (session, closer)
+    return session
+
+
+@tool
+async def chat_with_gpt5_async(system_prompt: str, user_input: str):
+    """
+    Async variant of chat_with_gpt5 for concurrent flow executions.
+    Shares one aiohttp connection pool per event loop.
+    """
+
+    if not ROUTER.backends:
+        return MISSING_ENV_ERROR
+
+    started = time.perf_counter()
+    session = await get_async_session()
+    # Same failover as gpt5_chat._post_with_failover: failed backends cool down, retries go elsewhere
+    call = ROUTER.call(system_prompt, user_input, MAX_RETRIES, BACKOFF_MAX)
+
+    body = ""
+    try:
+        while True:
+            wait = call.pick()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            url, headers, payload = _build_request(system_prompt, user_input, call.backend)
+            call.start()
+            try:
+                async with session.post(url, headers=headers, json=payload) as response:
+                    status, body = response.status, await response.text()
+                    retry = call.finish(status, response.headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if call.finish():
+                    continue
+                raise
+            if not retry:
+                break
+
+        if status >= 400:
+            raise RuntimeError(f"HTTP {status} from {url}")
+
+        result = _to_result(json.loads(body), started)
+        call.settle(result.usage)
+        METRICS.observe("stage_seconds", result.latency_ms / 1000, stage="llm")
+        for kind in ("input", "output"):
+            METRICS.inc("tokens_total", result.usage.get(f"{kind}_tokens", 0), kind=kind,
+                        deployment=call.backend.deployment)
+        return result.text
+
+    except Exception as e:
+        METRICS.inc("errors_total", stage="llm")
+        error_msg = f"Error calling GPT-5: {e}"
+        if body:
+            error_msg += f"\nResponse: {body}"
+        return error_msg
+    finally:
+        call.release()
@@ -0,0 +1,16 @@
+def normalize_history(chat_history):
+    """Accept both flow ({inputs, outputs}) and bot ({role, content}) history items; return flow-shaped turns."""
+    turns = []
+    pending_user = None
+    for item in chat_history or []:
+        if "inputs" in item:
+            outputs = item.get("outputs") or {}
+            answer = outputs.get("chat_output") or outputs.get("output") or ""
+            turns.append({"inputs": {"chat_input": item["inputs"].get("chat_input", "")},
+                          "outputs": {"output": answer}})
+        elif item.get("role") == "user":
+            pending_user = item.get("content", "")
+        elif item.get("role") == "assistant" and pending_user is not None:
+            turns.append({"inputs": {"chat_input": pending_user}, "outputs": {"output": item.get("content", "")}})
+            pending_user = None
+    return turns
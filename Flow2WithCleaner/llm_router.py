@@ -0,0 +1,325 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from metrics import METRICS
+
+# --- CONFIGURATION ---
+# JSON list of Azure OpenAI backends. Empty = the single AZURE_OPENAI_ENDPOINT deployment.
+# [{"endpoint": "https://eastus.openai.azure.com", "deployment": "gpt-5-mini", "api_key_env": "EASTUS_KEY",
+#   "weight": 2, "tpm": 200000, "rpm": 1200, "tier": "small"}, ...]
+LLM_BACKENDS = os.environ.get("LLM_BACKENDS", "")
+# Send short, simple questions to "small"-tier backends and the rest to "large"-tier ones
+LLM_ROUTE_BY_COMPLEXITY = os.environ.get("LLM_ROUTE_BY_COMPLEXITY", "false").lower() == "true"
+LLM_SIMPLE_MAX_TOKENS = int(os.environ.get("LLM_SIMPLE_MAX_TOKENS", "40"))
+# Output tokens reserved per call until the real usage is known
+LLM_OUTPUT_TOKEN_ESTIMATE = int(os.environ.get("LLM_OUTPUT_TOKEN_ESTIMATE", "800"))
+# How long x-ratelimit-remaining-* headers are trusted when no reset time is given
+QUOTA_HEADER_TTL_SECONDS = 10.0
+QUOTA_WINDOW_SECONDS = 60.0
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+_COMPLEX_HINTS = re.compile(
+    r"\b(why|how come|compare|comparison|difference|differences|explain|analy[sz]e|step[- ]by[- ]step|"
+    r"summari[sz]e|plan|pros and cons|versus|vs)\b", re.IGNORECASE)
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_duration(value):
+    """
+    Seconds from a rate-limit reset or Retry-After header ("1s", "6m0s", "250ms",
+    a plain number or an HTTP date), or None.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+class Backend:
+    """One Azure OpenAI deployment plus what we know about its remaining quota."""
+
+    def __init__(self, endpoint, deployment, api_key, weight=1.0, tpm=0, rpm=0, tier=""):
+        self.endpoint = endpoint.rstrip("/")
+        self.deployment = deployment
+        self.api_key = api_key
+        self.weight = float(weight)
+        self.tpm = int(tpm)
+        self.rpm = int(rpm)
+        self.tier = tier
+        self.name = f"{urlparse(self.endpoint).netloc or self.endpoint}/{deployment}"
+
+        self.in_flight = 0
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.remaining_tokens = None
+        self.remaining_requests = None
+        self.quota_valid_until = 0.0
+        self._window = deque()  # [timestamp, tokens] reservations from the last minute
+        self._window_tokens = 0
+
+    def _expire(self, now):
+        while self._window and now - self._window[0][0] >= QUOTA_WINDOW_SECONDS:
+            self._window_tokens -= self._window.popleft()[1]
+
+    def headroom(self, now, tokens):
+        """0 when the backend can't take `tokens` right now, else the fraction of quota left (0-1]."""
+        if now < self.cooldown_until:
+            return 0.0
+        self._expire(now)
+        fractions = []
+        if self.tpm:
+            left = self.tpm - self._window_tokens
+            if left < tokens and self._window:
+                return 0.0
+            fractions.append(max(left, 0) / self.tpm)
+        if self.rpm:
+            if len(self._window) >= self.rpm:
+                return 0.0
+            fractions.append(1 - len(self._window) / self.rpm)
+        if now < self.quota_valid_until:
+            if self.remaining_tokens is not None and self.remaining_tokens < tokens:
+                return 0.0
+            if self.remaining_requests is not None and self.remaining_requests < 1:
+                return 0.0
+            if self.remaining_tokens is not None and self.tpm:
+                fractions.append(min(1.0, self.remaining_tokens / self.tpm))
+        return max(min(fractions, default=1.0), 0.01)
+
+    def wait_seconds(self, now, tokens):
+        """How long until this backend could take `tokens` (0 if it can now)."""
+        cooldown = self.cooldown_until - now
+        if cooldown > 0:
+            return cooldown
+        if self.headroom(now, tokens) > 0:
+            return 0.0
+        frees_up = []
+        if self._window:
+            frees_up.append(self._window[0][0] + QUOTA_WINDOW_SECONDS - now)
+        if now < self.quota_valid_until:
+            frees_up.append(self.quota_valid_until - now)
+        return max(0.0, min(frees_up, default=0.0))
+
+    def stats(self, now):
+        self._expire(now)
+        return {
+            "backend": self.name,
+            "tier": self.tier,
+            "weight": self.weight,
+            "in_flight": self.in_flight,
+            "tokens_last_minute": self._window_tokens,
+            "remaining_tokens": self.remaining_tokens if now < self.quota_valid_until else None,
+            "cooldown_seconds": round(max(0.0, self.cooldown_until - now), 1),
+            "consecutive_failures": self.failures,
+        }
+
+
+class LLMRouter:
+    """
+    Weighted load balancing across backends with quota tracking and failover.
+    Each call: pick() a backend, start() it, then finish() with the HTTP status and headers
+    (429/5xx put the backend in a cooldown so the retry goes elsewhere) and settle() the
+    reservation with the real token usage once known.
+    """
+
+    def __init__(self, backends, backoff_base=0.5, backoff_max=20.0, rng=None):
+        self.backends = list(backends)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, default_endpoint, default_deployment, default_key, **kwargs):
+        """Backends from LLM_BACKENDS, or the single default deployment when it is unset."""
+        if LLM_BACKENDS:
+            backends = []
+            for spec in json.loads(LLM_BACKENDS):
+                api_key = os.environ.get(spec["api_key_env"]) if spec.get("api_key_env") else spec.get("api_key")
+                backends.append(Backend(spec["endpoint"], spec.get("deployment", default_deployment),
+                                        api_key or default_key, spec.get("weight", 1), spec.get("tpm", 0),
+                                        spec.get("rpm", 0), spec.get("tier", "")))
+        elif default_endpoint and default_key:
+            backends = [Backend(default_endpoint, default_deployment, default_key)]
+        else:
+            backends = []
+        return cls(backends, **kwargs)
+
+    def classify(self, user_input):
+        """Tier for a question: "small" if short and simple, else "large"; None when complexity routing is off."""
+        if not LLM_ROUTE_BY_COMPLEXITY:
+            return None
+        simple = len(user_input) <= LLM_SIMPLE_MAX_TOKENS * 4 and not _COMPLEX_HINTS.search(user_input)
+        return "small" if simple else "large"
+
+    @staticmethod
+    def estimate_tokens(system_prompt, user_input):
+        return (len(system_prompt) + len(user_input)) // 4 + LLM_OUTPUT_TOKEN_ESTIMATE
+
+    def pick(self, tokens, tier=None, exclude=()):
+        """
+        Return (backend, wait_seconds). Prefers backends of the requested tier that have quota
+        for `tokens`, chosen at random by weight x remaining quota. When none is available,
+        returns the one that frees up first and how long to wait for it.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude] or self.backends
+            if tier and any(b.tier == tier for b in candidates):
+                preferred = [b for b in candidates if b.tier == tier]
+                if any(b.headroom(now, tokens) > 0 for b in preferred):
+                    candidates = preferred
+
+            scored = [(b, b.weight * b.headroom(now, tokens)) for b in candidates]
+            scored = [(b, score) for b, score in scored if score > 0]
+            if scored:
+                point = self._rng.uniform(0, sum(score for _, score in scored))
+                for backend, score in scored:
+                    point -= score
+                    if point <= 0:
+                        return backend, 0.0
+                return scored[-1][0], 0.0
+
+            backend = min(self.backends, key=lambda b: b.wait_seconds(now, tokens))
+            return backend, backend.wait_seconds(now, tokens)
+
+    def start(self, backend, tokens):
+        """Reserve estimated tokens against the backend's minute window; returns the reservation."""
+        with self._lock:
+            backend.in_flight += 1
+            reservation = [time.monotonic(), tokens]
+            backend._window.append(reservation)
+            backend._window_tokens += tokens
+            return reservation
+
+    def finish(self, backend, status=None, headers=None):
+        """Record the outcome of a request (status None = connection error or timeout)."""
+        headers = headers or {}
+        now = time.monotonic()
+        with self._lock:
+            backend.in_flight -= 1
+
+            remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+            remaining_requests = headers.get("x-ratelimit-remaining-requests")
+            if remaining_tokens is not None or remaining_requests is not None:
+                reset = parse_duration(headers.get("x-ratelimit-reset-tokens"))
+                backend.remaining_tokens = int(float(remaining_tokens)) if remaining_tokens is not None else None
+                backend.remaining_requests = int(float(remaining_requests)) if remaining_requests is not None else None
+                backend.quota_valid_until = now + (reset if reset is not None else QUOTA_HEADER_TTL_SECONDS)
+
+            if status is not None and status < 400:
+                backend.failures = 0
+            elif status is None or status == 429 or status >= 500 or status == 408:
+                backend.failures += 1
+                retry_after = parse_duration(headers.get("retry-after-ms"))
+                retry_after = retry_after / 1000 if retry_after is not None else parse_duration(headers.get("Retry-After"))
+                if retry_after is None:
+                    retry_after = self._rng.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** backend.failures)))
+                # Honour the server's Retry-After in full (callers fail fast rather than sleep that
+                # long); only our own backoff is capped, at backoff_max
+                backend.cooldown_until = now + retry_after
+
+    def call(self, system_prompt, user_input, max_retries=3, max_wait=None):
+        """A RoutedCall for one question (tier and token estimate worked out here)."""
+        return RoutedCall(self, self.estimate_tokens(system_prompt, user_input), self.classify(user_input),
+                          max_retries, self.backoff_max if max_wait is None else max_wait)
+
+    def settle(self, backend, reservation, actual_tokens):
+        """Replace a reservation's estimate with the real token usage."""
+        with self._lock:
+            if any(entry is reservation for entry in backend._window):
+                backend._window_tokens += actual_tokens - reservation[1]
+            reservation[1] = actual_tokens
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return [backend.stats(now) for backend in self.backends]
+
+
+class RoutedCall:
+    """
+    The failover loop of one LLM call, shared by the sync and async clients. Per attempt:
+    pick() a backend (and sleep the returned seconds), start() it, send the request, then
+    finish() with the HTTP status (None for connection errors/timeouts), which says whether
+    to retry on another backend. settle() the real usage once known; release() in a finally
+    undoes whatever an error or exception left open (in-flight count, token reservation).
+    """
+
+    def __init__(self, router, estimate, tier=None, max_retries=3, max_wait=20.0):
+        self.router = router
+        self.estimate = estimate
+        self.tier = tier
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.attempt = -1
+        self.backend = None
+        self.reservation = None
+        self.status = None
+        self._in_flight = False
+        self._tried = set()
+
+    def pick(self):
+        """Choose the backend for the next attempt; returns how long to wait before sending."""
+        self.attempt += 1
+        self.backend, wait = self.router.pick(self.estimate, self.tier, exclude=self._tried)
+        if wait > self.max_wait:
+            # Every backend is out of quota for longer than we are willing to wait
+            METRICS.inc("llm_backend_requests_total", backend="all", status="throttled")
+            raise RuntimeError(f"all LLM backends are throttled, next one frees up in {wait:.1f}s")
+        return wait
+
+    def start(self):
+        self.reservation = self.router.start(self.backend, self.estimate)
+        self._in_flight = True
+
+    def finish(self, status=None, headers=None):
+        """Record the attempt's outcome; True when the caller should retry (on another backend)."""
+        self._in_flight = False
+        self.status = status
+        self.router.finish(self.backend, status, headers)
+        METRICS.inc("llm_backend_requests_total", backend=self.backend.name,
+                    status=status if status is not None else "error")
+        if status is not None and status < 400:
+            return False
+        # A failed attempt used no quota
+        self.router.settle(self.backend, self.reservation, 0)
+        self.reservation = None
+        retryable = status is None or status in RETRYABLE_STATUSES
+        if retryable:
+            self._tried.add(self.backend)
+        return retryable and self.attempt < self.max_retries
+
+    def settle(self, usage):
+        """Replace the reservation with the call's real token usage."""
+        if self.reservation is not None:
+            self.router.settle(self.backend, self.reservation, usage.get("total_tokens") or self.estimate)
+            self.reservation = None
+
+    def release(self):
+        """
+        Close out an attempt left open by an exception or an abandoned stream. A request that
+        never got a response is finished as an error and frees its reservation; one that got a
+        2xx but no usage keeps its estimate.
+        """
+        if self._in_flight:
+            self.finish(None)
+        self.reservation = None
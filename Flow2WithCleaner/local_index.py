@@ -0,0 +1,286 @@
+import heapq
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from collections import Counter
+
+# --- CONFIGURATION ---
+# Directory holding an index built by build_index() / scripts/build_local_index.py
+LOCAL_INDEX_DIR = os.environ.get("LOCAL_INDEX_DIR", "local_index")
+# Text files are split into chunks of about this many words
+LOCAL_INDEX_CHUNK_WORDS = int(os.environ.get("LOCAL_INDEX_CHUNK_WORDS", "300"))
+# Hybrid score = BM25 weight * (BM25 / best BM25) + vector weight * cosine similarity
+LOCAL_INDEX_BM25_WEIGHT = float(os.environ.get("LOCAL_INDEX_BM25_WEIGHT", "1.0"))
+LOCAL_INDEX_VECTOR_WEIGHT = float(os.environ.get("LOCAL_INDEX_VECTOR_WEIGHT", "0.5"))
+# Vector hits below this cosine similarity are ignored
+LOCAL_INDEX_MIN_SIMILARITY = float(os.environ.get("LOCAL_INDEX_MIN_SIMILARITY", "0.2"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TEXT_EXTENSIONS = (".txt", ".md")
+RECORD_EXTENSIONS = (".json", ".jsonl")
+
+# Optional dense vectors: without numpy the index is BM25 only.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# index_dir/CURRENT names the build in index_dir/builds/ that readers load
+POINTER_FILE = "CURRENT"
+BUILDS_DIR = "builds"
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+def _record_text(value):
+    """All string/number leaves of a store record, for indexing."""
+    if isinstance(value, dict):
+        return " ".join(_record_text(v) for k, v in value.items() if not str(k).startswith("@"))
+    if isinstance(value, list):
+        return " ".join(_record_text(v) for v in value)
+    if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        return str(value)
+    return ""
+
+
+def hashing_embedding(text, dims):
+    """
+    Signed feature-hashing embedding of words and character trigrams, L2-normalised.
+    Needs no model or network, and tolerates typos and partial words.
+    """
+    vector = np.zeros(dims, dtype=np.float32)
+    features = Counter()
+    for token in tokenize(text):
+        features[token] += 1
+        padded = f"#{token}#"
+        for i in range(len(padded) - 2):
+            features[padded[i:i + 3]] += 1
+    for feature, count in features.items():
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % dims] += (1.0 if h & 0x80000000 else -1.0) * (1.0 + math.log(count))
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+def load_documents(source_dir, chunk_words=LOCAL_INDEX_CHUNK_WORDS):
+    """
+    Read documents from source_dir (recursively) as search-style docs:
+    .json/.jsonl files hold records used as-is (e.g. store records with City/Address),
+    .txt/.md files are chunked into {"id", "Title", "chunk"} docs.
+    """
+    documents = []
+    for root, _, files in os.walk(source_dir):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, source_dir)
+            extension = os.path.splitext(name)[1].lower()
+            if extension in RECORD_EXTENSIONS:
+                with open(path, encoding="utf-8") as f:
+                    if extension == ".jsonl":
+                        records = [json.loads(line) for line in f if line.strip()]
+                    else:
+                        records = json.load(f)
+                for record in records if isinstance(records, list) else [records]:
+                    if isinstance(record, dict):
+                        documents.append(record)
+            elif extension in TEXT_EXTENSIONS:
+                with open(path, encoding="utf-8") as f:
+                    words = f.read().split()
+                for start in range(0, len(words), chunk_words):
+                    documents.append({"id": f"{relative}#{start // chunk_words}", "Title": relative,
+                                      "chunk": " ".join(words[start:start + chunk_words])})
+    return documents
+
+
+def _write_atomic(path, write):
+    tmp_path = path + ".tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def current_build_dir(index_dir):
+    """The directory of the build index_dir/CURRENT points to (index_dir itself for an unversioned index)."""
+    try:
+        with open(os.path.join(index_dir, POINTER_FILE), encoding="utf-8") as f:
+            return os.path.join(index_dir, BUILDS_DIR, f.read().strip())
+    except FileNotFoundError:
+        return index_dir
+
+
+def _remove_old_builds(index_dir, keep):
+    """Delete the builds (including failed ones) not named in keep; skips files still open elsewhere."""
+    builds_dir = os.path.join(index_dir, BUILDS_DIR)
+    for name in os.listdir(builds_dir):
+        if name not in keep:
+            shutil.rmtree(os.path.join(builds_dir, name), ignore_errors=True)
+
+
+def build_index(source_dir, index_dir=LOCAL_INDEX_DIR, vector_dims=256):
+    """
+    Build the on-disk index for source_dir: docs.jsonl, a BM25 inverted index and,
+    with numpy and vector_dims > 0, a float32 vector matrix. Every build goes to its own
+    directory under index_dir/builds/, and index_dir/CURRENT is switched to it in one
+    atomic replace, so a running process loads either the old build or the new one, never
+    a mix. The previous build is kept for processes still loading it. Returns the manifest.
+    """
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 1_000_000_000:09d}"
+    build_dir = os.path.join(index_dir, BUILDS_DIR, version)
+    os.makedirs(build_dir)
+    documents = load_documents(source_dir)
+
+    postings = {}
+    doc_lengths = []
+    for doc_id, doc in enumerate(documents):
+        tokens = tokenize(_record_text(doc))
+        doc_lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            postings.setdefault(term, []).append([doc_id, tf])
+
+    def write_docs(path):
+        with open(path, "w", encoding="utf-8") as f:
+            for doc in documents:
+                f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+
+    def write_postings(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"doc_lengths": doc_lengths, "postings": postings}, f, separators=(",", ":"))
+
+    write_docs(os.path.join(build_dir, "docs.jsonl"))
+    write_postings(os.path.join(build_dir, "bm25.json"))
+
+    embedder = None
+    if np is not None and vector_dims > 0 and documents:
+        matrix = np.stack([hashing_embedding(_record_text(doc), vector_dims) for doc in documents])
+
+        np.save(os.path.join(build_dir, "vectors.npy"), matrix)
+        embedder = "hashing"
+
+    manifest = {
+        "version": 1,
+        "build": version,
+        "documents": len(documents),
+        "avg_doc_length": sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0,
+        "embedder": embedder,
+        "vector_dims": vector_dims if embedder else 0,
+        "built_at": time.time(),
+    }
+
+    with open(os.path.join(build_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    previous = os.path.basename(current_build_dir(index_dir))
+
+    def write_pointer(path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(version)
+
+    _write_atomic(os.path.join(index_dir, POINTER_FILE), write_pointer)
+    _remove_old_builds(index_dir, keep={version, previous})
+    return manifest
+
+
+class LocalIndex:
+    """BM25 plus optional dense-vector retrieval over an index built by build_index()."""
+
+    def __init__(self, index_dir=LOCAL_INDEX_DIR, build_dir=None):
+        self.index_dir = index_dir
+        # Every file comes from one build, whatever CURRENT points to by the time we finish.
+        # If rebuilds removed the build mid-load, follow CURRENT again.
+        for attempt in range(3):
+            self.build_dir = build_dir or current_build_dir(index_dir)
+            try:
+                self._load()
+                return
+            except FileNotFoundError:
+                if build_dir or attempt == 2:
+                    raise
+
+    def _load(self):
+        with open(os.path.join(self.build_dir, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        with open(os.path.join(self.build_dir, "docs.jsonl"), encoding="utf-8") as f:
+            self.documents = [json.loads(line) for line in f if line.strip()]
+        with open(os.path.join(self.build_dir, "bm25.json"), encoding="utf-8") as f:
+            bm25 = json.load(f)
+        self.doc_lengths = bm25["doc_lengths"]
+        self.postings = bm25["postings"]
+        self.avg_doc_length = self.manifest["avg_doc_length"] or 1.0
+        n = len(self.documents)
+        self.idf = {term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self.postings.items()}
+
+        self.vectors = None
+        if np is not None and self.manifest.get("embedder"):
+            # Memory-mapped: pages are loaded on demand and shared between worker processes
+            self.vectors = np.load(os.path.join(self.build_dir, "vectors.npy"), mmap_mode="r")
+
+    def bm25(self, query, limit):
+        """[(doc_id, score)] for the best `limit` BM25 matches."""
+        scores = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / self.avg_doc_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def similarities(self, query):
+        """Cosine similarity of the query to every document, or None without vectors."""
+        if self.vectors is None or not len(self.documents):
+            return None
+        return self.vectors @ hashing_embedding(query, self.manifest["vector_dims"])
+
+    def search(self, query, top=10):
+        """
+        Docs in the same shape as Azure Search results (with "@search.score").
+        With vectors, candidates from both BM25 and the dense top-k are scored by a weighted
+        sum of max-normalised BM25 and cosine similarity.
+        """
+        candidates = max(top * 3, 30)
+        lexical = self.bm25(query, candidates)
+        similarities = self.similarities(query)
+
+        if similarities is None:
+            ranked = lexical[:top]
+        else:
+            limit = min(candidates, len(similarities))
+            dense = np.argpartition(-similarities, limit - 1)[:limit]
+            lexical_scores = dict(lexical)
+            max_lexical = max(lexical_scores.values(), default=0.0) or 1.0
+            fused = {}
+            for doc_id in set(lexical_scores) | {int(i) for i in dense}:
+                similarity = float(similarities[doc_id])
+                similarity = similarity if similarity >= LOCAL_INDEX_MIN_SIMILARITY else 0.0
+                score = (LOCAL_INDEX_BM25_WEIGHT * lexical_scores.get(doc_id, 0.0) / max_lexical
+                         + LOCAL_INDEX_VECTOR_WEIGHT * similarity)
+                if score > 0:
+                    fused[doc_id] = score
+            ranked = heapq.nlargest(top, fused.items(), key=lambda item: item[1])
+
+        return [dict(self.documents[doc_id], **{"@search.score": score}) for doc_id, score in ranked]
+
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_local_index(index_dir=None):
+    """Return the loaded LocalIndex, reloading it when CURRENT points to a new build."""
+    global _INDEX
+    index_dir = index_dir or LOCAL_INDEX_DIR
+    build_dir = current_build_dir(index_dir)
+    if _INDEX is None or _INDEX.index_dir != index_dir or _INDEX.build_dir != build_dir:
+        with _INDEX_LOCK:
+            if _INDEX is None or _INDEX.index_dir != index_dir or _INDEX.build_dir != build_dir:
+                _INDEX = LocalIndex(index_dir)
+    return _INDEX
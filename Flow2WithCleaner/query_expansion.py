@@ -0,0 +1,135 @@
+import json
+import os
+import re
+import threading
+import time
+
+# --- CONFIGURATION ---
+# Optional JSON file of extra expansions: {"term": "synonym"} or {"term": ["synonym", ...]}.
+# It is merged over the built-in table and reloaded when it changes.
+QUERY_EXPANSION_PATH = os.environ.get("QUERY_EXPANSION_PATH", "")
+QUERY_EXPANSION_RELOAD_SECONDS = float(os.environ.get("QUERY_EXPANSION_RELOAD_SECONDS", "30"))
+
+_TOKEN = re.compile(r"\w+")
+_END = object()  # trie key marking the end of a term
+
+
+class QueryExpander:
+    """
+    Expands terms in a query with their synonyms, matching whole tokens only.
+    Terms are stored in a token trie, so a query is scanned once in
+    O(tokens x longest term) no matter how large the table is. All-caps terms
+    (abbreviations such as state codes) match case-sensitively so "IN" does not
+    fire on "in"; everything else matches case-insensitively.
+    """
+
+    def __init__(self, table=None):
+        self._trie = {}
+        self.size = 0
+        for term, synonyms in (table or {}).items():
+            self.add(term, synonyms)
+
+    def add(self, term, synonyms):
+        tokens = _TOKEN.findall(term)
+        if not tokens:
+            return
+        synonyms = [synonyms] if isinstance(synonyms, str) else list(synonyms)
+        case_sensitive = term.isupper()
+        node = self._trie
+        for token in tokens:
+            node = node.setdefault(token if case_sensitive else token.lower(), {})
+        node.setdefault(_END, []).append(synonyms)
+        self.size += 1
+
+    def _match(self, tokens, start):
+        """Longest term starting at tokens[start]: (end index, synonyms) or None."""
+        nodes = [self._trie]
+        best = None
+        for i in range(start, len(tokens)):
+            token = tokens[i].group()
+            lowered = token.lower()
+            # Case-sensitive keys are stored as written, the rest lower-cased
+            next_nodes = []
+            for node in nodes:
+                for key in {token, lowered}:
+                    child = node.get(key)
+                    if child is not None:
+                        next_nodes.append(child)
+            nodes = next_nodes
+            if not nodes:
+                break
+            for node in nodes:
+                for synonyms in node.get(_END, ()):
+                    best = (i + 1, synonyms)
+        return best
+
+    def expand(self, query):
+        """Append synonyms after every matched term, e.g. "stores in TX" -> "stores in TX Texas"."""
+        if not self.size:
+            return query
+        tokens = list(_TOKEN.finditer(query))
+        # Whole-token phrases already in the query (or added), so "IN" -> "Indiana" isn't
+        # skipped because "indianapolis" contains it
+        present = " " + " ".join(token.group().lower() for token in tokens) + " "
+        parts, last, i = [], 0, 0
+        while i < len(tokens):
+            match = self._match(tokens, i)
+            if match is None:
+                i += 1
+                continue
+            end, synonyms = match
+            span_end = tokens[end - 1].end()
+            additions = []
+            for synonym in synonyms:
+                phrase = " " + " ".join(_TOKEN.findall(synonym.lower())) + " "
+                if phrase.strip() and phrase not in present:
+                    additions.append(synonym)
+                    present += phrase.lstrip()
+            parts.append(query[last:span_end])
+            if additions:
+                parts.append(" " + " ".join(additions))
+            last, i = span_end, end
+        parts.append(query[last:])
+        return "".join(parts)
+
+
+def load_expansion_file(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+_EXPANDER = None
+_EXPANDER_BASE = None
+_FILE_MTIME = None
+_CHECKED_AT = 0.0
+_LOCK = threading.Lock()
+
+
+def get_query_expander(base_table=None):
+    """
+    Return the shared QueryExpander for base_table plus QUERY_EXPANSION_PATH.
+    The file's mtime is checked at most every QUERY_EXPANSION_RELOAD_SECONDS and the
+    trie is rebuilt (off to the side, then swapped in) when it changes.
+    """
+    global _EXPANDER, _EXPANDER_BASE, _FILE_MTIME, _CHECKED_AT
+    now = time.monotonic()
+    if _EXPANDER is not None and _EXPANDER_BASE is base_table and now - _CHECKED_AT < QUERY_EXPANSION_RELOAD_SECONDS:
+        return _EXPANDER
+
+    with _LOCK:
+        _CHECKED_AT = now
+        mtime = None
+        if QUERY_EXPANSION_PATH and os.path.exists(QUERY_EXPANSION_PATH):
+            mtime = os.path.getmtime(QUERY_EXPANSION_PATH)
+        if _EXPANDER is None or _EXPANDER_BASE is not base_table or mtime != _FILE_MTIME:
+            table = dict(base_table or {})
+            if mtime is not None:
+                try:
+                    table.update(load_expansion_file(QUERY_EXPANSION_PATH))
+                except (OSError, ValueError):
+                    if _EXPANDER is not None:
+                        return _EXPANDER  # keep the previous table while the file is mid-write
+            _EXPANDER = QueryExpander(table)
+            _EXPANDER_BASE = base_table
+            _FILE_MTIME = mtime
+    return _EXPANDER
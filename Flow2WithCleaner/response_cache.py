@@ -0,0 +1,205 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# --- CONFIGURATION ---
+# "memory" (per process), "sqlite" (shared by workers on the same disk) or "off"
+CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "memory").lower()
+CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", "response_cache.sqlite3")
+CACHE_TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+# Token-set similarity (0-1) for near-duplicate matches; 0 disables and only exact matches hit
+CACHE_SIMILARITY = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", "0"))
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def normalize_question(question):
+    """Lowercase and collapse punctuation/whitespace so trivial rewordings share a key"""
+    return " ".join(_WORD_PATTERN.findall((question or "").lower()))
+
+
+def fingerprint(text):
+    """Stable short hash of a string (retrieved context, prompt template, ...)"""
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:32]
+
+
+def token_set_similarity(a, b):
+    """Jaccard similarity of the word sets of two normalized questions"""
+    tokens_a, tokens_b = set(a.split()), set(b.split())
+    if not tokens_a or not tokens_b:
+        return 0.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+
+class MemoryCacheBackend:
+    """In-process LRU store of (group, question) -> (answer, expires_at)"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, group, question):
+        with self._lock:
+            entry = self._entries.get((group, question))
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._entries[(group, question)]
+                return None
+            self._entries.move_to_end((group, question))
+            return entry[0]
+
+    def candidates(self, group):
+        """Unexpired (question, answer) pairs stored under a group"""
+        now = time.time()
+        with self._lock:
+            return [(question, answer) for (grp, question), (answer, expires_at) in self._entries.items()
+                    if grp == group and expires_at >= now]
+
+    def set(self, group, question, answer, expires_at):
+        with self._lock:
+            self._entries[(group, question)] = (answer, expires_at)
+            self._entries.move_to_end((group, question))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCacheBackend:
+    """SQLite store so several workers on one host share hits; LRU-trimmed by last use"""
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            " grp TEXT NOT NULL, question TEXT NOT NULL, answer TEXT NOT NULL,"
+            " expires_at REAL NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (grp, question))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS response_cache_last_used ON response_cache (last_used)")
+        self._conn.commit()
+
+    def get(self, group, question):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer FROM response_cache WHERE grp = ? AND question = ? AND expires_at >= ?",
+                (group, question, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE response_cache SET last_used = ? WHERE grp = ? AND question = ?",
+                (now, group, question)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def candidates(self, group):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT question, answer FROM response_cache WHERE grp = ? AND expires_at >= ?",
+                (group, time.time())
+            ).fetchall()
+
+    def set(self, group, question, answer, expires_at):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?)",
+                (group, question, answer, expires_at, time.time())
+            )
+            self._conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (time.time(),))
+            self._conn.execute(
+                "DELETE FROM response_cache WHERE rowid NOT IN"
+                " (SELECT rowid FROM response_cache ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+            self._conn.commit()
+
+
+class ResponseCache:
+    """
+    Answer cache keyed on the normalized question, a fingerprint of the retrieved
+    context and the prompt variant. Optionally matches near-duplicate questions.
+    """
+
+    def __init__(self, backend, ttl_seconds=CACHE_TTL_SECONDS, similarity=CACHE_SIMILARITY):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def group_key(context, prompt_variant):
+        return fingerprint(f"{fingerprint(context)}:{prompt_variant}")
+
+    def get(self, question, context, prompt_variant):
+        group = self.group_key(context, prompt_variant)
+        normalized = normalize_question(question)
+
+        answer = self.backend.get(group, normalized)
+        if answer is not None:
+            self.hits += 1
+            return answer
+
+        if self.similarity > 0:
+            best_score, best_answer = 0.0, None
+            for cached_question, cached_answer in self.backend.candidates(group):
+                score = token_set_similarity(normalized, cached_question)
+                if score > best_score:
+                    best_score, best_answer = score, cached_answer
+            if best_answer is not None and best_score >= self.similarity:
+                self.near_hits += 1
+                return best_answer
+
+        self.misses += 1
+        return None
+
+    def set(self, question, context, prompt_variant, answer):
+        group = self.group_key(context, prompt_variant)
+        self.backend.set(group, normalize_question(question), answer, time.time() + self.ttl_seconds)
+
+    def stats(self):
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+        }
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide ResponseCache configured from the environment (None when disabled)"""
+    global _CACHE
+    if CACHE_BACKEND == "off":
+        return None
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                backend = SQLiteCacheBackend() if CACHE_BACKEND == "sqlite" else MemoryCacheBackend()
+                _CACHE = ResponseCache(backend)
+    return _CACHE
@@ -0,0 +1,87 @@
+from promptflow.core import tool
+from concurrent.futures import ThreadPoolExecutor
+from jinja2 import Template
+from gpt5_chat import call_gpt5
+from history import normalize_history
+from response_cache import normalize_question, token_set_similarity
+from tool_lookup import lookup_indexed_knowledge
+import os
+
+# --- CONFIGURATION ---
+# Rewrites at least this similar (token-set Jaccard) to the raw input reuse the speculative search
+EQUIVALENT_SIMILARITY = float(os.environ.get("REWRITE_EQUIVALENT_SIMILARITY", "0.8"))
+REWRITE_TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modify_query_with_history.jinja2")
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get("REWRITE_WORKERS", "16")))
+
+with open(REWRITE_TEMPLATE_PATH, encoding="utf-8") as f:
+    _REWRITE_TEMPLATE = Template(f.read())
+
+
+def rewrite_query(chat_input, chat_history):
+    """Rephrase a follow-up into a standalone question; falls back to the raw input on failure."""
+    prompt = _REWRITE_TEMPLATE.render(chat_history=chat_history, chat_input=chat_input)
+    result = call_gpt5(prompt, chat_input)
+    if result.error or not result.text.strip():
+        return chat_input
+    return result.text.strip()
+
+
+def is_equivalent(raw_query, rewritten_query):
+    """True when the rewrite would search for (nearly) the same thing as the raw input."""
+    raw, rewritten = normalize_question(raw_query), normalize_question(rewritten_query)
+    return raw == rewritten or token_set_similarity(raw, rewritten) >= EQUIVALENT_SIMILARITY
+
+
+def merge_results(primary, secondary):
+    """
+    Merge two lookup outputs, keeping primary hits first and dropping duplicate content.
+    Secondary scores are capped at the lowest primary score, so build_context (which ranks
+    by score, ties by position) still packs every primary hit ahead of them.
+    """
+    if not isinstance(primary, list):
+        return secondary
+    if not isinstance(secondary, list):
+        return primary
+    floor = min((hit.get("score") or 0.0 for hit in primary), default=None)
+    seen = set()
+    merged = []
+    for hit in primary:
+        if hit["content"] not in seen:
+            seen.add(hit["content"])
+            merged.append(hit)
+    for hit in secondary:
+        if hit["content"] not in seen:
+            seen.add(hit["content"])
+            if floor is not None and (hit.get("score") or 0.0) > floor:
+                # Copy: lookup results may be shared through the retrieval cache
+                hit = dict(hit, score=floor)
+            merged.append(hit)
+    return merged
+
+
+@tool
+def rewrite_and_lookup(query: str, chat_history: list = None, rewrite_mode: str = "speculative"):
+    """
+    Search the index for a follow-up question, rewritten to stand alone using chat history.
+    rewrite_mode:
+      - "speculative": search the raw input while the rewrite runs; reuse those hits if the
+        rewrite is equivalent, otherwise search the rewrite too and merge (rewrite hits first)
+      - "serial": rewrite first, then search the rewrite only
+      - "off": search the raw input only
+    First turns (no history) never call the rewrite model.
+    """
+    history = normalize_history(chat_history)
+    if rewrite_mode == "off" or not history:
+        return lookup_indexed_knowledge(query)
+
+    if rewrite_mode == "serial":
+        return lookup_indexed_knowledge(rewrite_query(query, history))
+
+    speculative = _EXECUTOR.submit(lookup_indexed_knowledge, query)
+    rewritten = rewrite_query(query, history)
+
+    if is_equivalent(query, rewritten):
+        return speculative.result()
+
+    return merge_results(lookup_indexed_knowledge(rewritten), speculative.result())
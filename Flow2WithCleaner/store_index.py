@@ -0,0 +1,345 @@
+import json
+import os
+import re
+import threading
+import time
+
+# --- CONFIGURATION ---
+# Where store records come from: "" (disabled), "search" (the Azure Search index)
+# or a path to a .json/.jsonl export of the store records
+STORE_RECORDS_SOURCE = os.environ.get("STORE_RECORDS_SOURCE", "")
+# OData filter selecting store records when loading from Azure Search
+STORE_RECORDS_FILTER = os.environ.get("STORE_RECORDS_FILTER", "City ne null")
+# Optional last-modified field; when set, refreshes only fetch records changed since the last one
+STORE_UPDATED_FIELD = os.environ.get("STORE_UPDATED_FIELD", "")
+STORE_INDEX_REFRESH_SECONDS = float(os.environ.get("STORE_INDEX_REFRESH_SECONDS", "300"))
+# Questions matching more stores than this get no direct hits, only search results
+STORE_DIRECT_MAX_RESULTS = int(os.environ.get("STORE_DIRECT_MAX_RESULTS", "5"))
+
+# Index field name for each store_data field; override with STORE_FIELD_MAP='{"storeId": "Id"}'
+STORE_FIELDS = {
+    "storeId": "StoreId",
+    "name": "StoreName",
+    "address": "Address",
+    "city": "City",
+    "state": "State",
+    "storeLeader": "StoreLeader",
+    "storeLeaderEmail": "StoreLeaderEmail",
+    "districtName": "DistrictName",
+    "districtLeader": "DistrictLeader",
+    "regionName": "RegionName",
+    "regionLeader": "RegionLeader",
+    "areaName": "AreaName",
+    "areaLeader": "AreaLeader",
+    "monday": "MondayHours",
+    "tuesday": "TuesdayHours",
+    "wednesday": "WednesdayHours",
+    "thursday": "ThursdayHours",
+    "friday": "FridayHours",
+    "saturday": "SaturdayHours",
+    "sunday": "SundayHours",
+}
+STORE_FIELDS.update(json.loads(os.environ.get("STORE_FIELD_MAP", "{}")))
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+LEADER_ROLES = ("storeLeader", "districtLeader", "regionLeader", "areaLeader")
+
+# Question keywords -> the store fields worth sending to the model
+FIELD_KEYWORDS = {
+    "hours": {"hour", "hours", "open", "opens", "opening", "close", "closes", "closing", "schedule"},
+    "district": {"district"},
+    "region": {"region", "regional"},
+    "area": {"area"},
+    "leader": {"leader", "manager", "gm", "runs", "charge", "lead", "leads", "boss"},
+    "email": {"email", "e-mail", "contact"},
+    "location": {"address", "where", "located", "location", "directions"},
+}
+
+# A city only counts as the store being asked about when its state follows it or
+# the question is about stores ("mobile orders", "orange juice" are not)
+STORE_NOUNS = {"store", "stores", "location", "locations", "branch", "branches"}
+
+# "store 77", "store #77", "store no. 77"; a bare "#77" is as likely an order or ticket number
+_STORE_ID = re.compile(r"\bstore\s*(?:#|no\.?|number|num\.?)?\s*#?\s*(\d{1,6})\b", re.IGNORECASE)
+_WORD = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+
+def _words(text):
+    return _WORD.findall(str(text).lower())
+
+
+def _normalize_store_id(value):
+    return str(value).strip().lstrip("0") or "0"
+
+
+def build_store_data(doc):
+    """Map an index document to the store_data shape used by format_store_for_llm."""
+    def field(name, default="N/A"):
+        value = doc.get(STORE_FIELDS[name])
+        return value if value not in (None, "") else default
+
+    return {
+        "storeId": field("storeId"),
+        "name": field("name", "Unknown"),
+        "location": {"address": field("address"), "city": field("city"), "state": field("state")},
+        "leadership": {role: field(role) for role in (
+            "storeLeader", "storeLeaderEmail", "districtName", "districtLeader",
+            "regionName", "regionLeader", "areaName", "areaLeader")},
+        "operatingHours": {day: field(day, "Closed") for day in WEEKDAYS},
+    }
+
+
+def format_store_fields(store_data, fields, days=None):
+    """Only the requested parts of a store record (all of them when fields is empty)."""
+    leadership = store_data["leadership"]
+    location = store_data["location"]
+    wanted = fields or set(FIELD_KEYWORDS)
+    lines = [f"Store: {store_data['name']} (ID: {store_data['storeId']})"]
+    if "location" in wanted:
+        lines.append(f"Location: {location['address']}, {location['city']}, {location['state']}")
+    if "leader" in wanted or "email" in wanted:
+        email = f" ({leadership['storeLeaderEmail']})" if "email" in wanted or not fields else ""
+        lines.append(f"Store Leader: {leadership['storeLeader']}{email}")
+    for level in ("district", "region", "area"):
+        if level in wanted:
+            lines.append(f"{level.title()}: {leadership[f'{level}Name']} - {leadership[f'{level}Leader']}")
+    if "hours" in wanted:
+        hours = store_data["operatingHours"]
+        lines.append("Hours: " + " | ".join(f"{day[:3].title()} {hours[day]}" for day in (days or WEEKDAYS)))
+    return "\n".join(lines)
+
+
+class StoreIndex:
+    """
+    In-memory store records keyed by storeId, with secondary indexes on city/state and
+    leader names. upsert() only re-indexes records that actually changed.
+    """
+
+    def __init__(self):
+        self.records = {}
+        self.by_city = {}      # city -> {state -> {storeId}}
+        self.by_leader = {}    # leader name -> {(storeId, role)}
+        self.max_city_words = 1
+        self.max_leader_words = 2
+        self.last_updated = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.records)
+
+    def _add(self, store_id, data):
+        location, leadership = data["location"], data["leadership"]
+        city = " ".join(_words(location["city"]))
+        state = " ".join(_words(location["state"]))
+        if city:
+            self.by_city.setdefault(city, {}).setdefault(state, set()).add(store_id)
+            self.max_city_words = max(self.max_city_words, len(city.split()))
+        for role in LEADER_ROLES:
+            name = " ".join(_words(leadership[role])) if leadership[role] != "N/A" else ""
+            if name:
+                self.by_leader.setdefault(name, set()).add((store_id, role))
+                self.max_leader_words = max(self.max_leader_words, len(name.split()))
+
+    def _remove(self, store_id):
+        data = self.records.pop(store_id)
+        city = " ".join(_words(data["location"]["city"]))
+        state = " ".join(_words(data["location"]["state"]))
+        self.by_city.get(city, {}).get(state, set()).discard(store_id)
+        for role in LEADER_ROLES:
+            self.by_leader.get(" ".join(_words(data["leadership"][role])), set()).discard((store_id, role))
+
+    def upsert(self, docs):
+        """Add or update index documents; returns how many records changed."""
+        changed = 0
+        with self._lock:
+            for doc in docs:
+                data = build_store_data(doc)
+                if data["storeId"] == "N/A":
+                    continue
+                store_id = _normalize_store_id(data["storeId"])
+                if self.records.get(store_id) == data:
+                    continue
+                if store_id in self.records:
+                    self._remove(store_id)
+                self.records[store_id] = data
+                self._add(store_id, data)
+                changed += 1
+                updated = doc.get(STORE_UPDATED_FIELD) if STORE_UPDATED_FIELD else None
+                if updated is not None and (self.last_updated is None or str(updated) > str(self.last_updated)):
+                    self.last_updated = updated
+        return changed
+
+    def retain(self, store_ids):
+        """Drop records that are no longer in the source (after a full reload)."""
+        with self._lock:
+            for store_id in set(self.records) - set(store_ids):
+                self._remove(store_id)
+
+    def _phrases(self, words, max_words):
+        for n in range(max_words, 0, -1):
+            for i in range(len(words) - n + 1):
+                yield i, n, " ".join(words[i:i + n])
+
+    def _match_city(self, words):
+        """(store ids, True if the city was qualified by its state), or (None, False)."""
+        for i, n, phrase in self._phrases(words, self.max_city_words):
+            states = self.by_city.get(phrase)
+            if not states:
+                continue
+            following = words[i + n:i + n + 2]
+            for state, ids in states.items():
+                if state and (state in following or " ".join(following) == state):
+                    return set(ids), True
+            if STORE_NOUNS & set(words):
+                return set().union(*states.values()), False
+        return None, False
+
+    def _match_leader(self, words):
+        for _, _, phrase in self._phrases(words, self.max_leader_words):
+            # Full names only; a lone first name is too ambiguous
+            if " " in phrase and phrase in self.by_leader:
+                return self.by_leader[phrase]
+        return None
+
+    def answer(self, query):
+        """
+        Direct hits for store questions: an explicit store number, or a store field
+        keyword plus a leader's full name or a city (qualified by its state or a store noun).
+        Returns (hits, exact): a list of {"content", "score"} hits with only the fields the
+        question needs (None when the question doesn't name a store), and whether the
+        records fully answer it - a store field asked of a store number, a leader's full
+        name or a city with its state - so full-text search can be skipped.
+        """
+        words = _words(query)
+        word_set = set(words)
+        fields = {name for name, keywords in FIELD_KEYWORDS.items() if word_set & keywords}
+        if fields & {"district", "region", "area"}:
+            fields.discard("leader")
+        days = [day for day in WEEKDAYS if day in word_set] or None
+        if days:
+            fields.add("hours")
+
+        with self._lock:
+            match = _STORE_ID.search(query)
+            # Exact only when a store field was asked for ("return policy at store 12" isn't)
+            exact = bool(fields)
+            if match:
+                # An explicit store number is enough; with no field asked for, send the whole record
+                store_id = _normalize_store_id(match.group(1))
+                store_ids = {store_id} if store_id in self.records else None
+            elif not fields:
+                # No store named and no store field asked for (policy, HR, ...): search only
+                return None, False
+            else:
+                store_ids = None
+                leader_matches = self._match_leader(words)
+                if leader_matches:
+                    store_ids = {store_id for store_id, _ in leader_matches}
+                    roles = {role for _, role in leader_matches}
+                    fields.discard("leader")
+                    fields |= {"location"} | {role[:-len("Leader")] if role != "storeLeader" else "leader"
+                                              for role in roles}
+                else:
+                    store_ids, exact = self._match_city(words)
+                    if store_ids is not None:
+                        fields.add("location")
+
+            if not store_ids or len(store_ids) > STORE_DIRECT_MAX_RESULTS:
+                return None, False
+            hits = [{"content": format_store_fields(self.records[store_id], fields, days), "score": 100.0}
+                    for store_id in sorted(store_ids, key=lambda s: int(s) if s.isdigit() else s)]
+            return hits, exact
+
+
+def _load_file(path):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        records = json.load(f)
+    return records if isinstance(records, list) else [records]
+
+
+def _load_search(client, since=None):
+    search_filter = STORE_RECORDS_FILTER
+    if since is not None:
+        since_filter = f"{STORE_UPDATED_FIELD} gt {since}"
+        search_filter = f"({search_filter}) and {since_filter}" if search_filter else since_filter
+    return list(client.search(search_text="*", filter=search_filter or None))
+
+
+_INDEX = None
+_LOADED_AT = 0.0
+_SOURCE_MTIME = None
+_REFRESHING = threading.Lock()
+
+
+def _refresh(search_client_factory, full):
+    """(Re)load store records from STORE_RECORDS_SOURCE into the shared index."""
+    global _INDEX, _LOADED_AT, _SOURCE_MTIME
+    index = _INDEX if _INDEX is not None else StoreIndex()
+    if STORE_RECORDS_SOURCE == "search":
+        incremental = STORE_UPDATED_FIELD and index.last_updated is not None and not full
+        docs = _load_search(search_client_factory(), index.last_updated if incremental else None)
+    else:
+        mtime = os.path.getmtime(STORE_RECORDS_SOURCE)
+        if mtime == _SOURCE_MTIME and _INDEX is not None:
+            _LOADED_AT = time.time()
+            return
+        docs = _load_file(STORE_RECORDS_SOURCE)
+        _SOURCE_MTIME = mtime
+        incremental = False
+
+    index.upsert(docs)
+    if not incremental:
+        index.retain({_normalize_store_id(build_store_data(doc)["storeId"]) for doc in docs})
+    _INDEX = index
+    _LOADED_AT = time.time()
+
+
+def _background_refresh(search_client_factory):
+    try:
+        _refresh(search_client_factory, full=False)
+    except Exception:
+        pass  # keep serving the current records; the next call retries
+    finally:
+        _REFRESHING.release()
+
+
+def get_store_index(search_client_factory=None):
+    """
+    Return the shared StoreIndex, or None when STORE_RECORDS_SOURCE is unset.
+    The first call loads synchronously; later refreshes run in a background thread.
+    """
+    if not STORE_RECORDS_SOURCE:
+        return None
+    if _INDEX is None:
+        with _REFRESHING:
+            if _INDEX is None:
+                _refresh(search_client_factory, full=True)
+    elif time.time() - _LOADED_AT > STORE_INDEX_REFRESH_SECONDS and _REFRESHING.acquire(blocking=False):
+        threading.Thread(target=_background_refresh, args=(search_client_factory,), daemon=True).start()
+    return _INDEX
+
+
+def answer_store_question(query, search_client_factory=None):
+    """(direct hits or None, exact) for a question; see StoreIndex.answer."""
+    try:
+        index = get_store_index(search_client_factory)
+    except Exception:
+        return None, False  # records unavailable; search still works
+    if index is None:
+        return None, False
+    return index.answer(query)
+
+
+def merge_direct_hits(direct, results):
+    """
+    Put direct store hits ahead of the search results. Search hits for the same
+    stores are dropped, and a search error or "no results" message gives way to the direct hits.
+    """
+    if not direct:
+        return results
+    if not isinstance(results, list):
+        return list(direct)
+    headers = {hit["content"].split("\n", 1)[0] for hit in direct}
+    return list(direct) + [hit for hit in results if str(hit.get("content", "")).split("\n", 1)[0] not in headers]
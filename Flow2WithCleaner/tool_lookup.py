@@ -1,119 +1,288 @@
-from promptflow.core import tool
-from azure.search.documents import SearchClient
-from azure.core.credentials import AzureKeyCredential
-import os
-import json
-
-# --- CONFIGURATION ---
-# Get configuration from environment variables
-SEARCH_ENDPOINT = os.environ.get("AZURE_SEARCH_ENDPOINT")
-SEARCH_KEY = os.environ.get("AZURE_SEARCH_KEY")
-INDEX_NAME = os.environ.get("AZURE_SEARCH_INDEX_NAME")
-
-
-def format_store_for_llm(store_data):
-    """Format store data as readable text for LLM consumption"""
-    lines = [
-        f"Store: {store_data.get('name', 'Unknown')} (ID: {store_data.get('storeId', 'N/A')})",
-        f"Location: {store_data['location'].get('address', 'N/A')}, {store_data['location'].get('city', 'N/A')}, {store_data['location'].get('state', 'N/A')}",
-        f"Store Leader: {store_data['leadership'].get('storeLeader', 'N/A')} ({store_data['leadership'].get('storeLeaderEmail', 'N/A')})",
-        f"District: {store_data['leadership'].get('districtName', 'N/A')} - {store_data['leadership'].get('districtLeader', 'N/A')}",
-        f"Region: {store_data['leadership'].get('regionName', 'N/A')} - {store_data['leadership'].get('regionLeader', 'N/A')}",
-        f"Area: {store_data['leadership'].get('areaName', 'N/A')} - {store_data['leadership'].get('areaLeader', 'N/A')}",
-        f"Hours: Mon {store_data['operatingHours'].get('monday', 'Closed')} | Tue {store_data['operatingHours'].get('tuesday', 'Closed')} | Wed {store_data['operatingHours'].get('wednesday', 'Closed')} | Thu {store_data['operatingHours'].get('thursday', 'Closed')} | Fri {store_data['operatingHours'].get('friday', 'Closed')} | Sat {store_data['operatingHours'].get('saturday', 'Closed')} | Sun {store_data['operatingHours'].get('sunday', 'Closed')}"
-    ]
-    if store_data.get('additionalInfo'):
-        lines.append(f"Info: {store_data['additionalInfo']}")
-    return "\n".join(lines)
-
-
-def format_document_for_llm(doc_data):
-    """Format document data as readable text for LLM consumption"""
-    return f"""
-DOCUMENT INFORMATION
-====================
-Title: {doc_data.get('title', 'Unknown')}
-
-CONTENT
--------
-{doc_data.get('content', '[No content available]')}
-"""
-
-
-@tool
-def lookup_indexed_knowledge(query: str):
-    """
-    Search Azure Index. 
-    Returns formatted, readable content for store metadata and documents.
-    Requires AZURE_SEARCH_ENDPOINT, AZURE_SEARCH_KEY, and AZURE_SEARCH_INDEX_NAME env variables.
-    """
-    # Validate environment variables
-    if not SEARCH_ENDPOINT or not SEARCH_KEY or not INDEX_NAME:
-        return "Error: Missing Azure Search environment variables. Please set AZURE_SEARCH_ENDPOINT, AZURE_SEARCH_KEY, and AZURE_SEARCH_INDEX_NAME in your .env file or environment."
-    
-    try:
-        # 1. Connect
-        credential = AzureKeyCredential(SEARCH_KEY)
-        client = SearchClient(endpoint=SEARCH_ENDPOINT,
-                              index_name=INDEX_NAME,
-                              credential=credential)
-
-        # 2. Define Fields to Retrieve
-        target_fields = [
-
-        ]
-
-        # 3. Run Search with expanded query for state abbreviations
-        # Expand common abbreviations to improve search results
-        expanded_query = query
-        state_mapping = {
-        }
-
-        for abbrev, full_name in state_mapping.items():
-            if abbrev in query:
-                expanded_query = query.replace(abbrev, f"{abbrev} {full_name}")
-                break
-        
-        results = client.search(
-            search_text=expanded_query, 
-            select=target_fields, 
-            top=10,  # Increased from 5 to get more results
-            search_mode="any"  # Match any term instead of all terms
-        )
-
-        formatted_results = []
-        for doc in results:
-            
-            # --- SCENARIO A: STORE RECORD (Has City/Address) ---
-            if doc.get("City") and doc.get("Address"):
-                
-                store_data = {
-
-                }
-                
-                # Add any additional content/notes if present
-                if doc.get('content'):
-                    store_data['additionalInfo'] = doc.get('content')
-                
-                formatted_results.append(format_store_for_llm(store_data))
-
-            # --- SCENARIO B: DOCUMENT/PDF CONTENT ---
-            # Check for actual content - documents should have chunk or content fields with real data
-            elif doc.get("chunk") or doc.get("content"):
-                content_text = (doc.get("chunk") or doc.get("content") or "").strip()
-                if content_text and content_text != "[No content available]":
-                    doc_data = {
-                        "type": "DOCUMENT",
-                        "title": doc.get("Title") or "Document",
-                        "content": content_text
-                    }
-                    formatted_results.append(format_document_for_llm(doc_data))
-
-        # Handle no results case
-        if not formatted_results:
-            return "No relevant information found in the knowledge base for this query."
-
-        return "\n\n".join(formatted_results)
-
-    except Exception as e:
-        return f"Error querying Azure Search: {str(e)}"
\ No newline at end of file
+from promptflow.core import tool
+from response_cache import MemoryCacheBackend, fingerprint
+from context_builder import document_id
+from store_index import answer_store_question, build_store_data, merge_direct_hits
+from query_expansion import get_query_expander
+from metrics import METRICS
+from warmup import warm_up_on_load
+import threading
+import time
+import os
+import json
+
+# --- CONFIGURATION ---
+# Get configuration from environment variables
+SEARCH_ENDPOINT = os.environ.get("AZURE_SEARCH_ENDPOINT")
+SEARCH_KEY = os.environ.get("AZURE_SEARCH_KEY")
+INDEX_NAME = os.environ.get("AZURE_SEARCH_INDEX_NAME")
+# "azure" (Azure AI Search) or "local" (on-disk BM25/vector index, see local_index.py)
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "azure").lower()
+
+# Retrieval cache: formatted results for identical searches. Bump the index version
+# (env or bump_index_version()) after a reindex to invalidate everything at once.
+RETRIEVAL_CACHE_TTL_SECONDS = float(os.environ.get("RETRIEVAL_CACHE_TTL_SECONDS", "300"))
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.environ.get("RETRIEVAL_CACHE_MAX_ENTRIES", "2000"))
+INDEX_VERSION = os.environ.get("AZURE_SEARCH_INDEX_VERSION", "")
+
+MISSING_ENV_ERROR = "Error: Missing Azure Search environment variables. Please set AZURE_SEARCH_ENDPOINT, AZURE_SEARCH_KEY, and AZURE_SEARCH_INDEX_NAME in your .env file or environment."
+
+# Process-wide SearchClient registry, keyed by (endpoint, index, key).
+# All clients share one transport so connections stay warm across queries.
+# The Azure SDK (~0.2s to import) is only loaded when the first client is built.
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+_TRANSPORT = None
+
+
+def get_search_client(endpoint=None, index_name=None, key=None):
+    """Return a cached SearchClient for (endpoint, index, key), building it on first use."""
+    global _TRANSPORT
+    cache_key = (endpoint or SEARCH_ENDPOINT, index_name or INDEX_NAME, key or SEARCH_KEY)
+    client = _CLIENTS.get(cache_key)
+    if client is None:
+        with _CLIENTS_LOCK:
+            client = _CLIENTS.get(cache_key)
+            if client is None:
+                from azure.search.documents import SearchClient
+                from azure.core.credentials import AzureKeyCredential
+                from azure.core.pipeline.transport import RequestsTransport
+
+                if _TRANSPORT is None:
+                    _TRANSPORT = RequestsTransport(connection_timeout=5, read_timeout=30)
+                client = SearchClient(endpoint=cache_key[0],
+                                      index_name=cache_key[1],
+                                      credential=AzureKeyCredential(cache_key[2]),
+                                      transport=_TRANSPORT)
+                _CLIENTS[cache_key] = client
+    return client
+
+
+def warm_up():
+    """Build the SearchClient and open a pooled connection to the search service."""
+    if SEARCH_BACKEND == "local":
+        from local_index import get_local_index
+        get_local_index()
+    elif SEARCH_ENDPOINT and SEARCH_KEY and INDEX_NAME:
+        get_search_client().get_document_count()
+
+
+_RETRIEVAL_CACHE = MemoryCacheBackend(max_entries=RETRIEVAL_CACHE_MAX_ENTRIES)
+
+
+def bump_index_version(version=None):
+    """Invalidate cached retrieval results, e.g. after a reindex (pass the index etag if known)."""
+    global INDEX_VERSION
+    INDEX_VERSION = version if version is not None else f"{INDEX_VERSION}+{time.time()}"
+    _RETRIEVAL_CACHE.clear()
+    return INDEX_VERSION
+
+
+def invalidate_retrieval_cache():
+    """Drop all cached retrieval results without changing the index version."""
+    _RETRIEVAL_CACHE.clear()
+
+
+def _retrieval_group(top, search_mode, fields):
+    return fingerprint(f"{INDEX_NAME}|{INDEX_VERSION}|{top}|{search_mode}|{','.join(sorted(fields))}")
+
+
+def get_cached_retrieval(expanded_query, top, search_mode, fields):
+    """Return cached formatted results for this search, or None."""
+    if RETRIEVAL_CACHE_TTL_SECONDS <= 0:
+        return None
+    return _RETRIEVAL_CACHE.get(_retrieval_group(top, search_mode, fields), expanded_query)
+
+
+def set_cached_retrieval(expanded_query, top, search_mode, fields, formatted):
+    """Store formatted results for this search."""
+    if RETRIEVAL_CACHE_TTL_SECONDS <= 0:
+        return
+    _RETRIEVAL_CACHE.set(_retrieval_group(top, search_mode, fields), expanded_query,
+                         formatted, time.time() + RETRIEVAL_CACHE_TTL_SECONDS)
+
+
+def format_store_for_llm(store_data):
+    """Format store data as readable text for LLM consumption"""
+    lines = [
+        f"Store: {store_data.get('name', 'Unknown')} (ID: {store_data.get('storeId', 'N/A')})",
+        f"Location: {store_data['location'].get('address', 'N/A')}, {store_data['location'].get('city', 'N/A')}, {store_data['location'].get('state', 'N/A')}",
+        f"Store Leader: {store_data['leadership'].get('storeLeader', 'N/A')} ({store_data['leadership'].get('storeLeaderEmail', 'N/A')})",
+        f"District: {store_data['leadership'].get('districtName', 'N/A')} - {store_data['leadership'].get('districtLeader', 'N/A')}",
+        f"Region: {store_data['leadership'].get('regionName', 'N/A')} - {store_data['leadership'].get('regionLeader', 'N/A')}",
+        f"Area: {store_data['leadership'].get('areaName', 'N/A')} - {store_data['leadership'].get('areaLeader', 'N/A')}",
+        f"Hours: Mon {store_data['operatingHours'].get('monday', 'Closed')} | Tue {store_data['operatingHours'].get('tuesday', 'Closed')} | Wed {store_data['operatingHours'].get('wednesday', 'Closed')} | Thu {store_data['operatingHours'].get('thursday', 'Closed')} | Fri {store_data['operatingHours'].get('friday', 'Closed')} | Sat {store_data['operatingHours'].get('saturday', 'Closed')} | Sun {store_data['operatingHours'].get('sunday', 'Closed')}"
+    ]
+    if store_data.get('additionalInfo'):
+        lines.append(f"Info: {store_data['additionalInfo']}")
+    return "\n".join(lines)
+
+
+def format_document_for_llm(doc_data):
+    """Format document data as readable text for LLM consumption"""
+    return f"""
+DOCUMENT INFORMATION
+====================
+Title: {doc_data.get('title', 'Unknown')}
+
+CONTENT
+-------
+{doc_data.get('content', '[No content available]')}
+"""
+
+
+SEARCH_TOP = 10  # Increased from 5 to get more results
+SEARCH_MODE = "any"  # Match any term instead of all terms
+
+# Fields to Retrieve
+TARGET_FIELDS = [
+
+]
+
+# Common abbreviations to expand to improve search results
+# (values may be a string or a list of synonyms; QUERY_EXPANSION_PATH adds more)
+STATE_MAPPING = {
+}
+
+
+def expand_query(query):
+    """Expand abbreviations and synonyms (e.g. state codes) on whole-token matches in the search query"""
+    return get_query_expander(STATE_MAPPING).expand(query)
+
+
+def format_search_result(doc):
+    """Format a single search hit, or return None if it has no usable content"""
+    # --- SCENARIO A: STORE RECORD (Has City/Address) ---
+    if doc.get("City") and doc.get("Address"):
+        
+        store_data = build_store_data(doc)
+        
+        # Add any additional content/notes if present
+        if doc.get('content'):
+            store_data['additionalInfo'] = doc.get('content')
+        
+        return format_store_for_llm(store_data)
+
+    # --- SCENARIO B: DOCUMENT/PDF CONTENT ---
+    # Check for actual content - documents should have chunk or content fields with real data
+    elif doc.get("chunk") or doc.get("content"):
+        content_text = (doc.get("chunk") or doc.get("content") or "").strip()
+        if content_text and content_text != "[No content available]":
+            doc_data = {
+                "type": "DOCUMENT",
+                "title": doc.get("Title") or "Document",
+                "content": content_text
+            }
+            return format_document_for_llm(doc_data)
+
+    return None
+
+
+def scored_hit(doc, formatted):
+    """A formatted search document as passed downstream: {"content", "score"}, plus "id" when it has one."""
+    hit = {"content": formatted, "score": doc.get("@search.score") or 0.0}
+    doc_id = document_id(doc)
+    if doc_id is not None:
+        # Lets build_context drop the same chunk found by two searches
+        hit["id"] = doc_id
+    return hit
+
+
+def finalize_results(formatted_results):
+    """
+    Return the scored hits ({"content", "score"[, "id"]}) passed downstream;
+    generate_prompt_context ranks and packs them into the prompt budget.
+    """
+    # Handle no results case
+    if not formatted_results:
+        return "No relevant information found in the knowledge base for this query."
+
+    return formatted_results
+
+
+def lookup_local_knowledge(query):
+    """
+    Search the local hybrid index (SEARCH_BACKEND=local) built from LOCAL_INDEX_DIR.
+    Same output as the Azure path; lookups are in-process, so results aren't cached.
+    """
+    try:
+        # numpy comes in with the local index, so only import it when it's used
+        from local_index import get_local_index
+
+        expanded_query = expand_query(query)
+        with METRICS.stage("search", backend="local"):
+            formatted_results = []
+            for doc in get_local_index().search(expanded_query, top=SEARCH_TOP):
+                formatted = format_search_result(doc)
+                if formatted:
+                    formatted_results.append(scored_hit(doc, formatted))
+        return finalize_results(formatted_results)
+
+    except Exception as e:
+        METRICS.inc("errors_total", stage="search")
+        return f"Error querying local index: {str(e)}"
+
+
+@tool
+def lookup_indexed_knowledge(query: str):
+    """
+    Search Azure Index (or the local index when SEARCH_BACKEND=local).
+    Returns formatted, readable content for store metadata and documents,
+    as a list of {"content", "score"} hits.
+    Requires AZURE_SEARCH_ENDPOINT, AZURE_SEARCH_KEY, and AZURE_SEARCH_INDEX_NAME env variables.
+    """
+    # Questions naming a store (number, city/state, leader) are answered from its record alone;
+    # when the record only partly answers them it goes ahead of the search hits
+    direct, exact = answer_store_question(query, get_search_client)
+    if exact:
+        METRICS.inc("store_index_total", result="hit")
+        return direct
+    if direct is not None:
+        METRICS.inc("store_index_total", result="partial")
+    return merge_direct_hits(direct, search_indexed_knowledge(query))
+
+
+def search_indexed_knowledge(query):
+    """The search part of lookup_indexed_knowledge: scored hits, or an error/no-results message."""
+    if SEARCH_BACKEND == "local":
+        return lookup_local_knowledge(query)
+
+    # Validate environment variables
+    if not SEARCH_ENDPOINT or not SEARCH_KEY or not INDEX_NAME:
+        return MISSING_ENV_ERROR
+    
+    try:
+        # 1. Connect (cached client, shared transport)
+        client = get_search_client()
+
+        # 2. Run Search with expanded query for state abbreviations
+        expanded_query = expand_query(query)
+        cached = get_cached_retrieval(expanded_query, SEARCH_TOP, SEARCH_MODE, TARGET_FIELDS)
+        if cached is not None:
+            METRICS.inc("cache_total", cache="retrieval", result="hit")
+            return cached
+        METRICS.inc("cache_total", cache="retrieval", result="miss")
+
+        with METRICS.stage("search"):
+            results = client.search(
+                search_text=expanded_query, 
+                select=TARGET_FIELDS, 
+                top=SEARCH_TOP,
+                search_mode=SEARCH_MODE
+            )
+
+            formatted_results = []
+            for doc in results:
+                formatted = format_search_result(doc)
+                if formatted:
+                    formatted_results.append(scored_hit(doc, formatted))
+
+        context = finalize_results(formatted_results)
+        set_cached_retrieval(expanded_query, SEARCH_TOP, SEARCH_MODE, TARGET_FIELDS, context)
+        return context
+
+    except Exception as e:
+        METRICS.inc("errors_total", stage="search")
+        return f"Error querying Azure Search: {str(e)}"
+
+
+warm_up_on_load("search", warm_up)
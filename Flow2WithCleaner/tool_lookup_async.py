@@ -0,0 +1,153 @@
+from promptflow.core import tool
+from tool_lookup import (
+    INDEX_NAME,
+    MISSING_ENV_ERROR,
+    SEARCH_BACKEND,
+    SEARCH_ENDPOINT,
+    SEARCH_KEY,
+    SEARCH_MODE,
+    SEARCH_TOP,
+    TARGET_FIELDS,
+    expand_query,
+    finalize_results,
+    format_search_result,
+    get_cached_retrieval,
+    get_search_client,
+    scored_hit,
+    lookup_local_knowledge,
+    set_cached_retrieval,
+)
+from metrics import METRICS
+from store_index import answer_store_question, merge_direct_hits
+import asyncio
+import threading
+
+# Async SearchClients per event loop: loop -> (transport, {(endpoint, index, key): client}, closer).
+# aiohttp sessions are bound to a loop, so each loop gets its own transport. Prompt Flow
+# may run every execution on a fresh loop, so a loop's entry is closed when the loop shuts
+# down (asyncio.run finalizes async generators first), and entries of loops closed some
+# other way are dropped on the next lookup instead of piling up.
+_LOOP_CLIENTS = {}
+_LOCK = threading.Lock()
+
+
+async def _close_on_shutdown(loop, transport):
+    """Parked async generator; the loop's shutdown_asyncgens() closes it, which closes the transport."""
+    try:
+        yield
+    finally:
+        with _LOCK:
+            if _LOOP_CLIENTS.get(loop, (transport,))[0] is transport:
+                _LOOP_CLIENTS.pop(loop, None)
+        await transport.close()
+        METRICS.inc("search_clients_evicted_total")
+
+
+def _drop_closed_loops():
+    with _LOCK:
+        closed = [loop for loop in _LOOP_CLIENTS if loop.is_closed()]
+        for loop in closed:
+            _LOOP_CLIENTS.pop(loop)
+    # Their sockets can't be closed without the loop; dropping the references frees them
+    if closed:
+        METRICS.inc("search_clients_evicted_total", len(closed))
+
+
+async def get_async_search_client(endpoint=None, index_name=None, key=None):
+    """Return a cached async SearchClient for the running event loop."""
+    _drop_closed_loops()
+    loop = asyncio.get_running_loop()
+    client_key = (endpoint or SEARCH_ENDPOINT, index_name or INDEX_NAME, key or SEARCH_KEY)
+    with _LOCK:
+        transport, clients, _ = _LOOP_CLIENTS.get(loop, (None, None, None))
+        client = clients.get(client_key) if clients else None
+    if client is None:
+        # Imported on first use, like the sync client in tool_lookup
+        from azure.search.documents.aio import SearchClient
+        from azure.core.credentials import AzureKeyCredential
+        from azure.core.pipeline.transport import AioHttpTransport
+
+        closer = None
+        with _LOCK:
+            if loop not in _LOOP_CLIENTS:
+                transport = AioHttpTransport(connection_timeout=5, read_timeout=30)
+                closer = _close_on_shutdown(loop, transport)
+                _LOOP_CLIENTS[loop] = (transport, {}, closer)
+            transport, clients, _ = _LOOP_CLIENTS[loop]
+            client = clients.get(client_key)
+            if client is None:
+                client = SearchClient(endpoint=client_key[0],
+                                      index_name=client_key[1],
+                                      credential=AzureKeyCredential(client_key[2]),
+                                      transport=transport)
+                clients[client_key] = client
+        if closer is not None:
+            # Run it up to its yield (no awaits before it) so the loop tracks it for shutdown
+            await closer.asend(None)
+    return client
+
+
+async def close_async_search_clients():
+    """Close the running loop's SearchClients and transport (call before the loop shuts down)."""
+    with _LOCK:
+        _, _, closer = _LOOP_CLIENTS.get(asyncio.get_running_loop(), (None, None, None))
+    if closer is not None:
+        await closer.aclose()
+
+
+@tool
+async def lookup_indexed_knowledge_async(query: str):
+    """
+    Async variant of lookup_indexed_knowledge using azure.search.documents.aio.
+    Requires AZURE_SEARCH_ENDPOINT, AZURE_SEARCH_KEY, and AZURE_SEARCH_INDEX_NAME env variables.
+    """
+    # The first call may load the store records, so keep it off the event loop
+    direct, exact = await asyncio.to_thread(answer_store_question, query, get_search_client)
+    if exact:
+        METRICS.inc("store_index_total", result="hit")
+        return direct
+    if direct is not None:
+        METRICS.inc("store_index_total", result="partial")
+    return merge_direct_hits(direct, await search_indexed_knowledge_async(query))
+
+
+async def search_indexed_knowledge_async(query):
+    """The search part of lookup_indexed_knowledge_async."""
+    if SEARCH_BACKEND == "local":
+        # In-process and sub-millisecond, no need to leave the event loop
+        return lookup_local_knowledge(query)
+
+    if not SEARCH_ENDPOINT or not SEARCH_KEY or not INDEX_NAME:
+        return MISSING_ENV_ERROR
+
+    try:
+        client = await get_async_search_client()
+
+        expanded_query = expand_query(query)
+        cached = get_cached_retrieval(expanded_query, SEARCH_TOP, SEARCH_MODE, TARGET_FIELDS)
+        if cached is not None:
+            METRICS.inc("cache_total", cache="retrieval", result="hit")
+            return cached
+        METRICS.inc("cache_total", cache="retrieval", result="miss")
+
+        with METRICS.stage("search"):
+            results = await client.search(
+                search_text=expanded_query,
+                select=TARGET_FIELDS,
+                top=SEARCH_TOP,
+                search_mode=SEARCH_MODE
+            )
+
+            formatted_results = []
+            async for doc in results:
+                formatted = format_search_result(doc)
+                if formatted:
+                    formatted_results.append(scored_hit(doc, formatted))
+
+        context = finalize_results(formatted_results)
+        set_cached_retrieval(expanded_query, SEARCH_TOP, SEARCH_MODE, TARGET_FIELDS, context)
+        return context
+
+    except Exception as e:
+        METRICS.inc("errors_total", stage="search")
+        return f"Error querying Azure Search: {str(e)}"
@@ -0,0 +1,45 @@
+import os
+import threading
+import time
+
+from metrics import METRICS
+
+# --- CONFIGURATION ---
+# Pre-open the search and LLM connections in the background as soon as the flow
+# modules load, so the first request doesn't pay for SDK imports, DNS and TLS.
+FLOW_WARMUP = os.environ.get("FLOW_WARMUP", "false").lower() == "true"
+
+# name -> {"seconds": ..} once warmed, {"error": ..} if it failed; absent while pending
+WARMUP_STATUS = {}
+_STARTED = set()
+_LOCK = threading.Lock()
+
+
+def run_warm_up(name, warm_up):
+    """Run one warm-up function now, recording how long it took or why it failed."""
+    started = time.monotonic()
+    try:
+        warm_up()
+    except Exception as e:
+        WARMUP_STATUS[name] = {"error": str(e)[:200]}
+        METRICS.inc("errors_total", stage=f"warmup_{name}")
+        return False
+    WARMUP_STATUS[name] = {"seconds": round(time.monotonic() - started, 3)}
+    METRICS.observe("warmup_seconds", time.monotonic() - started, target=name)
+    return True
+
+
+def warm_up_on_load(name, warm_up):
+    """With FLOW_WARMUP on, run warm_up once per process in a daemon thread (modules call this on import)."""
+    if not FLOW_WARMUP:
+        return
+    with _LOCK:
+        if name in _STARTED:
+            return
+        _STARTED.add(name)
+    threading.Thread(target=run_warm_up, args=(name, warm_up), name=f"warmup-{name}", daemon=True).start()
+
+
+def is_warm(*names):
+    """True once every named warm-up has finished (successfully or not)."""
+    return all(name in WARMUP_STATUS for name in names)
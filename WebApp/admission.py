@@ -0,0 +1,129 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+
+class AdmissionRejected(Exception):
+    """Raised when the Prompt Flow proxy is saturated and the request is turned away."""
+
+
+class AdmissionController:
+    """
+    Bounded in-flight limiter for Prompt Flow calls.
+    At most max_in_flight calls run at once; up to max_queue more wait for a slot
+    (for at most queue_timeout seconds). Anything beyond that is rejected immediately.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        started = time.perf_counter()
+        if not self._semaphore.locked():
+            # Free slot: acquire() returns without yielding
+            await self._semaphore.acquire()
+        elif self.queued >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected("queue full")
+        else:
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise AdmissionRejected("queue timeout")
+            finally:
+                self.queued -= 1
+
+        waited = time.perf_counter() - started
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 1) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
+
+
+class UserRateLimiter:
+    """Token bucket per user: `burst` messages at once, refilled at per_minute/60 per second."""
+
+    def __init__(self, per_minute: float, burst: int, max_users: int = 10000):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets = OrderedDict()
+        self.limited = 0
+
+    def allow(self, user_id: str) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(user_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        else:
+            self.limited += 1
+        self._buckets[user_id] = (tokens, now)
+        while len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)
+        return allowed
+
+
+class SingleFlight:
+    """Coalesce identical in-flight calls: followers await the leader's result instead of calling again."""
+
+    def __init__(self):
+        self._calls = {}
+        self.coalesced = 0
+
+    async def do(self, key, call):
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await call()
+        except BaseException as error:
+            future.set_exception(error)
+            # Mark retrieved so an un-awaited failure doesn't log "exception was never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._calls.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"in_flight_keys": len(self._calls), "coalesced": self.coalesced}
@@ -1,231 +1,359 @@
-import sys
-import traceback
-import os
-import json
-import asyncio
-import logging
-from datetime import datetime
-from aiohttp import web, ClientSession, ClientTimeout, TCPConnector
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
-
-from botbuilder.core import (
-    TurnContext,
-    ActivityHandler,
-    ConversationState,
-    MemoryStorage,
-    UserState
-)
-from botbuilder.schema import Activity, ActivityTypes
-from botbuilder.integration.aiohttp import (
-    CloudAdapter,
-    ConfigurationBotFrameworkAuthentication
-)
-
-
-class DefaultConfig:
-    """Bot Configuration"""
-    PORT = 8000
-    APP_ID = os.environ.get("MicrosoftAppId", "")
-    APP_PASSWORD = os.environ.get("MicrosoftAppPassword", "")
-    APP_TYPE = os.environ.get("MicrosoftAppType", "MultiTenant")
-    APP_TENANTID = os.environ.get("MicrosoftAppTenantId", "")
-    AI_TIMEOUT = int(os.environ.get("AI_TIMEOUT_SECONDS", "30"))
-    MAX_RETRIES = int(os.environ.get("MAX_RETRIES", "2"))
-
-
-CONFIG = DefaultConfig()
-HTTP_SESSION = None
-
-MEMORY = MemoryStorage()
-CONVERSATION_STATE = ConversationState(MEMORY)
-USER_STATE = UserState(MEMORY)
-
-BOT_AUTH = ConfigurationBotFrameworkAuthentication(CONFIG)
-ADAPTER = CloudAdapter(BOT_AUTH)
-
-PF_ENDPOINT = os.environ.get("PROMPT_FLOW_ENDPOINT")
-PF_KEY = os.environ.get("PROMPT_FLOW_API_KEY")
-
-
-async def on_error(context: TurnContext, error: Exception):
-    logger.error(f"Unhandled error: {error}", exc_info=True)
-    await context.send_activity("The bot encountered an error or bug.")
-
-
-ADAPTER.on_turn_error = on_error
-
-class MyBot(ActivityHandler):
-    def __init__(self, conversation_state: ConversationState, user_state: UserState):
-        self.conversation_state = conversation_state
-        self.user_state = user_state
-        self.history_accessor = self.conversation_state.create_property("history")
-        self.user_info_accessor = self.user_state.create_property("user_info")
-
-    async def on_message_activity(self, turn_context: TurnContext):
-        user_input = turn_context.activity.text
-
-        if not PF_ENDPOINT:
-            await turn_context.send_activity(
-                "⚠️ Bot Ready. Brain (Prompt Flow) not connected."
-            )
-            return
-
-        await turn_context.send_activity(Activity(type=ActivityTypes.typing))
-
-        user_info = await self.user_info_accessor.get(turn_context, {})
-        if not user_info:
-            user_info = {
-                "name": turn_context.activity.from_property.name or "User",
-                "locale": turn_context.activity.locale or "en-US"
-            }
-            await self.user_info_accessor.set(turn_context, user_info)
-
-        history = await self.history_accessor.get(turn_context, []) or []
-        history.append({"role": "user", "content": user_input})
-        if len(history) > 20:
-            history = history[-20:]
-
-        local_timestamp = turn_context.activity.local_timestamp
-
-        if local_timestamp:
-            user_time_str = local_timestamp.strftime(
-                "%A, %Y-%m-%d %I:%M %p (Offset: %z)"
-            )
-        else:
-            user_time_str = datetime.utcnow().strftime(
-                "%A, %Y-%m-%d %I:%M %p UTC"
-            )
-
-        data = {
-            "chat_input": user_input,
-            "chat_history": history[-10:],
-            "current_time": user_time_str,
-            "user_name": user_info.get("name"),
-            "user_locale": user_info.get("locale")
-        }
-
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {PF_KEY}"
-        }
-
-        timeout = ClientTimeout(total=CONFIG.AI_TIMEOUT)
-
-        try:
-            for attempt in range(CONFIG.MAX_RETRIES):
-                try:
-                    async with HTTP_SESSION.post(
-                        PF_ENDPOINT,
-                        json=data,
-                        headers=headers,
-                        timeout=timeout
-                    ) as response:
-                        if response.status == 200:
-                            result = await response.json()
-                            ai_reply = result.get("chat_output", "")
-
-                            if not ai_reply:
-                                ai_reply = (
-                                    result.get("output") or
-                                    result.get("answer") or
-                                    "I couldn't generate a response."
-                                )
-
-                            history.append({"role": "assistant", "content": ai_reply})
-                            await self.history_accessor.set(turn_context, history)
-
-                            await turn_context.send_activity(ai_reply)
-                            break
-                        elif attempt < CONFIG.MAX_RETRIES - 1:
-                            await asyncio.sleep(1)
-                        else:
-                            await turn_context.send_activity(
-                                f"⚠️ AI service returned status {response.status}"
-                            )
-                            break
-
-                except asyncio.TimeoutError:
-                    if attempt < CONFIG.MAX_RETRIES - 1:
-                        logger.warning(f"AI timeout on attempt {attempt + 1}, retrying...")
-                        await asyncio.sleep(1)
-                    else:
-                        logger.error(f"AI timeout after {CONFIG.MAX_RETRIES} attempts")
-                        await turn_context.send_activity(
-                            "⚠️ AI response timeout. Please try again."
-                        )
-                        break
-                except Exception as e:
-                    if attempt < CONFIG.MAX_RETRIES - 1:
-                        logger.warning(f"AI error on attempt {attempt + 1}: {str(e)[:100]}, retrying...")
-                        await asyncio.sleep(1)
-                    else:
-                        logger.error(f"AI error after {CONFIG.MAX_RETRIES} attempts: {str(e)}")
-                        await turn_context.send_activity(
-                            f"⚠️ Error calling AI: {str(e)[:100]}"
-                        )
-                        break
-        finally:
-            await self.conversation_state.save_changes(turn_context)
-            await self.user_state.save_changes(turn_context)
-
-BOT = MyBot(CONVERSATION_STATE, USER_STATE)
-
-
-async def messages(req: web.Request) -> web.Response:
-    return await ADAPTER.process(req, BOT)
-
-
-async def index(req: web.Request) -> web.Response:
-    return web.Response(
-        text="Bot Service is Running (Robust Parser V2)!",
-        status=200
-    )
-
-
-async def health(req: web.Request) -> web.Response:
-    health_status = {
-        "status": "healthy",
-        "ai_configured": bool(PF_ENDPOINT and PF_KEY),
-        "session_active": HTTP_SESSION is not None and not HTTP_SESSION.closed
-    }
-    return web.json_response(health_status)
-
-
-if __name__ == "__main__":
-    async def init_app():
-        global HTTP_SESSION
-        
-        # Validate required environment variables
-        if not PF_ENDPOINT:
-            logger.warning("PROMPT_FLOW_ENDPOINT not configured")
-        if not PF_KEY:
-            logger.warning("PROMPT_FLOW_API_KEY not configured")
-        if not CONFIG.APP_ID or not CONFIG.APP_PASSWORD:
-            raise ValueError("MicrosoftAppId and MicrosoftAppPassword are required")
-        
-        HTTP_SESSION = ClientSession(
-            connector=TCPConnector(limit=100, limit_per_host=30, ttl_dns_cache=300),
-            timeout=ClientTimeout(total=60)
-        )
-
-        app = web.Application()
-        app.router.add_post("/api/messages", messages)
-        app.router.add_get("/", index)
-        app.router.add_get("/health", health)
-
-        async def on_shutdown(app):
-            global HTTP_SESSION
-            if HTTP_SESSION and not HTTP_SESSION.closed:
-                await HTTP_SESSION.close()
-
-        app.on_shutdown.append(on_shutdown)
-        return app
-
-    try:
-        logger.info(f"--- STARTING CLOUD ADAPTER BOT on port {CONFIG.PORT} ---")
-        web.run_app(init_app(), host="0.0.0.0", port=CONFIG.PORT)
-    except Exception as error:
-        logger.error(f"Startup failed: {error}", exc_info=True)
+import sys
+import traceback
+import os
+import asyncio
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+from aiohttp import web, ClientSession, ClientTimeout, TCPConnector
+
+STARTED = time.monotonic()
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# botbuilder is only imported by bot.py, which load_bot() pulls in after the server is listening
+from admission import AdmissionController, SingleFlight, UserRateLimiter
+from resilience import (CircuitBreaker, CircuitOpenError, FlowCallError, RetryPolicy, StreamInterrupted,
+                        parse_retry_after)
+from metrics import METRICS, inject_trace_headers
+
+
+class DefaultConfig:
+    """Bot Configuration"""
+    PORT = 8000
+    APP_ID = os.environ.get("MicrosoftAppId", "")
+    APP_PASSWORD = os.environ.get("MicrosoftAppPassword", "")
+    APP_TYPE = os.environ.get("MicrosoftAppType", "MultiTenant")
+    APP_TENANTID = os.environ.get("MicrosoftAppTenantId", "")
+    AI_TIMEOUT = int(os.environ.get("AI_TIMEOUT_SECONDS", "30"))
+    MAX_RETRIES = int(os.environ.get("MAX_RETRIES", "2"))
+    AI_DEADLINE_SECONDS = float(os.environ.get("AI_DEADLINE_SECONDS", "45"))
+    RETRY_BACKOFF_BASE = float(os.environ.get("RETRY_BACKOFF_BASE", "0.5"))
+    RETRY_BACKOFF_MAX = float(os.environ.get("RETRY_BACKOFF_MAX", "8"))
+    CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", "30"))
+    STREAMING = os.environ.get("STREAMING_ENABLED", "false").lower() == "true"
+    STREAM_UPDATE_SECONDS = float(os.environ.get("STREAM_UPDATE_SECONDS", "1.0"))
+    # Longest silence between chunks of a streamed answer once it has started
+    STREAM_IDLE_TIMEOUT_SECONDS = float(os.environ.get("STREAM_IDLE_TIMEOUT_SECONDS", "30"))
+    MAX_IN_FLIGHT = int(os.environ.get("MAX_IN_FLIGHT", "30"))
+    MAX_QUEUE = int(os.environ.get("MAX_QUEUE", "100"))
+    QUEUE_TIMEOUT_SECONDS = float(os.environ.get("QUEUE_TIMEOUT_SECONDS", "10"))
+    USER_RATE_PER_MINUTE = float(os.environ.get("USER_RATE_PER_MINUTE", "20"))
+    USER_RATE_BURST = int(os.environ.get("USER_RATE_BURST", "5"))
+    STATE_STORAGE = os.environ.get("STATE_STORAGE", "memory").lower()
+    STATE_DB_PATH = os.environ.get("STATE_DB_PATH", "bot_state.sqlite3")
+    STATE_CACHE_SIZE = int(os.environ.get("STATE_CACHE_SIZE", "1000"))
+    STATE_IDLE_TTL_SECONDS = float(os.environ.get("STATE_IDLE_TTL_SECONDS", str(7 * 24 * 3600)))
+    # Connections to the Prompt Flow endpoint opened before /ready reports ready
+    WARMUP_CONNECTIONS = int(os.environ.get("WARMUP_CONNECTIONS", "2"))
+    WARMUP_TIMEOUT_SECONDS = float(os.environ.get("WARMUP_TIMEOUT_SECONDS", "10"))
+    # Wait between attempts to open the Prompt Flow connections while /ready stays 503
+    WARMUP_RETRY_SECONDS = float(os.environ.get("WARMUP_RETRY_SECONDS", "5"))
+
+
+CONFIG = DefaultConfig()
+HTTP_SESSION = None
+
+# Built by load_bot() (bot.py); None until the warm-up, or the first message, gets there
+ADAPTER = None
+BOT = None
+MEMORY = None
+_BOT_LOCK = threading.Lock()
+
+PF_ENDPOINT = os.environ.get("PROMPT_FLOW_ENDPOINT")
+PF_KEY = os.environ.get("PROMPT_FLOW_API_KEY")
+
+ADMISSION = AdmissionController(CONFIG.MAX_IN_FLIGHT, CONFIG.MAX_QUEUE, CONFIG.QUEUE_TIMEOUT_SECONDS)
+RATE_LIMITER = UserRateLimiter(CONFIG.USER_RATE_PER_MINUTE, CONFIG.USER_RATE_BURST)
+SINGLE_FLIGHT = SingleFlight()
+RETRY_POLICY = RetryPolicy(
+    max_attempts=CONFIG.MAX_RETRIES,
+    deadline_seconds=CONFIG.AI_DEADLINE_SECONDS,
+    backoff_base=CONFIG.RETRY_BACKOFF_BASE,
+    backoff_max=CONFIG.RETRY_BACKOFF_MAX
+)
+CIRCUIT = CircuitBreaker(CONFIG.CIRCUIT_FAILURE_THRESHOLD, CONFIG.CIRCUIT_RESET_SECONDS)
+
+
+class PromptFlowClient:
+    """
+    Proxy to the Prompt Flow endpoint behind admission control, retries and the circuit
+    breaker. Needs no botbuilder, so the load test and warm-up can use it on their own.
+    """
+
+    def __init__(self, endpoint, streaming):
+        self.endpoint = endpoint
+        self.streaming = streaming
+        self.rate_limiter = RATE_LIMITER
+        self.single_flight = SINGLE_FLIGHT
+
+    async def admitted_call(self, turn_context, data):
+        """Run ask_prompt_flow once a concurrency slot is free (raises AdmissionRejected when saturated)."""
+        async with ADMISSION.slot():
+            return await self.ask_prompt_flow(turn_context, data)
+
+    async def ask_prompt_flow(self, turn_context, data):
+        """
+        POST the turn to Prompt Flow, retrying per RETRY_POLICY behind the CIRCUIT breaker.
+        Returns (reply, sent); sent is True when the reply was already streamed to
+        turn_context. Pass turn_context=None to always get a complete JSON reply.
+        Raises FlowCallError with a user-facing message when every attempt fails.
+        """
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {PF_KEY}"
+        }
+        if CONFIG.STREAMING and turn_context is not None:
+            headers["Accept"] = "text/event-stream, application/json"
+        inject_trace_headers(headers)
+
+        deadline = RETRY_POLICY.start()
+        attempt = 0
+
+        while True:
+            try:
+                probe = CIRCUIT.before_call()
+            except CircuitOpenError:
+                METRICS.inc("bot_rejections_total", reason="circuit_open")
+                raise FlowCallError("⚠️ The AI service is temporarily unavailable. Please try again shortly.")
+
+            retry_after = None
+            # The attempt timeout covers the wait for the response to start; after that a
+            # streamed answer may take as long as it needs, as long as chunks keep coming
+            first_byte_timeout = min(CONFIG.AI_TIMEOUT, max(1.0, RETRY_POLICY.remaining(deadline)))
+            read_timeout = ClientTimeout(total=None, sock_read=CONFIG.STREAM_IDLE_TIMEOUT_SECONDS)
+            try:
+                with METRICS.stage("prompt_flow"):
+                    response = await asyncio.wait_for(
+                        HTTP_SESSION.post(PF_ENDPOINT, json=data, headers=headers, timeout=read_timeout),
+                        first_byte_timeout
+                    )
+                    async with response:
+                        METRICS.inc("prompt_flow_responses_total", status=response.status)
+                        if response.status == 200 and response.content_type == "text/event-stream":
+                            from bot import relay_stream
+                            reply = await relay_stream(turn_context, response, CONFIG.STREAM_UPDATE_SECONDS)
+                            CIRCUIT.record_success()
+                            return reply, True
+                        elif response.status == 200:
+                            result = await response.json()
+                            CIRCUIT.record_success()
+                            ai_reply = result.get("chat_output", "")
+
+                            if not ai_reply:
+                                ai_reply = (
+                                    result.get("output") or
+                                    result.get("answer") or
+                                    "I couldn't generate a response."
+                                )
+                            return ai_reply, False
+                        elif not RETRY_POLICY.is_retryable(response.status):
+                            CIRCUIT.release()
+                            logger.error(f"AI service returned non-retryable status {response.status}")
+                            raise FlowCallError(f"⚠️ AI service returned status {response.status}")
+
+                        CIRCUIT.record_failure()
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        failure = f"⚠️ AI service returned status {response.status}"
+                        logger.warning(f"AI status {response.status} on attempt {attempt + 1}")
+
+            except FlowCallError:
+                raise
+            except StreamInterrupted as e:
+                # Part of the answer is already on screen: finished with a note, never retried
+                CIRCUIT.record_failure()
+                METRICS.inc("prompt_flow_stream_interrupted_total")
+                logger.warning(f"AI stream interrupted on attempt {attempt + 1}: {str(e.cause)[:100]}")
+                return e.reply, True
+            except asyncio.TimeoutError:
+                CIRCUIT.record_failure()
+                failure = "⚠️ AI response timeout. Please try again."
+                logger.warning(f"AI timeout on attempt {attempt + 1}")
+            except Exception as e:
+                CIRCUIT.record_failure()
+                failure = f"⚠️ Error calling AI: {str(e)[:100]}"
+                logger.warning(f"AI error on attempt {attempt + 1}: {str(e)[:100]}")
+            finally:
+                # A probe that ended without an outcome (cancelled) must not hold the slot forever
+                CIRCUIT.release(probe)
+
+            delay = RETRY_POLICY.next_delay(attempt, deadline, retry_after)
+            if delay is None:
+                logger.error(f"AI call failed after {attempt + 1} attempts: {failure}")
+                raise FlowCallError(failure)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+FLOW = PromptFlowClient(PF_ENDPOINT, CONFIG.STREAMING)
+
+
+def load_bot():
+    """Import bot.py (botbuilder) and build the adapter and bot, once. Blocking; run it off the event loop."""
+    global ADAPTER, BOT, MEMORY
+    with _BOT_LOCK:
+        if BOT is None:
+            from bot import create_bot
+            ADAPTER, BOT, MEMORY = create_bot(CONFIG, FLOW)
+    return ADAPTER, BOT
+
+
+# Readiness: warm-up step -> seconds it took (None while pending or failed)
+WARMUP = {"bot": None, "prompt_flow_connections": None}
+WARMUP_ERRORS = {}
+READY = False
+
+
+async def warm_prompt_flow_connections():
+    """Open CONFIG.WARMUP_CONNECTIONS pooled connections (DNS + TLS) to the Prompt Flow host."""
+    parts = urlsplit(PF_ENDPOINT)
+    origin = f"{parts.scheme}://{parts.netloc}/"
+    timeout = ClientTimeout(total=CONFIG.WARMUP_TIMEOUT_SECONDS)
+
+    async def probe():
+        # Any status will do; the point is a keep-alive connection left in the pool
+        async with HTTP_SESSION.get(origin, timeout=timeout) as response:
+            await response.read()
+
+    await asyncio.gather(*(probe() for _ in range(max(1, CONFIG.WARMUP_CONNECTIONS))))
+
+
+async def warm_up():
+    """
+    Load the bot, pre-open the Prompt Flow connections, then flip /ready. Until the
+    connections open, /ready stays 503 and they are retried every WARMUP_RETRY_SECONDS.
+    """
+    global READY
+    started = time.monotonic()
+    try:
+        await asyncio.to_thread(load_bot)
+    except Exception as e:
+        # Stay unready; /ready shows why
+        WARMUP_ERRORS["bot"] = str(e)[:200]
+        logger.error(f"Loading the bot failed: {e}", exc_info=True)
+        return
+    WARMUP["bot"] = round(time.monotonic() - started, 3)
+
+    while PF_ENDPOINT:
+        started = time.monotonic()
+        try:
+            await warm_prompt_flow_connections()
+        except Exception as e:
+            # Stay unready (the probe exists to catch an unreachable Prompt Flow) and try again
+            WARMUP_ERRORS["prompt_flow_connections"] = str(e)[:200] or type(e).__name__
+            logger.warning(f"Pre-opening Prompt Flow connections failed, retrying: {e}")
+            await asyncio.sleep(CONFIG.WARMUP_RETRY_SECONDS)
+            continue
+        WARMUP["prompt_flow_connections"] = round(time.monotonic() - started, 3)
+        WARMUP_ERRORS.pop("prompt_flow_connections", None)
+        break
+
+    READY = HTTP_SESSION is not None and not HTTP_SESSION.closed
+    METRICS.observe("startup_seconds", time.monotonic() - STARTED)
+    logger.info(f"Ready {time.monotonic() - STARTED:.2f}s after start: {WARMUP}")
+
+
+async def messages(req: web.Request) -> web.Response:
+    if BOT is None:
+        # A message beat the warm-up; finish loading here (off the event loop)
+        await asyncio.to_thread(load_bot)
+    return await ADAPTER.process(req, BOT)
+
+
+async def index(req: web.Request) -> web.Response:
+    return web.Response(
+        text="Bot Service is Running (Robust Parser V2)!",
+        status=200
+    )
+
+
+async def metrics(req: web.Request) -> web.Response:
+    admission = ADMISSION.stats()
+    circuit = CIRCUIT.stats()
+    gauges = [
+        "# TYPE chatqa_admission_in_flight gauge",
+        f"chatqa_admission_in_flight {admission['in_flight']}",
+        "# TYPE chatqa_admission_queue_depth gauge",
+        f"chatqa_admission_queue_depth {admission['queue_depth']}",
+        "# TYPE chatqa_circuit_open gauge",
+        f"chatqa_circuit_open {int(circuit['state'] != 'closed')}",
+        "# TYPE chatqa_coalesced_total counter",
+        f"chatqa_coalesced_total {SINGLE_FLIGHT.coalesced}",
+    ]
+    return web.Response(
+        text=METRICS.render_prometheus() + "\n".join(gauges) + "\n",
+        content_type="text/plain",
+        headers={"X-Prometheus-Format": "0.0.4"}
+    )
+
+
+async def ready(req: web.Request) -> web.Response:
+    """Readiness probe: 503 until warm_up() has loaded the bot and opened the upstream connections."""
+    return web.json_response({
+        "ready": READY,
+        "seconds_since_start": round(time.monotonic() - STARTED, 3),
+        "warmup_seconds": WARMUP,
+        "warmup_errors": WARMUP_ERRORS,
+    }, status=200 if READY else 503)
+
+
+async def health(req: web.Request) -> web.Response:
+    """Liveness: answers as soon as the server is up, warmed or not."""
+    health_status = {
+        "status": "healthy",
+        "ready": READY,
+        "ai_configured": bool(PF_ENDPOINT and PF_KEY),
+        "session_active": HTTP_SESSION is not None and not HTTP_SESSION.closed,
+        "state_storage": CONFIG.STATE_STORAGE,
+        "admission": ADMISSION.stats(),
+        "coalescing": SINGLE_FLIGHT.stats(),
+        "rate_limited": RATE_LIMITER.limited,
+        "circuit": CIRCUIT.stats()
+    }
+    return web.json_response(health_status)
+
+
+if __name__ == "__main__":
+    async def init_app():
+        global HTTP_SESSION
+        
+        # Validate required environment variables
+        if not PF_ENDPOINT:
+            logger.warning("PROMPT_FLOW_ENDPOINT not configured")
+        if not PF_KEY:
+            logger.warning("PROMPT_FLOW_API_KEY not configured")
+        if not CONFIG.APP_ID or not CONFIG.APP_PASSWORD:
+            raise ValueError("MicrosoftAppId and MicrosoftAppPassword are required")
+        
+        HTTP_SESSION = ClientSession(
+            connector=TCPConnector(limit=100, limit_per_host=30, ttl_dns_cache=300),
+            timeout=ClientTimeout(total=60)
+        )
+
+        app = web.Application()
+        app.router.add_post("/api/messages", messages)
+        app.router.add_get("/", index)
+        app.router.add_get("/health", health)
+        app.router.add_get("/ready", ready)
+        app.router.add_get("/metrics", metrics)
+
+        async def on_startup(app):
+            app["warm_up"] = asyncio.create_task(warm_up())
+
+        async def on_shutdown(app):
+            global HTTP_SESSION
+            if HTTP_SESSION and not HTTP_SESSION.closed:
+                await HTTP_SESSION.close()
+
+        app.on_startup.append(on_startup)
+        app.on_shutdown.append(on_shutdown)
+        return app
+
+    try:
+        logger.info(f"--- STARTING CLOUD ADAPTER BOT on port {CONFIG.PORT} ---")
+        web.run_app(init_app(), host="0.0.0.0", port=CONFIG.PORT)
+    except Exception as error:
+        logger.error(f"Startup failed: {error}", exc_info=True)
         raise
\ No newline at end of file
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+
+from botbuilder.core import (
+    TurnContext,
+    ActivityHandler,
+    ConversationState,
+    MemoryStorage,
+    UserState
+)
+from botbuilder.schema import Activity, ActivityTypes
+from botbuilder.integration.aiohttp import (
+    CloudAdapter,
+    ConfigurationBotFrameworkAuthentication
+)
+from admission import AdmissionRejected
+from metrics import METRICS, new_correlation_id
+from resilience import FlowCallError, StreamInterrupted
+
+# Everything that needs botbuilder lives here; app.py imports this module in the
+# background after the server is listening (botbuilder alone takes ~0.5s to import).
+
+STREAM_INTERRUPTED_NOTE = "\n\n⚠️ The answer was cut off. Please ask again."
+
+logger = logging.getLogger(__name__)
+
+
+async def on_error(context: TurnContext, error: Exception):
+    logger.error(f"Unhandled error: {error}", exc_info=True)
+    await context.send_activity("The bot encountered an error or bug.")
+
+
+async def iter_sse_data(response):
+    """Yield parsed JSON payloads of server-sent events from an aiohttp response."""
+    data_lines = []
+    async for raw_line in response.content:
+        line = raw_line.decode("utf-8").rstrip("\r\n")
+        if line:
+            if line.startswith("data:"):
+                data_lines.append(line[5:].lstrip())
+            continue
+        if data_lines:
+            data = "\n".join(data_lines)
+            data_lines = []
+            if data.strip() == "[DONE]":
+                return
+            yield json.loads(data)
+    if data_lines:
+        yield json.loads("\n".join(data_lines))
+
+
+async def relay_stream(turn_context: TurnContext, response, update_seconds: float) -> str:
+    """
+    Relay a streamed Prompt Flow answer to the channel: send the first delta as a
+    message, then update that message in place at most every update_seconds.
+    Returns the full answer text.
+
+    If the stream fails before anything was sent the error propagates (the call can be
+    retried). If it fails afterwards, the posted message is finished with a note and
+    StreamInterrupted is raised, so the caller doesn't retry and post the answer twice.
+    """
+    reply = ""
+    activity = None
+    last_update = 0.0
+    loop = asyncio.get_running_loop()
+
+    try:
+        async for event in iter_sse_data(response):
+            delta = event.get("chat_output") or event.get("output") or event.get("answer") or ""
+            if not delta:
+                continue
+            reply += delta
+
+            if activity is None:
+                activity = Activity(type=ActivityTypes.message, text=reply)
+                sent = await turn_context.send_activity(activity)
+                activity.id = sent.id if sent else None
+                last_update = loop.time()
+            elif activity.id and loop.time() - last_update >= update_seconds:
+                activity.text = reply
+                await turn_context.update_activity(activity)
+                last_update = loop.time()
+    except Exception as e:
+        if activity is None:
+            raise
+        reply += STREAM_INTERRUPTED_NOTE
+        activity.text = reply
+        if activity.id:
+            await turn_context.update_activity(activity)
+        else:
+            await turn_context.send_activity(STREAM_INTERRUPTED_NOTE.strip())
+        raise StreamInterrupted(reply, e) from e
+
+    if activity is None:
+        reply = "I couldn't generate a response."
+        await turn_context.send_activity(reply)
+    elif activity.text != reply:
+        activity.text = reply
+        if activity.id:
+            await turn_context.update_activity(activity)
+        else:
+            await turn_context.send_activity(reply)
+    return reply
+
+
+class MyBot(ActivityHandler):
+    def __init__(self, conversation_state: ConversationState, user_state: UserState, memory, flow):
+        self.conversation_state = conversation_state
+        self.user_state = user_state
+        self.memory = memory
+        self.flow = flow
+        self.history_accessor = self.conversation_state.create_property("history")
+        self.user_info_accessor = self.user_state.create_property("user_info")
+
+    async def on_message_activity(self, turn_context: TurnContext):
+        new_correlation_id()
+        with METRICS.stage("bot_turn"):
+            await self.handle_message(turn_context)
+
+    async def handle_message(self, turn_context: TurnContext):
+        user_input = turn_context.activity.text
+
+        if not self.flow.endpoint:
+            await turn_context.send_activity(
+                "⚠️ Bot Ready. Brain (Prompt Flow) not connected."
+            )
+            return
+
+        await turn_context.send_activity(Activity(type=ActivityTypes.typing))
+
+        user_info = await self.user_info_accessor.get(turn_context, {})
+        if not user_info:
+            user_info = {
+                "name": turn_context.activity.from_property.name or "User",
+                "locale": turn_context.activity.locale or "en-US"
+            }
+            await self.user_info_accessor.set(turn_context, user_info)
+
+        history = await self.history_accessor.get(turn_context, []) or []
+        history.append({"role": "user", "content": user_input})
+        if len(history) > 20:
+            history = history[-20:]
+
+        local_timestamp = turn_context.activity.local_timestamp
+
+        if local_timestamp:
+            user_time_str = local_timestamp.strftime(
+                "%A, %Y-%m-%d %I:%M %p (Offset: %z)"
+            )
+        else:
+            user_time_str = datetime.utcnow().strftime(
+                "%A, %Y-%m-%d %I:%M %p UTC"
+            )
+
+        data = {
+            "chat_input": user_input,
+            "chat_history": history[-10:],
+            "current_time": user_time_str,
+            "user_name": user_info.get("name"),
+            "user_locale": user_info.get("locale"),
+            # Lets the flow cache a rolling summary of older turns per conversation
+            "conversation_id": turn_context.activity.conversation.id
+        }
+
+        user_id = turn_context.activity.from_property.id or "anonymous"
+
+        try:
+            if not self.flow.rate_limiter.allow(user_id):
+                METRICS.inc("bot_rejections_total", reason="rate_limited")
+                await turn_context.send_activity(
+                    "⚠️ You're sending messages too quickly. Please wait a moment and try again."
+                )
+                return
+
+            if self.flow.streaming:
+                ai_reply, sent = await self.flow.admitted_call(turn_context, data)
+            else:
+                # Identical questions (same input and prior history) share one Prompt Flow call
+                key = json.dumps([user_input.strip().lower(), data["chat_history"][:-1]], sort_keys=True)
+                ai_reply, sent = await self.flow.single_flight.do(key, lambda: self.flow.admitted_call(None, data))
+
+            history.append({"role": "assistant", "content": ai_reply})
+            await self.history_accessor.set(turn_context, history)
+
+            if not sent:
+                await turn_context.send_activity(ai_reply)
+
+        except AdmissionRejected:
+            METRICS.inc("bot_rejections_total", reason="busy")
+            await turn_context.send_activity(
+                "⚠️ The assistant is busy right now. Please try again in a few seconds."
+            )
+        except FlowCallError as e:
+            await turn_context.send_activity(str(e))
+        finally:
+            await self.conversation_state.save_changes(turn_context)
+            await self.user_state.save_changes(turn_context)
+            if hasattr(self.memory, "flush"):
+                await self.memory.flush()
+
+
+def create_bot(config, flow):
+    """Build the bot state storage, CloudAdapter and MyBot. Returns (adapter, bot, memory)."""
+    if config.STATE_STORAGE == "sqlite":
+        from conversation_storage import SqliteStorage
+        memory = SqliteStorage(
+            config.STATE_DB_PATH,
+            cache_size=config.STATE_CACHE_SIZE,
+            idle_ttl_seconds=config.STATE_IDLE_TTL_SECONDS
+        )
+    else:
+        memory = MemoryStorage()
+    conversation_state = ConversationState(memory)
+    user_state = UserState(memory)
+
+    adapter = CloudAdapter(ConfigurationBotFrameworkAuthentication(config))
+    adapter.on_turn_error = on_error
+    return adapter, MyBot(conversation_state, user_state, memory, flow), memory
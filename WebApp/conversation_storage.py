@@ -0,0 +1,164 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from typing import Dict, List
+
+from botbuilder.core import Storage
+
+
+class SqliteStorage(Storage):
+    """
+    Bot state storage backed by SQLite, with a bounded in-process LRU cache.
+
+    - read() is served from the cache when possible, otherwise from SQLite.
+    - write() only updates the cache and marks keys dirty; flush() persists every
+      dirty key in one transaction, so ConversationState and UserState saves in the
+      same turn cost a single write.
+    - Idle conversations are evicted from the cache (LRU) and expired from disk
+      after idle_ttl_seconds without a write.
+    - SQLite is only touched from worker threads (asyncio.to_thread) under _db_lock.
+      The cache lock is never held during I/O, so write()/delete() on the event loop
+      wait microseconds at most.
+    """
+
+    def __init__(self, path: str, cache_size: int = 1000, idle_ttl_seconds: float = 7 * 24 * 3600,
+                 sweep_interval_seconds: float = 300):
+        super().__init__()
+        self.cache_size = cache_size
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self._cache = OrderedDict()
+        self._dirty = {}
+        self._deleted = set()
+        self._lock = threading.Lock()     # cache, dirty and deleted keys; in-memory work only
+        self._db_lock = threading.Lock()  # the connection; taken before _lock, never on the event loop
+        self._last_sweep = time.time()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bot_state ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, e_tag INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bot_state_updated_at ON bot_state (updated_at)")
+        self._conn.commit()
+
+    async def read(self, keys: List[str]) -> Dict[str, object]:
+        if not keys:
+            raise Exception("Keys are required when reading")
+        return await asyncio.to_thread(self._read, keys)
+
+    async def write(self, changes: Dict[str, object]):
+        if changes is None:
+            raise Exception("Changes are required when writing")
+        with self._lock:
+            for key, value in changes.items():
+                if hasattr(value, "__dict__") and not isinstance(value, dict):
+                    value = vars(value)
+                value = deepcopy(value)
+                self._deleted.discard(key)
+                self._dirty[key] = value
+                self._remember(key, value)
+
+    async def delete(self, keys: List[str]):
+        with self._lock:
+            for key in keys:
+                self._cache.pop(key, None)
+                self._dirty.pop(key, None)
+                self._deleted.add(key)
+
+    async def flush(self):
+        """Persist all pending writes/deletes in one transaction (call once per turn)."""
+        await asyncio.to_thread(self._flush)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"cached": len(self._cache), "dirty": len(self._dirty)}
+
+    def _remember(self, key, value):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        self._evict()
+
+    def _evict(self):
+        while len(self._cache) > self.cache_size:
+            # Evict the least recently used key that has no unsaved changes
+            for candidate in self._cache:
+                if candidate not in self._dirty:
+                    del self._cache[candidate]
+                    break
+            else:
+                break
+
+    def _read(self, keys):
+        result = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                if key in self._deleted:
+                    continue
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    result[key] = deepcopy(self._cache[key])
+                else:
+                    missing.append(key)
+        if not missing:
+            return result
+
+        cutoff = time.time() - self.idle_ttl_seconds
+        placeholders = ",".join("?" for _ in missing)
+        with self._db_lock:
+            rows = self._conn.execute(
+                f"SELECT key, value FROM bot_state WHERE key IN ({placeholders}) AND updated_at >= ?",
+                (*missing, cutoff)
+            ).fetchall()
+        with self._lock:
+            for key, value in rows:
+                if key in self._deleted:
+                    continue
+                if key in self._cache:
+                    # Written while we were reading; the cached value is newer than the row
+                    result[key] = deepcopy(self._cache[key])
+                    continue
+                value = json.loads(value)
+                self._remember(key, value)
+                result[key] = deepcopy(value)
+        return result
+
+    def _flush(self):
+        # _db_lock first, so concurrent flushes hit the disk in the order they took their changes
+        with self._db_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+                deleted, self._deleted = self._deleted, set()
+            now = time.time()
+            try:
+                with self._conn:
+                    if deleted:
+                        self._conn.executemany("DELETE FROM bot_state WHERE key = ?", [(key,) for key in deleted])
+                    if dirty:
+                        self._conn.executemany(
+                            "INSERT INTO bot_state (key, value, e_tag, updated_at) VALUES (?, ?, 1, ?)"
+                            " ON CONFLICT(key) DO UPDATE SET value = excluded.value,"
+                            " e_tag = bot_state.e_tag + 1, updated_at = excluded.updated_at",
+                            [(key, json.dumps(value, default=str), now) for key, value in dirty.items()]
+                        )
+                    if now - self._last_sweep >= self.sweep_interval_seconds:
+                        self._conn.execute("DELETE FROM bot_state WHERE updated_at < ?", (now - self.idle_ttl_seconds,))
+                        self._last_sweep = now
+            except Exception:
+                # Keep the changes for the next flush unless newer ones replaced them meanwhile
+                with self._lock:
+                    for key, value in dirty.items():
+                        if key not in self._dirty and key not in self._deleted:
+                            self._dirty[key] = value
+                    for key in deleted:
+                        if key not in self._dirty:
+                            self._deleted.add(key)
+                raise
+        with self._lock:
+            self._evict()
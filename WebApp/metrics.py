@@ -0,0 +1,210 @@
+# Lightweight latency/counter registry with Prometheus text export and optional
+# OpenTelemetry spans. The bot and the flow tools deploy separately, so each ships
+# this same file (WebApp/metrics.py, Flow2WithCleaner/metrics.py) and both export the
+# same metrics format; tests/test_metrics.py fails if the two copies drift apart.
+import contextvars
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    from opentelemetry import propagate as _otel_propagate
+    from opentelemetry import trace as _otel_trace
+    _TRACER = _otel_trace.get_tracer("azurechatqa")
+except ImportError:
+    _otel_propagate = None
+    _TRACER = None
+
+# Prometheus histogram buckets (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Recent samples kept per histogram for p50/p95/p99
+RESERVOIR_SIZE = 2048
+# Serve METRICS at http://0.0.0.0:<port>/metrics from a background thread (0 = off).
+# The bot has its own /metrics route; this is how the Prompt Flow process is scraped.
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+
+CORRELATION_HEADER = "x-correlation-id"
+CORRELATION_ID = contextvars.ContextVar("correlation_id", default=None)
+
+
+def new_correlation_id():
+    """Start a new correlation id for the current request/turn and return it."""
+    correlation_id = uuid.uuid4().hex
+    CORRELATION_ID.set(correlation_id)
+    return correlation_id
+
+
+def inject_trace_headers(headers):
+    """Add the correlation id and, with OpenTelemetry installed, W3C trace context to outgoing headers."""
+    correlation_id = CORRELATION_ID.get()
+    if correlation_id:
+        headers[CORRELATION_HEADER] = correlation_id
+    if _otel_propagate is not None:
+        _otel_propagate.inject(headers)
+    return headers
+
+
+def _label_key(labels):
+    # Label values are strings on export; converting here also keeps int and str values sortable
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class _Histogram:
+    def __init__(self):
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.recent.append(value)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+
+    def percentiles(self):
+        values = sorted(self.recent)
+        return {"p50": _percentile(values, 0.50), "p95": _percentile(values, 0.95), "p99": _percentile(values, 0.99)}
+
+
+class MetricsRegistry:
+    """Process-wide counters and latency histograms, keyed by metric name and labels."""
+
+    def __init__(self, prefix="chatqa"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            key = (name, _label_key(labels))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        with self._lock:
+            key = (name, _label_key(labels))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def stage(self, stage, **attributes):
+        """Time a pipeline stage into <prefix>_stage_seconds{stage=...} and, if available, an OTel span."""
+        started = time.perf_counter()
+        span_context = _TRACER.start_as_current_span(stage) if _TRACER is not None else None
+        span = span_context.__enter__() if span_context is not None else None
+        if span is not None:
+            correlation_id = CORRELATION_ID.get()
+            if correlation_id:
+                span.set_attribute("correlation_id", correlation_id)
+            for key, value in attributes.items():
+                span.set_attribute(key, value)
+        try:
+            yield span
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - started, stage=stage)
+            if span_context is not None:
+                span_context.__exit__(None, None, None)
+
+    def snapshot(self):
+        """Counters plus count/mean/p50/p95/p99 per histogram, for JSON endpoints and reports."""
+        with self._lock:
+            counters = {f"{name}{_format_labels(labels)}": value for (name, labels), value in self._counters.items()}
+            histograms = {}
+            for (name, labels), histogram in self._histograms.items():
+                summary = {"count": histogram.count,
+                           "mean": histogram.total / histogram.count if histogram.count else 0.0}
+                summary.update(histogram.percentiles())
+                histograms[f"{name}{_format_labels(labels)}"] = summary
+        return {"counters": counters, "histograms": histograms}
+
+    def render_prometheus(self):
+        """Prometheus text exposition format (0.0.4)."""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {metric} counter")
+                for (counter_name, labels), value in sorted(self._counters.items()):
+                    if counter_name == name:
+                        lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+            for name in sorted({name for name, _ in self._histograms}):
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for (histogram_name, labels), histogram in sorted(self._histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    for bound, count in zip(LATENCY_BUCKETS, histogram.bucket_counts):
+                        lines.append(f"{metric}_bucket{_format_labels(labels, {'le': bound})} {count}")
+                    lines.append(f"{metric}_bucket{_format_labels(labels, {'le': '+Inf'})} {histogram.count}")
+                    lines.append(f"{metric}_sum{_format_labels(labels)} {histogram.total}")
+                    lines.append(f"{metric}_count{_format_labels(labels)} {histogram.count}")
+
+                lines.append(f"# TYPE {metric}_quantile gauge")
+                for (histogram_name, labels), histogram in sorted(self._histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    for quantile, value in histogram.percentiles().items():
+                        lines.append(f"{metric}_quantile{_format_labels(labels, {'quantile': quantile})} {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+def start_metrics_server(port, registry=METRICS):
+    """
+    Serve registry.render_prometheus() at /metrics on port in a daemon thread.
+    Returns the server, or None if the port is taken (e.g. by another worker process).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    except OSError:
+        registry.inc("errors_total", stage="metrics_server")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+if METRICS_PORT:
+    start_metrics_server(METRICS_PORT)
@@ -0,0 +1,150 @@
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is open and calls should fail fast."""
+
+
+class FlowCallError(Exception):
+    """Prompt Flow call failed after retries; the message is safe to show the user."""
+
+
+class StreamInterrupted(Exception):
+    """A streamed answer broke off after part of it was already shown; it must not be retried."""
+
+    def __init__(self, reply, cause):
+        super().__init__(f"stream interrupted: {cause}")
+        self.reply = reply
+        self.cause = cause
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Decides whether and how long to wait before retrying a call.
+    Retries only retryable statuses and transport errors, waits the full Retry-After
+    when the server sends one (otherwise a full-jitter exponential backoff capped at
+    backoff_max), and gives up rather than sleep past the overall deadline.
+    """
+
+    def __init__(self, max_attempts: int, deadline_seconds: float, backoff_base: float = 0.5,
+                 backoff_max: float = 8.0, retryable_statuses=RETRYABLE_STATUSES):
+        self.max_attempts = max(1, max_attempts)
+        self.deadline_seconds = deadline_seconds
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retryable_statuses = set(retryable_statuses)
+
+    def start(self):
+        """Begin a call; returns the monotonic deadline for all of its attempts."""
+        return time.monotonic() + self.deadline_seconds
+
+    @staticmethod
+    def remaining(deadline):
+        return deadline - time.monotonic()
+
+    def is_retryable(self, status):
+        return status in self.retryable_statuses
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait after the given (0-based) failed attempt."""
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def next_delay(self, attempt, deadline, retry_after=None):
+        """Delay before the next attempt, or None if we are out of attempts or time."""
+        if attempt + 1 >= self.max_attempts:
+            return None
+        delay = self.delay(attempt, retry_after)
+        # Leave at least a second for the next attempt itself
+        if self.remaining(deadline) - delay < 1.0:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker.
+    Opens after failure_threshold consecutive failures, fails fast for reset_seconds,
+    then lets a single probe through; the probe's outcome closes or re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._probes = 0
+
+    def before_call(self):
+        """
+        Raise CircuitOpenError if the call should not be attempted. Returns a probe
+        handle when this call is the half-open probe (else None); pass it to release()
+        in a finally so a cancelled probe gives its slot back.
+        """
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                self.rejected += 1
+                raise CircuitOpenError("circuit open")
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError("circuit half-open, probe in flight")
+            self._probe_in_flight = True
+            self._probes += 1
+            return self._probes
+        return None
+
+    def record_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self, probe=None):
+        """
+        End a call that was neither a success nor a failure (e.g. a 4xx) without changing
+        state. With a probe handle, only frees the slot if that probe still holds it.
+        """
+        if probe is None or probe == self._probes:
+            self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        retry_in = None
+        if self.state == "open":
+            retry_in = round(max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at)), 1)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "rejected": self.rejected,
+            "retry_in_seconds": retry_in,
+        }
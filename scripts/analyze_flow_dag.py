@@ -0,0 +1,170 @@
+"""
+Offline analyzer for a Prompt Flow flow.dag.yaml.
+
+Builds the node dependency graph, flags nodes whose output nothing consumes,
+and reports the critical path and which nodes can run in parallel.
+
+Usage:
+    python scripts/analyze_flow_dag.py Flow2WithCleaner/flow.dag.yaml
+    python scripts/analyze_flow_dag.py Flow2WithCleaner/flow.dag.yaml --cost final_answer=4000
+
+Exits with status 1 when unreferenced nodes are found, so it can gate CI.
+"""
+import argparse
+import re
+import sys
+
+import yaml
+
+REFERENCE_PATTERN = re.compile(r"\$\{([A-Za-z0-9_]+)\.")
+
+# Rough per-node latency estimates (ms) by node type, used when no --cost is given
+DEFAULT_COSTS = {
+    "python": 50,
+    "prompt": 5,
+    "llm": 3000,
+}
+
+
+def _references(value):
+    """Collect node names referenced as ${node.xxx} anywhere inside value."""
+    found = set()
+    if isinstance(value, str):
+        found.update(REFERENCE_PATTERN.findall(value))
+    elif isinstance(value, dict):
+        for item in value.values():
+            found |= _references(item)
+    elif isinstance(value, list):
+        for item in value:
+            found |= _references(item)
+    return found
+
+
+def _resolve_node(node, flow):
+    """Return the effective node definition (default variant for use_variants nodes)."""
+    if not node.get("use_variants"):
+        return node
+    variants = flow.get("node_variants", {}).get(node["name"], {})
+    variant_id = variants.get("default_variant_id")
+    return variants.get("variants", {}).get(variant_id, {}).get("node", node)
+
+
+def _node_cost(node, costs):
+    """Latency estimate for a node: explicit override, LLM-tool heuristic, or type default."""
+    name = node["name"]
+    if name in costs:
+        return costs[name]
+    path = node.get("source", {}).get("path", "")
+    if "gpt" in path or "chat" in path:
+        return DEFAULT_COSTS["llm"]
+    return DEFAULT_COSTS.get(node.get("type"), DEFAULT_COSTS["python"])
+
+
+def build_graph(flow):
+    """Return ({node: set(dependencies)}, {node: effective definition})."""
+    definitions = {}
+    dependencies = {}
+    for node in flow.get("nodes", []):
+        resolved = dict(_resolve_node(node, flow), name=node["name"])
+        definitions[node["name"]] = resolved
+        dependencies[node["name"]] = {
+            ref for ref in _references(resolved.get("inputs", {}))
+            if ref != "inputs"
+        }
+    return dependencies, definitions
+
+
+def find_unreferenced(flow, dependencies):
+    """Nodes that do not (transitively) feed any flow output."""
+    live = set()
+    pending = [ref for ref in _references(flow.get("outputs", {})) if ref in dependencies]
+    while pending:
+        name = pending.pop()
+        if name in live:
+            continue
+        live.add(name)
+        pending.extend(dependencies[name] - live)
+    return sorted(set(dependencies) - live)
+
+
+def parallel_stages(dependencies):
+    """Group nodes into stages; every node in a stage can run concurrently."""
+    remaining = dict(dependencies)
+    done = set()
+    stages = []
+    while remaining:
+        ready = sorted(name for name, deps in remaining.items() if deps <= done)
+        if not ready:
+            raise ValueError(f"Cycle detected among nodes: {sorted(remaining)}")
+        stages.append(ready)
+        done.update(ready)
+        for name in ready:
+            del remaining[name]
+    return stages
+
+
+def critical_path(dependencies, definitions, costs):
+    """Return (total_cost_ms, [node, ...]) for the most expensive dependency chain."""
+    best = {}
+    for stage in parallel_stages(dependencies):
+        for name in stage:
+            cost = _node_cost(definitions[name], costs)
+            prev = max((best[dep] for dep in dependencies[name]), default=(0, []))
+            best[name] = (prev[0] + cost, prev[1] + [name])
+    return max(best.values(), default=(0, []))
+
+
+def analyze(flow, costs=None):
+    """Analyze a parsed flow definition and return a report dict."""
+    costs = costs or {}
+    dependencies, definitions = build_graph(flow)
+    total, path = critical_path(dependencies, definitions, costs)
+    return {
+        "dependencies": {name: sorted(deps) for name, deps in dependencies.items()},
+        "unreferenced": find_unreferenced(flow, dependencies),
+        "stages": parallel_stages(dependencies),
+        "critical_path": path,
+        "critical_path_ms": total,
+    }
+
+
+def _parse_costs(pairs):
+    costs = {}
+    for pair in pairs:
+        name, _, value = pair.partition("=")
+        costs[name] = float(value)
+    return costs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dag", help="Path to flow.dag.yaml")
+    parser.add_argument("--cost", action="append", default=[], metavar="NODE=MS",
+                        help="Override the latency estimate for a node")
+    args = parser.parse_args(argv)
+
+    with open(args.dag, encoding="utf-8") as f:
+        flow = yaml.safe_load(f)
+
+    report = analyze(flow, _parse_costs(args.cost))
+
+    print("Dependencies:")
+    for name, deps in report["dependencies"].items():
+        print(f"  {name} <- {', '.join(deps) or '(flow inputs)'}")
+
+    print("\nParallel stages:")
+    for i, stage in enumerate(report["stages"], 1):
+        print(f"  {i}. {', '.join(stage)}")
+
+    print(f"\nCritical path (~{report['critical_path_ms']:.0f} ms): {' -> '.join(report['critical_path'])}")
+
+    if report["unreferenced"]:
+        print(f"\nUnreferenced nodes (output never consumed): {', '.join(report['unreferenced'])}")
+        return 1
+
+    print("\nNo unreferenced nodes.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+Concurrent batch evaluation of the flow across prompt variants.
+
+Runs the flow's Python tools directly (rewrite_and_lookup -> generate_prompt_context and
+compact_history -> Prompt_variants template -> call_gpt5 -> clean_json_response) in a thread
+pool instead of one question at a time through `pf run`. Retrieval and history compaction run
+once per question and are shared by every variant, since they do not depend on the prompt.
+
+- Requests and tokens sent to the model are held under --rpm / --tpm (60 s sliding window).
+- Each finished (question, variant) is appended to --out as one JSON line; rerunning with the
+  same --out skips what is already there, so interrupted runs resume where they stopped.
+- Per-variant latency, token and cost summaries are printed and written to --summary.
+
+Usage:
+    python scripts/batch_eval.py Flow2WithCleaner/samples.json --out eval.jsonl
+    python scripts/batch_eval.py questions.jsonl --variants variant_0,variant_2 --workers 16 \
+        --rpm 300 --tpm 200000 --input-price-per-1k 0.00025 --output-price-per-1k 0.002
+
+Needs the same environment variables as the flow (AZURE_OPENAI_*, AZURE_SEARCH_*).
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FLOW_DIR = os.path.join(REPO_ROOT, "Flow2WithCleaner")
+sys.path.insert(0, FLOW_DIR)
+
+from llm_router import Backend, LLMRouter  # noqa: E402
+
+VARIANT_TEMPLATES = {
+    "variant_0": "Prompt_variants.jinja2",
+    "variant_1": "Prompt_variants__variant_1.jinja2",
+    "variant_2": "Prompt_variants__variant_2.jinja2",
+}
+
+
+class RateBudget:
+    """
+    Blocking requests-per-minute and tokens-per-minute budget, kept in an llm_router.Backend's
+    60 s reservation window. acquire() reserves an estimated token count and returns the
+    reservation; settle() corrects that reservation to the actual usage.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.backend = Backend("batch-eval", "", None, tpm=tpm, rpm=rpm)
+        self._router = LLMRouter([self.backend])
+        # Waiters take turns, so two threads can't both claim the last of the window
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        with self._lock:
+            while True:
+                _, wait = self._router.pick(tokens)
+                if wait <= 0:
+                    return self._router.start(self.backend, tokens)
+                time.sleep(wait)
+
+    def settle(self, reservation, actual_tokens: int):
+        self._router.settle(self.backend, reservation, actual_tokens)
+        # Only closes the in-flight count: call_gpt5's own router handles failed calls
+        self._router.finish(self.backend, 200)
+
+
+def load_records(path):
+    """samples.json-style list or JSONL of {chat_input, chat_history?, id?}."""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith(".jsonl"):
+        records = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        records = json.loads(text)
+    return [dict(record, id=str(record.get("id", i))) for i, record in enumerate(records) if record.get("chat_input")]
+
+
+def load_checkpoint(path, retry_errors):
+    """(id, variant) pairs already in the results file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partial last line from an interrupted run
+            if retry_errors and row.get("error"):
+                continue
+            done.add((row["id"], row["variant"]))
+    return done
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(path, input_price, output_price):
+    """Per-variant summary over every row in the results file (including earlier runs)."""
+    rows = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # Keep the latest row per (id, variant) so retried errors aren't double counted
+            rows[(row["id"], row["variant"])] = row
+
+    summary = {}
+    for variant in sorted({variant for _, variant in rows}):
+        variant_rows = [row for (_, v), row in rows.items() if v == variant]
+        ok = [row for row in variant_rows if not row["error"]]
+        latencies = sorted(row["latency_ms"] for row in ok)
+        input_tokens = sum(row["input_tokens"] for row in ok)
+        output_tokens = sum(row["output_tokens"] for row in ok)
+        summary[variant] = {
+            "questions": len(variant_rows),
+            "errors": len(variant_rows) - len(ok),
+            "latency_ms": {"mean": sum(latencies) / len(latencies) if latencies else 0.0,
+                           "p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95)},
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "avg_tokens": (input_tokens + output_tokens) / len(ok) if ok else 0.0,
+            "cost": input_tokens / 1000 * input_price + output_tokens / 1000 * output_price,
+        }
+    return summary
+
+
+def print_summary(summary):
+    print(f"\n{'variant':<11} {'n':>6} {'err':>5} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'in tok':>10} {'out tok':>10} {'cost':>10}")
+    for variant, s in summary.items():
+        print(f"{variant:<11} {s['questions']:>6} {s['errors']:>5} {s['latency_ms']['mean']:>9.0f} "
+              f"{s['latency_ms']['p50']:>9.0f} {s['latency_ms']['p95']:>9.0f} "
+              f"{s['input_tokens']:>10} {s['output_tokens']:>10} {s['cost']:>10.4f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", help="samples.json-style JSON list or JSONL file")
+    parser.add_argument("--out", default="eval_results.jsonl", help="Results/checkpoint JSONL (appended)")
+    parser.add_argument("--summary", help="Summary JSON path (default: <out>.summary.json)")
+    parser.add_argument("--variants", default=",".join(VARIANT_TEMPLATES))
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute budget (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="Tokens per minute budget (0 = unlimited)")
+    parser.add_argument("--output-token-estimate", type=int, default=800,
+                        help="Output tokens reserved per call until the real usage is known")
+    parser.add_argument("--rewrite-mode", default="speculative", choices=("speculative", "serial", "off"))
+    parser.add_argument("--input-price-per-1k", type=float, default=0.0)
+    parser.add_argument("--output-price-per-1k", type=float, default=0.0)
+    parser.add_argument("--retry-errors", action="store_true", help="Rerun rows that failed last time")
+    parser.add_argument("--limit", type=int, help="Only evaluate the first N questions")
+    args = parser.parse_args(argv)
+
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    unknown = [v for v in variants if v not in VARIANT_TEMPLATES]
+    if unknown:
+        parser.error(f"unknown variants: {', '.join(unknown)}")
+
+    sys.path.insert(0, FLOW_DIR)
+    from jinja2 import Template
+    from clean_response import clean_json_response
+    from compact_history import HISTORY_TOKEN_BUDGET, compact_history
+    from context_builder import count_tokens
+    from generate_prompt_context import generate_prompt_context
+    from gpt5_chat import call_gpt5
+    from history import normalize_history
+    from rewrite_and_lookup import rewrite_and_lookup
+
+    templates = {}
+    for variant in variants:
+        with open(os.path.join(FLOW_DIR, VARIANT_TEMPLATES[variant]), encoding="utf-8") as f:
+            templates[variant] = Template(f.read())
+
+    records = load_records(args.inputs)[:args.limit]
+    done = load_checkpoint(args.out, args.retry_errors)
+    pending = [(record, [v for v in variants if (record["id"], v) not in done]) for record in records]
+    pending = [(record, todo) for record, todo in pending if todo]
+    print(f"{len(records)} questions x {len(variants)} variants, {sum(len(t) for _, t in pending)} calls to run "
+          f"({len(done)} already in {args.out})")
+
+    budget = RateBudget(args.rpm, args.tpm)
+    write_lock = threading.Lock()
+
+    def budgeted(tokens, step, *step_args):
+        """Run a flow step that calls the model inside the budget (tokens=0: it won't call it)."""
+        if not tokens:
+            return step(*step_args)
+        reservation = budget.acquire(tokens)
+        try:
+            return step(*step_args)
+        finally:
+            budget.settle(reservation, tokens)
+
+    def evaluate(record, todo, out):
+        chat_input = record["chat_input"]
+        history = normalize_history(record.get("chat_history"))
+        history_tokens = count_tokens(" ".join(t["inputs"]["chat_input"] + " " + t["outputs"]["output"]
+                                               for t in history))
+        started = time.perf_counter()
+        # The rewrite is an LLM call too; keep it inside the budget
+        rewrite_tokens = history_tokens + count_tokens(chat_input) + 100 if history and args.rewrite_mode != "off" else 0
+        context = generate_prompt_context(budgeted(rewrite_tokens, rewrite_and_lookup, chat_input, history,
+                                                   args.rewrite_mode))
+        retrieval_ms = (time.perf_counter() - started) * 1000
+
+        # The variants get the history the flow gives them: compact_history's output, which folds
+        # older turns into a summary (a model call) once the history is over its budget
+        summary_tokens = history_tokens + args.output_token_estimate if history_tokens > HISTORY_TOKEN_BUDGET else 0
+        prompt_history = budgeted(summary_tokens, compact_history, history,
+                                  record.get("conversation_id") or f"batch-eval:{record['id']}")
+
+        for variant in todo:
+            prompt = templates[variant].render(contexts=context, chat_history=prompt_history, chat_input=chat_input)
+            reservation = budget.acquire(count_tokens(prompt) + count_tokens(chat_input) + args.output_token_estimate)
+            result = call_gpt5(prompt, chat_input)
+            input_tokens = result.usage.get("input_tokens", 0)
+            output_tokens = result.usage.get("output_tokens", 0)
+            budget.settle(reservation, input_tokens + output_tokens if not result.error else reservation[1])
+            row = {
+                "id": record["id"],
+                "variant": variant,
+                "chat_input": chat_input,
+                "answer": clean_json_response(result.text) if not result.error else "",
+                "error": result.text if result.error else None,
+                "latency_ms": result.latency_ms,
+                "retrieval_ms": retrieval_ms,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "model": result.model,
+                "response_id": result.response_id,
+            }
+            with write_lock:
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                out.flush()
+        return len(todo)
+
+    if os.path.exists(args.out) and os.path.getsize(args.out):
+        with open(args.out, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")  # terminate a partial line left by an interrupted run
+
+    completed = 0
+    total = sum(len(todo) for _, todo in pending)
+    started = time.perf_counter()
+    with open(args.out, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(evaluate, record, todo, out) for record, todo in pending]
+        try:
+            for future in as_completed(futures):
+                completed += future.result()
+                print(f"\r{completed}/{total} calls, {time.perf_counter() - started:.0f}s", end="", flush=True)
+        except KeyboardInterrupt:
+            print("\nInterrupted; finished rows are checkpointed, rerun to resume.")
+            pool.shutdown(wait=False, cancel_futures=True)
+            return 130
+
+    if not os.path.exists(args.out):
+        return 0
+    summary = summarize(args.out, args.input_price_per_1k, args.output_price_per_1k)
+    print_summary(summary)
+    summary_path = args.summary or os.path.splitext(args.out)[0] + ".summary.json"
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print(f"\nSummary written to {summary_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
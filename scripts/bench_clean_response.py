@@ -0,0 +1,119 @@
+"""
+Micro-benchmark for clean_response.clean_json_response.
+
+Times the current implementation on representative GPT-5 payloads (small,
+multi-part, very large; JSON and Python-repr forms) and, when a baseline is
+given, the same payloads against an older copy of clean_response.py.
+
+Usage:
+    python scripts/bench_clean_response.py
+    python scripts/bench_clean_response.py --baseline-rev <git-rev>
+    python scripts/bench_clean_response.py --baseline /path/to/old_clean_response.py
+"""
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import timeit
+import types
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FLOW_DIR = os.path.join(REPO_ROOT, "Flow2WithCleaner")
+MODULE_PATH = "Flow2WithCleaner/clean_response.py"
+
+
+def _ensure_promptflow():
+    """Let the tool modules import without promptflow installed (the decorator is a no-op here)."""
+    try:
+        import promptflow.core  # noqa: F401
+    except ImportError:
+        core = types.ModuleType("promptflow.core")
+        core.tool = lambda func: func
+        sys.modules.setdefault("promptflow", types.ModuleType("promptflow"))
+        sys.modules["promptflow.core"] = core
+
+
+def _load(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _message(text):
+    return {
+        "type": "message",
+        "role": "assistant",
+        "status": "completed",
+        "content": [{"type": "output_text", "text": text, "annotations": []}],
+    }
+
+
+def build_payloads():
+    """Representative raw responses keyed by name."""
+    reasoning = {"type": "reasoning", "id": "rs_1", "summary": []}
+    small = [reasoning, _message("Store 1234 is open 9am-9pm Monday to Saturday. (Source: store directory)")]
+    multi = [reasoning] + [_message(f"Paragraph {i}: " + "lorem ipsum dolor sit amet " * 20) for i in range(8)]
+    large_text = "The quick brown fox jumps over the lazy dog. " * 20000
+    large = [reasoning, _message(large_text)]
+    return {
+        "plain_text": "Store 1234 is open 9am-9pm.",
+        "small_json": json.dumps({"id": "resp_1", "output": small}),
+        "small_repr": str(small),
+        "multipart_repr": str(multi),
+        "chat_completions": json.dumps({"choices": [{"message": {"role": "assistant", "content": "Hi there"}}]}),
+        "large_json": json.dumps({"id": "resp_2", "output": large}),
+        "large_repr": str(large),
+    }
+
+
+def bench(func, payload, number):
+    """Best-of-3 mean microseconds per call."""
+    runs = timeit.repeat(lambda: func(payload), number=number, repeat=3)
+    return min(runs) / number * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", help="Path to an older clean_response.py to compare against")
+    parser.add_argument("--baseline-rev", help="Git revision to load the baseline clean_response.py from")
+    parser.add_argument("--number", type=int, default=200, help="Calls per timing run (large payloads use 1/20th)")
+    args = parser.parse_args(argv)
+
+    _ensure_promptflow()
+    sys.path.insert(0, FLOW_DIR)
+    current = _load(os.path.join(FLOW_DIR, "clean_response.py"), "clean_response_current")
+
+    baseline = None
+    if args.baseline_rev:
+        source = subprocess.check_output(["git", "show", f"{args.baseline_rev}:{MODULE_PATH}"], cwd=REPO_ROOT)
+        with tempfile.NamedTemporaryFile("wb", suffix=".py", delete=False) as f:
+            f.write(source)
+        args.baseline = f.name
+    if args.baseline:
+        baseline = _load(args.baseline, "clean_response_baseline")
+
+    header = f"{'payload':<18} {'size':>10} {'shape':<18} {'current us':>12}"
+    if baseline:
+        header += f" {'baseline us':>12} {'speedup':>8}"
+    print(header)
+
+    for name, payload in build_payloads().items():
+        number = max(1, args.number // 20) if len(payload) > 100000 else args.number
+        _, shape = current.extract_text(payload)
+        current_us = bench(current.clean_json_response, payload, number)
+        line = f"{name:<18} {len(payload):>10} {shape:<18} {current_us:>12.1f}"
+        if baseline:
+            if baseline.clean_json_response(payload) != current.clean_json_response(payload):
+                line += "  (outputs differ!)"
+            baseline_us = bench(baseline.clean_json_response, payload, number)
+            line += f" {baseline_us:>12.1f} {baseline_us / current_us:>7.1f}x"
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
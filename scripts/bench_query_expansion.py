@@ -0,0 +1,92 @@
+"""
+Benchmark for query expansion (query_expansion.QueryExpander) at large table sizes.
+
+Builds synthetic synonym tables (state codes, product codes, multi-word district
+names) of 1k-50k entries and times table build and per-query expansion against
+the original `if abbrev in query` loop from tool_lookup.expand_query.
+
+Usage:
+    python scripts/bench_query_expansion.py
+    python scripts/bench_query_expansion.py --sizes 10000,100000 --queries 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import timeit
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "Flow2WithCleaner"))
+
+from query_expansion import QueryExpander  # noqa: E402
+
+STATES = {"TX": "Texas", "CA": "California", "IN": "Indiana", "NY": "New York", "FL": "Florida", "CO": "Colorado"}
+
+
+def legacy_expand(query, mapping):
+    """The original loop: substring match, first hit only."""
+    expanded_query = query
+    for abbrev, full_name in mapping.items():
+        if abbrev in query:
+            expanded_query = query.replace(abbrev, f"{abbrev} {full_name}")
+            break
+    return expanded_query
+
+
+def build_table(size, rng):
+    table = dict(STATES)
+    while len(table) < size:
+        kind = rng.random()
+        if kind < 0.5:
+            table[f"SKU{rng.randrange(10 ** 6):06d}"] = [f"product {rng.randrange(10 ** 4)}"]
+        elif kind < 0.8:
+            table[f"district {rng.randrange(10 ** 5)}"] = [f"district {rng.choice('ABCDEFGH')}{rng.randrange(100)}"]
+        else:
+            table[f"term{rng.randrange(10 ** 6)}"] = [f"synonym{rng.randrange(10 ** 6)}", f"alt{rng.randrange(10 ** 6)}"]
+    return table
+
+
+def build_queries(table, count, rng):
+    keys = list(table)
+    templates = [
+        "What are the hours for stores in {} this weekend?",
+        "Who is the leader for {} and what is the return policy?",
+        "Is {} in stock INSIDE the Austin TX store?",
+        "how do I process a refund when the register is down",
+    ]
+    return [rng.choice(templates).format(rng.choice(keys)) for _ in range(count)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,50000")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    print(f"{'entries':>8} {'build ms':>9} {'trie us/q':>10} {'legacy us/q':>12} {'speedup':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        rng = random.Random(args.seed)
+        table = build_table(size, rng)
+        queries = build_queries(table, args.queries, rng)
+        legacy_table = {k: v[0] if isinstance(v, list) else v for k, v in table.items()}
+
+        started = time.perf_counter()
+        expander = QueryExpander(table)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        trie = min(timeit.repeat(lambda: [expander.expand(q) for q in queries], number=1, repeat=5))
+        legacy = min(timeit.repeat(lambda: [legacy_expand(q, legacy_table) for q in queries], number=1, repeat=3))
+        per_trie = trie / len(queries) * 1e6
+        per_legacy = legacy / len(queries) * 1e6
+        print(f"{size:>8} {build_ms:>9.1f} {per_trie:>10.1f} {per_legacy:>12.1f} {per_legacy / per_trie:>7.1f}x")
+
+    sample = "Is SKU000042 in stock INSIDE the Austin TX store in IN?"
+    expander = QueryExpander(STATES)
+    print(f"\nexample:  {sample}\n  trie:   {expander.expand(sample)}\n  legacy: {legacy_expand(sample, STATES)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Startup benchmark: import time of the bot web app and the flow tools, and time to ready.
+
+Each target module is imported in a fresh interpreter with `python -X importtime`.
+The report gives the median cumulative import time over --runs and the heaviest
+imports underneath it, so lazy-loading regressions (a heavy SDK creeping back
+into module scope) show up as numbers. --serve also starts WebApp/app.py
+and times how long /health and /ready take to answer 200.
+
+Usage:
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --runs 7 --top 8 --json-out startup.json
+    python scripts/bench_startup.py --compare startup.json   # exit 1 on a regression
+    python scripts/bench_startup.py --serve
+
+Targets that fail to import (missing requirements) are reported and skipped.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGETS = [
+    ("WebApp", "app"),
+    ("WebApp", "bot"),
+    ("Flow2WithCleaner", "tool_lookup"),
+    ("Flow2WithCleaner", "tool_lookup_async"),
+    ("Flow2WithCleaner", "gpt5_chat"),
+    ("Flow2WithCleaner", "rewrite_and_lookup"),
+    ("Flow2WithCleaner", "compact_history"),
+]
+
+
+def parse_importtime(stderr):
+    """[(name, depth, self_us, cumulative_us)] from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def measure(directory, module):
+    """Import module once in a fresh interpreter; returns (total_ms, {child: ms}) or raises RuntimeError."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.path.join(REPO_ROOT, directory),
+                                                                    os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=os.path.join(REPO_ROOT, directory), env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    rows = parse_importtime(result.stderr)
+    # The target is the last depth-0 row with its name; its children are the depth-1 rows just above it
+    end = max(i for i, row in enumerate(rows) if row[0] == module and row[1] == 0)
+    start = max([i + 1 for i, row in enumerate(rows[:end]) if row[1] == 0], default=0)
+    children = {name: cumulative / 1000 for name, depth, _, cumulative in rows[start:end] if depth == 1}
+    # Modules imported earlier by site/the interpreter don't show up; only count what this import pays for
+    return rows[end][3] / 1000, children
+
+
+def bench_imports(targets, runs, top):
+    report = {}
+    for directory, module in targets:
+        key = f"{directory}/{module}"
+        totals, children = [], {}
+        try:
+            for _ in range(runs):
+                total, run_children = measure(directory, module)
+                totals.append(total)
+                for name, ms in run_children.items():
+                    children.setdefault(name, []).append(ms)
+        except RuntimeError as e:
+            report[key] = {"error": str(e)}
+            continue
+        heaviest = sorted(((name, statistics.median(values)) for name, values in children.items()),
+                          key=lambda item: -item[1])[:top]
+        report[key] = {"median_ms": statistics.median(totals), "min_ms": min(totals),
+                       "heaviest_ms": dict(heaviest)}
+    return report
+
+
+def bench_serve(timeout):
+    """Start WebApp/app.py and time /health and /ready. Needs port 8000 free."""
+    env = dict(os.environ)
+    env.setdefault("MicrosoftAppId", "bench-app-id")
+    env.setdefault("MicrosoftAppPassword", "bench-password")
+    started = time.monotonic()
+    process = subprocess.Popen([sys.executable, "app.py"], cwd=os.path.join(REPO_ROOT, "WebApp"), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    times = {}
+    try:
+        while len(times) < 2 and time.monotonic() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"app.py exited with {process.returncode}")
+            for path in ("/health", "/ready"):
+                if path in times:
+                    continue
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:8000{path}", timeout=1) as response:
+                        if response.status == 200:
+                            times[path] = time.monotonic() - started
+                except (urllib.error.URLError, ConnectionError):
+                    pass
+            time.sleep(0.02)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return {"live_seconds": times.get("/health"), "ready_seconds": times.get("/ready")}
+
+
+def compare(report, baseline, tolerance):
+    """Targets whose median import time grew by more than tolerance (and at least 10ms)."""
+    regressions = []
+    for key, result in report.get("imports", {}).items():
+        before = baseline.get("imports", {}).get(key, {})
+        if "median_ms" not in result or "median_ms" not in before:
+            continue
+        if result["median_ms"] > before["median_ms"] * (1 + tolerance) and result["median_ms"] - before["median_ms"] > 10:
+            regressions.append(f"{key} {before['median_ms']:.0f} -> {result['median_ms']:.0f} ms")
+    return regressions
+
+
+def print_report(report):
+    print(f"{'target':<36} {'median ms':>10} {'min ms':>8}  heaviest imports")
+    for key, result in report["imports"].items():
+        if "error" in result:
+            print(f"{key:<36} {'-':>10} {'-':>8}  failed: {result['error']}")
+            continue
+        heaviest = ", ".join(f"{name} {ms:.0f}" for name, ms in result["heaviest_ms"].items())
+        print(f"{key:<36} {result['median_ms']:>10.1f} {result['min_ms']:>8.1f}  {heaviest}")
+    if "serve" in report:
+        serve = report["serve"]
+        print(f"\napp.py: /health after {serve['live_seconds'] or float('nan'):.2f}s, "
+              f"/ready after {serve['ready_seconds'] or float('nan'):.2f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per target")
+    parser.add_argument("--top", type=int, default=5, help="Heaviest direct imports to list per target")
+    parser.add_argument("--target", action="append", help="directory/module to measure (repeatable), e.g. WebApp/app")
+    parser.add_argument("--serve", action="store_true", help="Also time /health and /ready of WebApp/app.py")
+    parser.add_argument("--serve-timeout", type=float, default=60)
+    parser.add_argument("--json-out", help="Write the report as JSON")
+    parser.add_argument("--compare", help="Previous --json-out report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression fraction for --compare")
+    args = parser.parse_args(argv)
+
+    targets = [tuple(target.split("/", 1)) for target in args.target] if args.target else TARGETS
+    report = {"python": sys.version.split()[0], "imports": bench_imports(targets, args.runs, args.top)}
+    if args.serve:
+        report["serve"] = bench_serve(args.serve_timeout)
+    print_report(report)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS: " + "; ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
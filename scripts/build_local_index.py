@@ -0,0 +1,50 @@
+"""
+Build the local hybrid retrieval index used when SEARCH_BACKEND=local.
+
+Reads a directory of documents (.txt/.md are chunked, .json/.jsonl hold records such as
+store directory entries) and writes docs.jsonl, a BM25 inverted index and, with numpy
+installed, a memory-mappable vector matrix as a new build under <out>/builds/, then
+points <out>/CURRENT at it; running flows switch to it on their next query.
+
+Usage:
+    python scripts/build_local_index.py data/ --out Flow2WithCleaner/local_index
+    python scripts/build_local_index.py data/ --out local_index --dims 0        # BM25 only
+    python scripts/build_local_index.py data/ --out local_index --query "hours in Austin TX"
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Flow2WithCleaner"))
+
+from local_index import LocalIndex, build_index  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source_dir")
+    parser.add_argument("--out", default="local_index", help="Index directory (set LOCAL_INDEX_DIR to this)")
+    parser.add_argument("--dims", type=int, default=256, help="Vector dimensions (0 = BM25 only)")
+    parser.add_argument("--query", action="append", help="Run a query against the new index (repeatable)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    manifest = build_index(args.source_dir, args.out, args.dims)
+    print(f"Indexed {manifest['documents']} documents into {args.out} in {time.perf_counter() - started:.2f}s "
+          f"(vectors: {manifest['embedder'] or 'none'})")
+
+    if args.query:
+        index = LocalIndex(args.out)
+        for query in args.query:
+            started = time.perf_counter()
+            hits = index.search(query, top=5)
+            print(f"\n{query!r}: {len(hits)} hits in {(time.perf_counter() - started) * 1000:.2f} ms")
+            for hit in hits:
+                label = hit.get("Title") or hit.get("storeId") or hit.get("City") or ""
+                print(f"  {hit['@search.score']:.4f}  {label}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Load test for WebApp/conversation_storage.SqliteStorage.
+
+Simulates bot turns for many distinct conversations (read conversation + user
+state, append to history, write both, flush once) and samples process RSS, to
+show that memory stays flat once the LRU cache is full.
+
+Usage:
+    python scripts/load_test_conversation_storage.py --conversations 100000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "WebApp"))
+
+from conversation_storage import SqliteStorage  # noqa: E402
+
+
+def rss_mb():
+    """Resident set size of this process in MB (Linux /proc, falls back to ru_maxrss)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(conversations, cache_size, turns, samples, db_path):
+    storage = SqliteStorage(db_path, cache_size=cache_size)
+    sample_every = max(1, conversations // samples)
+    started = time.perf_counter()
+    baseline = None
+
+    print(f"{'conversations':>14} {'rss MB':>8} {'cached':>8} {'turns/s':>9}")
+    for i in range(conversations):
+        conversation_key = f"msteams/conversations/conv-{i}/"
+        user_key = f"msteams/users/user-{i}/"
+        for turn in range(turns):
+            state = await storage.read([conversation_key, user_key])
+            conversation = state.get(conversation_key, {"history": []})
+            user = state.get(user_key, {"user_info": {"name": f"User {i}", "locale": "en-US"}})
+            conversation["history"] = (conversation["history"] + [
+                {"role": "user", "content": f"What are the hours for store {i}? turn {turn}"},
+                {"role": "assistant", "content": "Store hours are 9am-9pm Monday to Saturday. " * 3},
+            ])[-20:]
+            await storage.write({conversation_key: conversation, user_key: user})
+            await storage.flush()
+
+        if (i + 1) % sample_every == 0:
+            rss = rss_mb()
+            if baseline is None:
+                baseline = rss
+            rate = (i + 1) * turns / (time.perf_counter() - started)
+            print(f"{i + 1:>14} {rss:>8.1f} {storage.stats()['cached']:>8} {rate:>9.0f}")
+
+    growth = rss_mb() - (baseline or 0)
+    print(f"\nRSS growth after first sample: {growth:+.1f} MB (cache bounded at {cache_size} keys)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=100000)
+    parser.add_argument("--turns", type=int, default=1, help="Turns per conversation")
+    parser.add_argument("--cache-size", type=int, default=1000)
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument("--db", help="SQLite path (default: a temporary file)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db or os.path.join(tmp, "bot_state.sqlite3")
+        asyncio.run(run(args.conversations, args.cache_size, args.turns, args.samples, db_path))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
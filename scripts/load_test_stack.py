@@ -0,0 +1,428 @@
+"""
+Offline end-to-end load test for the bot proxy and the flow tools.
+
+Starts local stubs for Azure AI Search, the Azure OpenAI Responses API and the
+Prompt Flow endpoint, points the flow tools and WebApp/app.py at them, and then
+sends concurrent multi-turn conversations, seeded from samples.json / JSONL files,
+through the bot's turn handler (MyBot on a botbuilder TestAdapter). Every turn
+goes through bot state, history, rate limiting, coalescing and the Prompt Flow
+proxy (admission control, retries, circuit breaker), as in production.
+
+In the default "tools" mode the Prompt Flow stub runs every node of the flow's
+default variant against the Search/OpenAI stubs: rewrite + lookup and
+compact_history in parallel, then context, prompt, GPT-5 and clean. The
+per-stage breakdown covers both sides. "stub" mode answers from the Prompt Flow
+stub directly to load only the bot.
+
+Usage:
+    python scripts/load_test_stack.py --requests 500 --concurrency 20
+    python scripts/load_test_stack.py --turns 8   # longer conversations: more rewrites and history summaries
+    python scripts/load_test_stack.py --llm-latency-ms 800 --error-rate 0.05 --json-out run.json
+    python scripts/load_test_stack.py --compare run.json   # exit 1 on a p95/throughput regression
+    python scripts/load_test_stack.py --llm-backends 3 --backend-tpm 200000   # exercise the LLM router
+
+Requires the Flow2WithCleaner and WebApp requirements to be installed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, web
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FLOW_DIR = os.path.join(REPO_ROOT, "Flow2WithCleaner")
+WEBAPP_DIR = os.path.join(REPO_ROOT, "WebApp")
+DEFAULT_SEED_FILE = os.path.join(FLOW_DIR, "samples.json")
+
+FALLBACK_QUESTIONS = [
+    "What are the store hours in Austin, TX?",
+    "Who is the store leader for store 1234?",
+    "What is the return policy for opened items?",
+    "Which district is store 0456 in?",
+]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def load_questions(paths):
+    """Questions from samples.json-style lists and JSONL files (chat_input, question or title fields)."""
+    questions = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        if path.endswith(".jsonl"):
+            records = [json.loads(line) for line in text.splitlines() if line.strip()]
+        else:
+            records = json.loads(text)
+            records = records if isinstance(records, list) else [records]
+        for record in records:
+            question = record.get("chat_input") or record.get("question") or record.get("title")
+            if question:
+                questions.append(question)
+    return questions or list(FALLBACK_QUESTIONS)
+
+
+class StubBehaviour:
+    """Latency / error / payload settings shared by the stubs."""
+
+    def __init__(self, args, rng):
+        self.args = args
+        self.rng = rng
+
+    async def delay(self, mean_ms):
+        if mean_ms > 0:
+            jitter = self.args.latency_jitter
+            await asyncio.sleep(max(0.0, self.rng.uniform(mean_ms * (1 - jitter), mean_ms * (1 + jitter))) / 1000)
+
+    def maybe_error(self):
+        """Return an error response for a fraction of calls, else None."""
+        if self.rng.random() < self.args.error_rate:
+            if self.rng.random() < 0.5:
+                return web.json_response({"error": "throttled"}, status=429, headers={"Retry-After": "0"})
+            return web.json_response({"error": "unavailable"}, status=503)
+        return None
+
+
+def build_search_stub(behaviour):
+    async def search(request):
+        if request.path.endswith("/$count"):
+            # Document count, used by the flow's connection warm-up (FLOW_WARMUP)
+            return web.Response(text=str(behaviour.args.docs), content_type="text/plain")
+        await behaviour.delay(behaviour.args.search_latency_ms)
+        error = behaviour.maybe_error()
+        if error is not None:
+            return error
+        chunk = "Store policy and directory text. " * max(1, behaviour.args.doc_chars // 33)
+        docs = [
+            {"@search.score": round(10 - i * 0.5, 2), "Title": f"Document {i}", "chunk": f"[{i}] {chunk}"}
+            for i in range(behaviour.args.docs)
+        ]
+        return web.json_response({"value": docs})
+
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", search)
+    return app
+
+
+def build_openai_stub(behaviour, tpm=0):
+    """Responses API stub; with tpm set it enforces a per-minute token quota like Azure OpenAI."""
+    window = []  # (timestamp, tokens)
+
+    async def responses(request):
+        body = await request.json()
+        prompt_chars = sum(len(item.get("content", "")) for item in body.get("input", []))
+        answer = ("Stub answer based on the provided context. " * max(1, behaviour.args.answer_chars // 43)).strip()
+        tokens = (prompt_chars + len(answer)) // 4
+        headers = {}
+        if tpm:
+            now = time.monotonic()
+            window[:] = [entry for entry in window if now - entry[0] < 60]
+            used = sum(entry[1] for entry in window)
+            if used + tokens > tpm:
+                retry_ms = int(((window[0][0] if window else now) + 60 - now) * 1000)
+                return web.json_response({"error": "quota exceeded"}, status=429,
+                                         headers={"retry-after-ms": str(retry_ms), "x-ratelimit-remaining-tokens": "0"})
+            window.append((now, tokens))
+            headers = {"x-ratelimit-remaining-tokens": str(tpm - used - tokens),
+                       "x-ratelimit-reset-tokens": f"{int(window[0][0] + 60 - now)}s"}
+
+        await behaviour.delay(behaviour.args.llm_latency_ms)
+        error = behaviour.maybe_error()
+        if error is not None:
+            return error
+        return web.json_response({
+            "id": f"resp_{behaviour.rng.randrange(1 << 30)}",
+            "model": body.get("model"),
+            "output": [{"type": "message", "role": "assistant",
+                        "content": [{"type": "output_text", "text": answer, "annotations": []}]}],
+            "output_text": answer,
+            "usage": {"input_tokens": prompt_chars // 4, "output_tokens": len(answer) // 4,
+                      "total_tokens": tokens},
+        }, headers=headers)
+
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", responses)
+    return app
+
+
+def build_flow_stub(behaviour, run_flow):
+    async def score(request):
+        body = await request.json()
+        if run_flow is None:
+            await behaviour.delay(behaviour.args.flow_latency_ms)
+            error = behaviour.maybe_error()
+            if error is not None:
+                return error
+            return web.json_response({"chat_output": f"Stub flow answer to: {body.get('chat_input')}"})
+        loop = asyncio.get_running_loop()
+        answer = await loop.run_in_executor(None, run_flow, body)
+        return web.json_response({"chat_output": answer})
+
+    app = web.Application()
+    app.router.add_post("/score", score)
+    return app
+
+
+async def start_stub(app):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def load_flow_runner():
+    """
+    Import the flow tools (after the env points at the stubs) and return run_flow(inputs),
+    which runs the nodes of flow.dag.yaml with the default prompt variant.
+    """
+    sys.path.insert(0, FLOW_DIR)
+    from jinja2 import Template
+    from cached_chat import cached_chat_with_gpt5
+    from clean_response import clean_json_response
+    from compact_history import compact_chat_history
+    from generate_prompt_context import generate_prompt_context
+    from metrics import METRICS
+    from rewrite_and_lookup import rewrite_and_lookup
+
+    with open(os.path.join(FLOW_DIR, "Prompt_variants.jinja2"), encoding="utf-8") as f:
+        template = Template(f.read())
+    # Prompt Flow runs independent nodes concurrently
+    executor = ThreadPoolExecutor(max_workers=32)
+
+    def run_flow(inputs):
+        chat_input = inputs.get("chat_input", "")
+        chat_history = inputs.get("chat_history", [])
+        compacted = executor.submit(compact_chat_history, chat_history, inputs.get("conversation_id", ""))
+        search_result = rewrite_and_lookup(chat_input, chat_history, "speculative")
+        context = generate_prompt_context(search_result)
+        with METRICS.stage("prompt_render"):
+            prompt = template.render(contexts=context, chat_history=compacted.result(), chat_input=chat_input)
+        raw = cached_chat_with_gpt5(prompt, chat_input, context)
+        return clean_json_response(raw)
+
+    return run_flow
+
+
+def conversation_adapter(bot, index):
+    """A TestAdapter carrying one user's conversation with the bot."""
+    from botbuilder.core.adapters import TestAdapter
+    from botbuilder.schema import ChannelAccount, ConversationAccount, ConversationReference
+
+    reference = ConversationReference(
+        channel_id="loadtest",
+        service_url="https://loadtest.invalid",
+        user=ChannelAccount(id=f"load-user-{index}", name=f"Load User {index}"),
+        bot=ChannelAccount(id="bot", name="Bot"),
+        conversation=ConversationAccount(id=f"load-conversation-{index}"),
+    )
+    return TestAdapter(bot.on_turn, reference)
+
+
+async def drive(bot, questions, args, rng):
+    """
+    Send args.requests turns through the bot, as conversations of args.turns turns each,
+    with at most args.concurrency turns in flight. Warning replies count as errors.
+    """
+    latencies, errors = [], {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    conversations = (args.requests + args.turns - 1) // args.turns
+
+    async def conversation(index):
+        adapter = conversation_adapter(bot, index)
+        turns = min(args.turns, args.requests - index * args.turns)
+        for question in [rng.choice(questions) for _ in range(turns)]:
+            async with semaphore:
+                adapter.activity_buffer.clear()
+                started = time.perf_counter()
+                await adapter.send(question)
+                elapsed = time.perf_counter() - started
+            replies = [a.text for a in adapter.activity_buffer if a.type == "message"]
+            reply = replies[-1] if replies else ""
+            if reply.startswith("⚠️"):
+                errors[reply[:60]] = errors.get(reply[:60], 0) + 1
+            else:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(conversation(i) for i in range(conversations)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    behaviour = StubBehaviour(args, rng)
+    runners = []
+
+    search_runner, search_url = await start_stub(build_search_stub(behaviour))
+    openai_urls = []
+    for _ in range(args.llm_backends):
+        openai_runner, openai_url = await start_stub(build_openai_stub(behaviour, args.backend_tpm))
+        runners.append(openai_runner)
+        openai_urls.append(openai_url)
+    runners.append(search_runner)
+
+    # Point the flow tools at the stubs before they are imported
+    os.environ.update({
+        "AZURE_SEARCH_ENDPOINT": search_url,
+        "AZURE_SEARCH_KEY": "stub-key",
+        "AZURE_SEARCH_INDEX_NAME": "stub-index",
+        "AZURE_OPENAI_ENDPOINT": openai_urls[0],
+        "AZURE_OPENAI_API_KEY": "stub-key",
+        "AZURE_OPENAI_BACKOFF_MAX": "0.2",
+    })
+    if args.llm_backends > 1 or args.backend_tpm:
+        os.environ["LLM_BACKENDS"] = json.dumps([
+            {"endpoint": url, "deployment": f"stub-{i}", "api_key": "stub-key", "tpm": args.backend_tpm}
+            for i, url in enumerate(openai_urls)
+        ])
+    if not args.caches:
+        os.environ["RESPONSE_CACHE_BACKEND"] = "off"
+        os.environ["RETRIEVAL_CACHE_TTL_SECONDS"] = "0"
+
+    run_flow = load_flow_runner() if args.flow_mode == "tools" else None
+    flow_runner, flow_url = await start_stub(build_flow_stub(behaviour, run_flow))
+    runners.append(flow_runner)
+
+    os.environ.update({
+        "PROMPT_FLOW_ENDPOINT": f"{flow_url}/score",
+        "PROMPT_FLOW_API_KEY": "stub-key",
+        "MAX_IN_FLIGHT": str(args.concurrency),
+        "USER_RATE_PER_MINUTE": "0",
+    })
+    sys.path.insert(0, WEBAPP_DIR)
+    import app as app_module
+    from metrics import METRICS
+
+    # The bot as production builds it (state storage, MyBot); TestAdapter replaces the channel
+    _, bot = app_module.load_bot()
+
+    app_module.HTTP_SESSION = ClientSession(
+        connector=TCPConnector(limit=100, limit_per_host=30, ttl_dns_cache=300),
+        timeout=ClientTimeout(total=60)
+    )
+    try:
+        if args.seed_file:
+            questions = load_questions(args.seed_file)
+        else:
+            # samples.json holds a single question; identical turns would all coalesce in the bot
+            questions = load_questions([DEFAULT_SEED_FILE]) + FALLBACK_QUESTIONS
+        latencies, errors, wall = await drive(bot, questions, args, rng)
+    finally:
+        await app_module.HTTP_SESSION.close()
+        for runner in runners:
+            await runner.cleanup()
+
+    latencies.sort()
+    snapshot = METRICS.snapshot()
+    backends = {
+        key[key.index("{"):]: value
+        for key, value in snapshot["counters"].items()
+        if key.startswith("llm_backend_requests_total")
+    }
+    stages = {
+        key.split('"')[1]: value
+        for key, value in snapshot["histograms"].items()
+        if key.startswith("stage_seconds")
+    }
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("json_out", "compare")},
+        "requests": args.requests,
+        "conversations": (args.requests + args.turns - 1) // args.turns,
+        "succeeded": len(latencies),
+        "coalesced": app_module.SINGLE_FLIGHT.coalesced,
+        "errors": errors,
+        "wall_seconds": wall,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "latency_ms": {name: percentile(latencies, q) * 1000
+                       for name, q in (("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99))},
+        "stages_ms": {stage: {name: summary[name] * 1000 for name in ("mean", "p50", "p95", "p99")}
+                      | {"count": summary["count"]}
+                      for stage, summary in sorted(stages.items())},
+        "llm_backends": dict(sorted(backends.items())),
+        "flow_warmup": dict(sys.modules["warmup"].WARMUP_STATUS) if "warmup" in sys.modules else {},
+    }
+
+
+def print_report(report):
+    print(f"requests={report['requests']} conversations={report['conversations']} ok={report['succeeded']} wall={report['wall_seconds']:.2f}s "
+          f"throughput={report['throughput_rps']:.1f} req/s coalesced={report['coalesced']}")
+    print("latency ms: " + "  ".join(f"{k}={v:.1f}" for k, v in report["latency_ms"].items()))
+    if report["errors"]:
+        print("errors: " + ", ".join(f"{k}: {v}" for k, v in report["errors"].items()))
+    print(f"\n{'stage':<14} {'count':>7} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for stage, summary in report["stages_ms"].items():
+        print(f"{stage:<14} {summary['count']:>7} {summary['mean']:>9.1f} {summary['p50']:>9.1f} "
+              f"{summary['p95']:>9.1f} {summary['p99']:>9.1f}")
+    if report.get("flow_warmup"):
+        print("\nflow warm-up: " + ", ".join(f"{name} {status}" for name, status in report["flow_warmup"].items()))
+    if report.get("llm_backends"):
+        print("\nLLM backend requests:")
+        for labels, count in report["llm_backends"].items():
+            print(f"  {labels} {count}")
+
+
+def compare(report, baseline, tolerance):
+    """Return a list of regressions versus a previous --json-out report."""
+    regressions = []
+    if report["latency_ms"]["p95"] > baseline["latency_ms"]["p95"] * (1 + tolerance):
+        regressions.append(f"p95 {baseline['latency_ms']['p95']:.1f} -> {report['latency_ms']['p95']:.1f} ms")
+    if report["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        regressions.append(f"throughput {baseline['throughput_rps']:.1f} -> {report['throughput_rps']:.1f} req/s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Bot turns in total")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per conversation (follow-ups get rewritten and compacted)")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--flow-mode", choices=("tools", "stub"), default="tools")
+    parser.add_argument("--seed-file", action="append", help="samples.json-style JSON or JSONL (repeatable)")
+    parser.add_argument("--seed", type=int, default=1234, help="Random seed for traffic and stub behaviour")
+    parser.add_argument("--search-latency-ms", type=float, default=40)
+    parser.add_argument("--llm-latency-ms", type=float, default=600)
+    parser.add_argument("--flow-latency-ms", type=float, default=700, help="Prompt Flow stub latency in stub mode")
+    parser.add_argument("--latency-jitter", type=float, default=0.3, help="+/- fraction around the mean latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub calls answering 429/503")
+    parser.add_argument("--docs", type=int, default=10, help="Search hits per query")
+    parser.add_argument("--doc-chars", type=int, default=1500, help="Characters per search hit")
+    parser.add_argument("--answer-chars", type=int, default=600, help="Characters per LLM answer")
+    parser.add_argument("--llm-backends", type=int, default=1, help="OpenAI stubs to route across (LLM_BACKENDS)")
+    parser.add_argument("--backend-tpm", type=int, default=0, help="Per-stub tokens-per-minute quota (0 = unlimited)")
+    parser.add_argument("--caches", action="store_true", help="Keep the response/retrieval caches enabled")
+    parser.add_argument("--json-out", help="Write the report as JSON")
+    parser.add_argument("--compare", help="Previous --json-out report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression fraction for --compare")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSION: " + "; ".join(regressions))
+            return 1
+        print("\nNo regression versus baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The flow and the web app are flat module directories (deployed separately), not packages
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("Flow2WithCleaner", "WebApp"):
+    path = os.path.join(REPO_ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
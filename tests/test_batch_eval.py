@@ -0,0 +1,81 @@
+"""
+scripts/batch_eval.py: the request/token budget, and prompts rendered with the same
+compacted history the flow's prompt variants get.
+"""
+import importlib.util
+import json
+import os
+
+import pytest
+
+import compact_history
+import gpt5_chat
+import rewrite_and_lookup
+from gpt5_chat import ChatResult
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts", "batch_eval.py")
+
+
+@pytest.fixture(scope="module")
+def batch_eval():
+    spec = importlib.util.spec_from_file_location("batch_eval", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class _Waited(Exception):
+    pass
+
+
+def test_settle_replaces_the_estimate(batch_eval):
+    budget = batch_eval.RateBudget(rpm=0, tpm=1000)
+    first, second = budget.acquire(400), budget.acquire(400)
+
+    budget.settle(second, 50)
+    budget.settle(first, 400)
+
+    stats = budget.backend.stats(first[0])
+    assert stats["tokens_last_minute"] == 450
+    assert stats["in_flight"] == 0
+
+
+def test_acquire_waits_for_the_window(batch_eval, monkeypatch):
+    def sleep(seconds):
+        raise _Waited(seconds)
+
+    monkeypatch.setattr(batch_eval.time, "sleep", sleep)
+    budget = batch_eval.RateBudget(rpm=0, tpm=1000)
+    budget.settle(budget.acquire(900), 900)
+
+    # A request larger than the whole budget still goes through on an empty window
+    assert batch_eval.RateBudget(rpm=0, tpm=1000).acquire(5000)[1] == 5000
+    with pytest.raises(_Waited) as waited:
+        budget.acquire(200)
+    assert 59 < waited.value.args[0] <= 60
+
+
+def test_variants_get_the_compacted_history(batch_eval, monkeypatch, tmp_path):
+    compacted, prompts = [], []
+
+    def fake_compact_history(chat_history, conversation_id=""):
+        compacted.append((len(chat_history), conversation_id))
+        return [{"inputs": {"chat_input": compact_history.SUMMARY_LABEL}, "outputs": {"output": "the summary"}}]
+
+    def call_gpt5(system_prompt, user_input):
+        prompts.append(system_prompt)
+        return ChatResult(text="answer", usage={"input_tokens": 10, "output_tokens": 5})
+
+    monkeypatch.setattr(compact_history, "compact_history", fake_compact_history)
+    monkeypatch.setattr(gpt5_chat, "call_gpt5", call_gpt5)
+    monkeypatch.setattr(rewrite_and_lookup, "rewrite_and_lookup", lambda query, history, mode: "retrieved context")
+    history = [{"role": "user", "content": "raw question"}, {"role": "assistant", "content": "raw answer"}]
+    inputs = tmp_path / "questions.json"
+    inputs.write_text(json.dumps([{"id": "q1", "chat_input": "and on Sunday?", "chat_history": history}]),
+                      encoding="utf-8")
+
+    status = batch_eval.main([str(inputs), "--out", str(tmp_path / "eval.jsonl"), "--variants", "variant_1"])
+
+    assert status == 0
+    assert compacted == [(1, "batch-eval:q1")]
+    assert "the summary" in prompts[0] and "raw answer" not in prompts[0]
@@ -0,0 +1,91 @@
+"""
+compact_history (Flow2WithCleaner/compact_history.py): history within the token budget
+as a rolling summary plus recent turns, with one model call per turn that scrolls out.
+"""
+import pytest
+
+import compact_history
+import context_builder
+from gpt5_chat import ChatResult
+from response_cache import MemoryCacheBackend
+
+
+@pytest.fixture
+def model(monkeypatch):
+    # ~4 characters per token, so budgets don't depend on whether tiktoken is installed
+    monkeypatch.setattr(context_builder, "_ENCODING", None)
+    monkeypatch.setattr(context_builder, "_ENCODING_LOADED", True)
+    monkeypatch.setattr(compact_history, "_SUMMARIES", MemoryCacheBackend(max_entries=10))
+    monkeypatch.setattr(compact_history, "HISTORY_SUMMARY_TOKENS", 20)
+    prompts = []
+
+    def call_gpt5(system_prompt, user_input):
+        prompts.append(system_prompt)
+        return ChatResult(text=f"summary {len(prompts)}")
+
+    monkeypatch.setattr(compact_history, "call_gpt5", call_gpt5)
+    return prompts
+
+
+def bot_history(turns):
+    """Bot-shaped history: a user and an assistant message per turn, 25 tokens each."""
+    history = []
+    for i in turns:
+        history.append({"role": "user", "content": f"question {i} ".ljust(40, ".")})
+        history.append({"role": "assistant", "content": f"answer {i} ".ljust(60, ".")})
+    return history
+
+
+def questions(turns):
+    return [turn["inputs"]["chat_input"].split(" ", 1)[1].rstrip(". ") for turn in turns]
+
+
+def test_short_history_passes_through(model):
+    turns = compact_history.compact_history(bot_history(range(2)), "conv", token_budget=100, keep_turns=3)
+
+    assert questions(turns) == ["0", "1"]
+    assert turns[0]["outputs"]["output"].startswith("answer 0")
+    assert model == []
+
+
+def test_long_history_becomes_summary_plus_recent_turns(model):
+    turns = compact_history.compact_history(bot_history(range(6)), "conv", token_budget=100, keep_turns=3)
+
+    assert turns[0] == {"inputs": {"chat_input": compact_history.SUMMARY_LABEL}, "outputs": {"output": "summary 1"}}
+    assert questions(turns[1:]) == ["3", "4", "5"]
+    assert len(model) == 1 and "question 0" in model[0] and "question 2" in model[0]
+    assert "question 3" not in model[0]
+
+
+def test_sliding_window_only_summarizes_new_turns(model):
+    compact_history.compact_history(bot_history(range(6)), "conv", token_budget=100, keep_turns=3)
+
+    # Same window again: the cached summary is reused
+    compact_history.compact_history(bot_history(range(6)), "conv", token_budget=100, keep_turns=3)
+    assert len(model) == 1
+
+    # The bot's window slid by one turn: only turn 3 is folded into the summary
+    turns = compact_history.compact_history(bot_history(range(1, 7)), "conv", token_budget=100, keep_turns=3)
+    assert len(model) == 2
+    assert "summary 1" in model[1] and "question 3" in model[1] and "question 2" not in model[1]
+    assert turns[0]["outputs"]["output"] == "summary 2"
+    assert questions(turns[1:]) == ["4", "5", "6"]
+
+
+def test_model_failure_falls_back_to_the_questions(model, monkeypatch):
+    monkeypatch.setattr(compact_history, "call_gpt5",
+                        lambda system_prompt, user_input: ChatResult(text="Error calling GPT-5", error=True))
+
+    turns = compact_history.compact_history(bot_history(range(6)), "conv", token_budget=100, keep_turns=3)
+
+    assert turns[0]["outputs"]["output"].startswith("User asked: question 0")
+
+
+def test_oversized_newest_turn_is_trimmed(model):
+    history = [{"inputs": {"chat_input": "short question"}, "outputs": {"output": "x" * 2000}}]
+
+    turns = compact_history.compact_history(history, "conv", token_budget=100, keep_turns=3)
+
+    assert turns[0]["inputs"]["chat_input"] == compact_history.SUMMARY_LABEL
+    assert turns[1]["inputs"]["chat_input"] == "short question"
+    assert context_builder.count_tokens(turns[1]["outputs"]["output"]) <= 100 - 20
@@ -0,0 +1,93 @@
+"""
+build_context (Flow2WithCleaner/context_builder.py): ranking, deduplication and packing
+search hits into the token budget, and the document ids search hits carry for it.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+import context_builder
+import tool_lookup
+from context_builder import build_context
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # ~4 characters per token, so budgets don't depend on whether tiktoken is installed
+    monkeypatch.setattr(context_builder, "_ENCODING", None)
+    monkeypatch.setattr(context_builder, "_ENCODING_LOADED", True)
+    monkeypatch.setattr(context_builder, "MIN_TRUNCATED_TOKENS", 5)
+
+
+def _hit(content, score, **extra):
+    return dict({"content": content, "score": score}, **extra)
+
+
+def test_ranked_by_score_then_position():
+    built = build_context([_hit("low", 1.0), _hit("high", 3.0), _hit("tie", 1.0)])
+
+    assert built["context"].split("\n\n") == ["high", "low", "tie"]
+    assert [item["position"] for item in built["included"]] == [1, 0, 2]
+
+
+def test_last_hit_that_fits_is_truncated():
+    first, second = "a" * 40, "b" * 200  # 10 and 50 tokens
+    built = build_context([_hit(first, 2.0), _hit(second, 1.0)], token_budget=30)
+
+    assert built["used_tokens"] <= 30
+    assert built["context"].startswith(first + "\n\n" + "b")
+    assert [item["truncated"] for item in built["included"]] == [False, True]
+
+
+def test_hits_that_dont_fit_are_dropped():
+    built = build_context([_hit("a" * 40, 2.0), _hit("b" * 200, 1.0)], token_budget=12)
+
+    assert built["context"] == "a" * 40
+    assert built["dropped"] == [{"position": 1, "reason": "budget", "tokens": 50}]
+
+
+def test_duplicates_are_dropped():
+    chunk = "Employees accrue paid time off every pay period based on tenure and role."
+    built = build_context([
+        _hit(chunk, 3.0, id="policy#0"),
+        _hit("A re-formatted copy of the same chunk.", 2.0, id="policy#0"),   # same document id
+        _hit("  " + chunk.upper() + "  ", 1.5),                               # same content
+        _hit(chunk.replace("role.", "role"), 1.0),                            # near-duplicate
+        _hit("Overtime is paid at time and a half.", 0.5, id="policy#1"),
+    ])
+
+    assert [item["position"] for item in built["included"]] == [0, 4]
+    assert [item["reason"] for item in built["dropped"]] == ["duplicate"] * 3
+
+
+def test_store_records_are_not_near_duplicates():
+    stores = [f"Store: Downtown (ID: {n})\nHours: Mon 8-8 | Tue 8-8" for n in (11, 12)]
+    built = build_context([_hit(stores[0], 2.0), _hit(stores[1], 1.0)])
+
+    assert len(built["included"]) == 2
+
+
+def test_search_hits_carry_document_ids():
+    doc = {"id": "handbook.md#3", "Title": "handbook.md", "chunk": "Overtime rules", "@search.score": 2.5}
+
+    assert tool_lookup.scored_hit(doc, "formatted") == {"content": "formatted", "score": 2.5, "id": "handbook.md#3"}
+    assert "id" not in tool_lookup.scored_hit({"chunk": "no id"}, "formatted")
+
+
+def test_local_index_chunks_have_ids(tmp_path):
+    from local_index import load_documents
+
+    (tmp_path / "handbook.md").write_text("one two three four five", encoding="utf-8")
+    docs = load_documents(str(tmp_path), chunk_words=2)
+
+    assert [doc["id"] for doc in docs] == ["handbook.md#0", "handbook.md#1", "handbook.md#2"]
+
+
+def test_tokenizer_not_loaded_on_import():
+    code = "import sys, context_builder; print('tiktoken' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(context_builder.__file__),
+                            capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,157 @@
+"""
+SqliteStorage (WebApp/conversation_storage.py): the LRU cache in front of SQLite,
+batched flushes, deletes, idle expiry, and never blocking the event loop on I/O.
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from conversation_storage import SqliteStorage
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "state.sqlite3")
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_writes_are_cached_until_flushed(db_path):
+    storage = SqliteStorage(db_path)
+
+    async def scenario():
+        await storage.write({"conv/1": {"history": ["hi"]}, "user/1": {"name": "Ana"}})
+        assert await SqliteStorage(db_path).read(["conv/1"]) == {}  # not on disk yet
+        assert storage.stats() == {"cached": 2, "dirty": 2}
+        await storage.flush()
+        return await SqliteStorage(db_path).read(["conv/1", "user/1"])
+
+    assert run(scenario()) == {"conv/1": {"history": ["hi"]}, "user/1": {"name": "Ana"}}
+    assert storage.stats()["dirty"] == 0
+
+
+def test_reads_return_copies(db_path):
+    storage = SqliteStorage(db_path)
+
+    async def scenario():
+        await storage.write({"conv/1": {"history": ["hi"]}})
+        state = (await storage.read(["conv/1"]))["conv/1"]
+        state["history"].append("mutated")
+        return await storage.read(["conv/1"])
+
+    assert run(scenario()) == {"conv/1": {"history": ["hi"]}}
+
+
+def test_cache_is_bounded_but_keeps_unsaved_keys(db_path):
+    storage = SqliteStorage(db_path, cache_size=2)
+
+    async def scenario():
+        await storage.write({f"conv/{i}": {"n": i} for i in range(4)})
+        # Dirty keys are never evicted, or their changes would be lost
+        assert storage.stats() == {"cached": 4, "dirty": 4}
+        await storage.flush()
+        assert storage.stats() == {"cached": 2, "dirty": 0}
+        # Evicted keys come back from disk
+        return await storage.read(["conv/0", "conv/3"])
+
+    assert run(scenario()) == {"conv/0": {"n": 0}, "conv/3": {"n": 3}}
+
+
+def test_deletes_are_persisted(db_path):
+    storage = SqliteStorage(db_path)
+
+    async def scenario():
+        await storage.write({"conv/1": {"n": 1}})
+        await storage.flush()
+        await storage.delete(["conv/1"])
+        assert await storage.read(["conv/1"]) == {}
+        await storage.flush()
+        return await SqliteStorage(db_path).read(["conv/1"])
+
+    assert run(scenario()) == {}
+
+
+def test_idle_state_expires(db_path):
+    storage = SqliteStorage(db_path, idle_ttl_seconds=0.05, sweep_interval_seconds=0)
+
+    async def scenario():
+        await storage.write({"conv/1": {"n": 1}})
+        await storage.flush()
+        await asyncio.sleep(0.1)
+        expired = await SqliteStorage(db_path, idle_ttl_seconds=0.05).read(["conv/1"])
+        await storage.write({"conv/2": {"n": 2}})
+        await storage.flush()  # sweeps expired rows
+        return expired
+
+    assert run(scenario()) == {}
+    with sqlite3.connect(db_path) as conn:
+        assert [key for key, in conn.execute("SELECT key FROM bot_state")] == ["conv/2"]
+
+
+class _FailingConnection:
+    """Wraps a connection so writes fail, as on a locked or full disk."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self.conn.__exit__(*exc)
+
+    def executemany(self, *args):
+        raise sqlite3.OperationalError("database is locked")
+
+    def execute(self, *args):
+        return self.conn.execute(*args)
+
+
+def test_failed_flush_keeps_the_changes(db_path):
+    storage = SqliteStorage(db_path)
+    conn = storage._conn
+
+    async def scenario():
+        await storage.write({"conv/1": {"n": 1}})
+        storage._conn = _FailingConnection(conn)
+        with pytest.raises(sqlite3.OperationalError):
+            await storage.flush()
+        assert storage.stats()["dirty"] == 1
+        storage._conn = conn
+        await storage.flush()
+        return await SqliteStorage(db_path).read(["conv/1"])
+
+    assert run(scenario()) == {"conv/1": {"n": 1}}
+
+
+def test_writes_dont_wait_for_disk_io(db_path):
+    storage = SqliteStorage(db_path)
+
+    async def scenario():
+        # A flush (or read) holding the connection in a worker thread
+        holding, release = threading.Event(), threading.Event()
+
+        def slow_io():
+            with storage._db_lock:
+                holding.set()
+                release.wait(5)
+
+        io = asyncio.ensure_future(asyncio.to_thread(slow_io))
+        await asyncio.to_thread(holding.wait, 5)
+        started = time.perf_counter()
+        await storage.write({"conv/1": {"n": 1}})
+        await storage.delete(["conv/2"])
+        elapsed = time.perf_counter() - started
+        cached = await asyncio.wait_for(storage.read(["conv/1"]), 1)
+        release.set()
+        await io
+        return elapsed, cached
+
+    elapsed, cached = run(scenario())
+    assert elapsed < 0.05
+    assert cached == {"conv/1": {"n": 1}}
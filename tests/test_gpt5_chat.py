@@ -0,0 +1,289 @@
+"""
+gpt5_chat against local Responses API stubs: answers, failover/backoff (within one
+backend and across two), streaming, and per-call latency with and without connection reuse.
+"""
+import asyncio
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import gpt5_chat
+import gpt5_chat_async
+from llm_router import Backend, LLMRouter
+
+# The stub sleeps this long on every new connection, standing in for the TCP + TLS
+# handshake a real Azure endpoint costs (plain HTTP on localhost is nearly free)
+HANDSHAKE_SECONDS = 0.02
+
+
+class ResponsesStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.connections = 0
+        self.requests = 0
+        self.script = []  # (status, headers, body) to answer with before the default 200
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(HANDSHAKE_SECONDS)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.requests += 1
+            scripted = self.server.script.pop(0) if self.server.script else None
+        if scripted:
+            status, headers, body = scripted
+        elif payload.get("stream"):
+            return self._stream(payload)
+        else:
+            status, headers = 200, {}
+            body = {"id": "resp_1", "model": payload["model"], "output_text": "stub answer",
+                    "usage": {"input_tokens": 12, "output_tokens": 3, "total_tokens": 15}}
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, payload):
+        events = [{"type": "response.output_text.delta", "delta": "stub "},
+                  {"type": "response.output_text.delta", "delta": "answer"}]
+        if payload["input"][1]["content"] != "cut off":
+            events.append({"type": "response.completed", "response": {"usage": {"total_tokens": 9}}})
+        data = "".join(f"data: {json.dumps(event)}\n\n" for event in events).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = ResponsesStub()
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    router = LLMRouter([Backend(server.url, "stub-deployment", "key")], backoff_base=0.01, backoff_max=0.05)
+    monkeypatch.setattr(gpt5_chat, "ROUTER", router)
+    monkeypatch.setattr(gpt5_chat_async, "ROUTER", router)
+    monkeypatch.setattr(gpt5_chat, "BACKOFF_MAX", 0.5)
+    monkeypatch.setattr(gpt5_chat, "_SESSION", None)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_call_returns_answer_and_usage(stub):
+    result = gpt5_chat.call_gpt5("system", "question")
+
+    assert not result.error
+    assert result.text == "stub answer"
+    assert result.usage == {"input_tokens": 12, "output_tokens": 3, "total_tokens": 15}
+    assert result.model == "stub-deployment"
+    # The reservation was settled with the real usage
+    assert gpt5_chat.ROUTER.backends[0].stats(time.monotonic())["tokens_last_minute"] == 15
+
+
+def test_pooled_session_reuses_one_connection(stub):
+    for _ in range(10):
+        assert gpt5_chat.call_gpt5("system", "question").text == "stub answer"
+
+    assert stub.requests == 10
+    assert stub.connections == 1
+
+
+def _mean_latency(calls=10):
+    latencies = [gpt5_chat.call_gpt5("system", "question").latency_ms for _ in range(calls)]
+    return statistics.mean(latencies[1:])  # the first call opens the pooled connection
+
+
+def test_connection_reuse_latency(stub, monkeypatch, record_property):
+    reused = _mean_latency()
+
+    # Without reuse: a fresh Session, and so a fresh connection, for every call
+    monkeypatch.setattr(gpt5_chat, "get_session", requests.Session)
+    fresh = _mean_latency()
+
+    record_property("reused_ms", round(reused, 2))
+    record_property("fresh_ms", round(fresh, 2))
+    assert stub.connections == 1 + 10
+    assert fresh - reused >= HANDSHAKE_SECONDS * 1000 * 0.8
+
+
+def test_retries_after_429_and_settles_failed_attempts(stub):
+    stub.script = [(429, {"retry-after-ms": "30"}, {"error": "rate limited"}),
+                   (503, {}, {"error": "busy"})]
+
+    result = gpt5_chat.call_gpt5("system", "question")
+
+    assert result.text == "stub answer"
+    assert stub.requests == 3
+    # Failed attempts release their reservation: only the successful call counts
+    assert gpt5_chat.ROUTER.backends[0].stats(time.monotonic())["tokens_last_minute"] == 15
+
+
+def test_long_retry_after_fails_fast(stub):
+    stub.script = [(429, {"Retry-After": "120"}, {"error": "rate limited"})]
+
+    started = time.monotonic()
+    result = gpt5_chat.call_gpt5("system", "question")
+
+    assert result.error
+    assert "throttled" in result.text
+    assert stub.requests == 1
+    assert time.monotonic() - started < 1
+    assert gpt5_chat.ROUTER.backends[0].in_flight == 0
+
+
+def test_client_error_is_not_retried(stub):
+    stub.script = [(400, {}, {"error": "bad request"})]
+
+    result = gpt5_chat.call_gpt5("system", "question")
+
+    assert result.error
+    assert "bad request" in result.text
+    assert stub.requests == 1
+
+
+def test_stream_yields_deltas(stub):
+    chunks = list(gpt5_chat.stream_gpt5("system", "question"))
+
+    assert chunks == ["stub ", "answer"]
+    assert not any(isinstance(chunk, gpt5_chat.StreamError) for chunk in chunks)
+
+
+def test_stream_cut_off_ends_with_stream_error(stub):
+    chunks = list(gpt5_chat.stream_gpt5("system", "cut off"))
+
+    assert chunks[:2] == ["stub ", "answer"]
+    assert isinstance(chunks[-1], gpt5_chat.StreamError)
+    assert gpt5_chat.ROUTER.backends[0].in_flight == 0
+
+
+def test_async_sessions_closed_when_loop_shuts_down(stub):
+    async def call():
+        answer = await gpt5_chat_async.chat_with_gpt5_async("system", "question")
+        return answer, await gpt5_chat_async.get_async_session()
+
+    results = [asyncio.run(call()) for _ in range(2)]
+
+    assert [answer for answer, _ in results] == ["stub answer"] * 2
+    assert all(session.closed for _, session in results)
+    assert gpt5_chat_async._ASYNC_SESSIONS == {}
+
+
+# --- Failover across backends ---
+
+class _FirstPick:
+    """rng for LLMRouter: always picks the first backend with headroom, and no backoff jitter."""
+
+    def uniform(self, low, high):
+        return low
+
+
+@pytest.fixture
+def two_stubs(monkeypatch):
+    servers = [ResponsesStub(), ResponsesStub()]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    router = LLMRouter([Backend(server.url, f"stub-{i}", "key") for i, server in enumerate(servers)],
+                       backoff_base=0.01, backoff_max=0.05, rng=_FirstPick())
+    monkeypatch.setattr(gpt5_chat, "ROUTER", router)
+    monkeypatch.setattr(gpt5_chat_async, "ROUTER", router)
+    monkeypatch.setattr(gpt5_chat, "BACKOFF_MAX", 0.5)
+    monkeypatch.setattr(gpt5_chat, "_SESSION", None)
+    yield servers
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _backend_stats():
+    return gpt5_chat.ROUTER.stats()
+
+
+def test_429_fails_over_to_the_second_backend(two_stubs):
+    first, second = two_stubs
+    first.script = [(429, {"Retry-After": "30"}, {"error": "rate limited"})]
+
+    result = gpt5_chat.call_gpt5("system", "question")
+
+    assert result.text == "stub answer"
+    assert result.model == "stub-1"
+    assert (first.requests, second.requests) == (1, 1)
+    throttled, healthy = _backend_stats()
+    # The full Retry-After becomes the first backend's cooldown; its reservation was released
+    assert 29 <= throttled["cooldown_seconds"] <= 30
+    assert throttled["consecutive_failures"] == 1
+    assert throttled["tokens_last_minute"] == 0
+    assert healthy["tokens_last_minute"] == 15 and healthy["consecutive_failures"] == 0
+    assert throttled["in_flight"] == healthy["in_flight"] == 0
+
+    # While it cools down, new calls go straight to the second backend
+    assert gpt5_chat.call_gpt5("system", "question").model == "stub-1"
+    assert (first.requests, second.requests) == (1, 2)
+
+
+def test_5xx_fails_over_and_quota_headers_are_tracked(two_stubs):
+    first, second = two_stubs
+    first.script = [(503, {}, {"error": "busy"})]
+    second.script = [(200, {"x-ratelimit-remaining-tokens": "900", "x-ratelimit-remaining-requests": "9"},
+                      {"id": "resp_2", "model": "stub-1", "output_text": "from the second",
+                       "usage": {"total_tokens": 20}})]
+
+    result = gpt5_chat.call_gpt5("system", "question")
+
+    assert result.text == "from the second"
+    failed, answered = _backend_stats()
+    # No Retry-After: a jittered backoff cooldown, at most backoff_max
+    assert failed["consecutive_failures"] == 1 and failed["cooldown_seconds"] <= 0.05
+    assert answered["remaining_tokens"] == 900
+    assert answered["tokens_last_minute"] == 20
+
+
+def test_all_backends_throttled_fails_fast(two_stubs):
+    for server in two_stubs:
+        server.script = [(429, {"Retry-After": "60"}, {"error": "rate limited"})]
+
+    started = time.monotonic()
+    result = gpt5_chat.call_gpt5("system", "question")
+
+    assert result.error and "throttled" in result.text
+    assert [server.requests for server in two_stubs] == [1, 1]
+    assert time.monotonic() - started < 1
+
+
+def test_async_client_fails_over(two_stubs):
+    first, second = two_stubs
+    first.script = [(503, {}, {"error": "busy"})]
+
+    answer = asyncio.run(gpt5_chat_async.chat_with_gpt5_async("system", "question"))
+
+    assert answer == "stub answer"
+    assert (first.requests, second.requests) == (1, 1)
+    assert [stats["in_flight"] for stats in _backend_stats()] == [0, 0]
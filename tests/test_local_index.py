@@ -0,0 +1,83 @@
+"""
+The local hybrid index (Flow2WithCleaner/local_index.py): building, searching, and
+switching readers to a rebuilt index without ever mixing files from two builds.
+"""
+import json
+import os
+import threading
+
+import pytest
+
+import local_index
+from local_index import LocalIndex, build_index, get_local_index
+
+
+def write_corpus(source_dir, documents):
+    source_dir.mkdir(exist_ok=True)
+    for old in source_dir.iterdir():
+        old.unlink()
+    with open(source_dir / "records.jsonl", "w", encoding="utf-8") as f:
+        for doc in documents:
+            f.write(json.dumps(doc) + "\n")
+
+
+SMALL = [{"id": "a", "content": "overtime is paid at time and a half"}]
+LARGE = [{"id": f"doc{i}", "content": f"policy number {i} about overtime and leave"} for i in range(40)]
+
+
+@pytest.fixture(autouse=True)
+def fresh_index(monkeypatch):
+    monkeypatch.setattr(local_index, "_INDEX", None)
+
+
+def test_build_and_search(tmp_path):
+    write_corpus(tmp_path / "src", SMALL + LARGE[:3])
+    manifest = build_index(str(tmp_path / "src"), str(tmp_path / "index"), vector_dims=64)
+
+    index = LocalIndex(str(tmp_path / "index"))
+    hits = index.search("overtime time and a half", top=2)
+
+    assert manifest["documents"] == 4
+    assert hits[0]["id"] == "a" and hits[0]["@search.score"] > 0
+    assert index.build_dir.endswith(manifest["build"])
+
+
+def test_rebuild_switches_readers_and_keeps_the_previous_build(tmp_path):
+    source, index_dir = tmp_path / "src", str(tmp_path / "index")
+    builds = []
+    for corpus in (SMALL, LARGE, SMALL):
+        write_corpus(source, corpus)
+        builds.append(build_index(str(source), index_dir, vector_dims=16)["build"])
+        assert len(get_local_index(index_dir).documents) == len(corpus)
+
+    # The build before the current one stays for processes still loading it; older ones go
+    assert sorted(os.listdir(os.path.join(index_dir, "builds"))) == sorted(builds[1:])
+    with open(os.path.join(index_dir, "CURRENT"), encoding="utf-8") as f:
+        assert f.read() == builds[-1]
+
+
+def test_loads_during_rebuilds_never_mix_builds(tmp_path):
+    source_small, source_large, index_dir = tmp_path / "small", tmp_path / "large", str(tmp_path / "index")
+    write_corpus(source_small, SMALL)
+    write_corpus(source_large, LARGE)
+    build_index(str(source_small), index_dir, vector_dims=16)
+    done = threading.Event()
+
+    def rebuild():
+        try:
+            for i in range(15):
+                build_index(str(source_large if i % 2 == 0 else source_small), index_dir, vector_dims=16)
+        finally:
+            done.set()
+
+    writer = threading.Thread(target=rebuild)
+    writer.start()
+    loads = 0
+    while not done.is_set() or loads == 0:
+        index = LocalIndex(index_dir)
+        # Documents, BM25 stats, vectors and manifest all come from the same build
+        assert len(index.documents) == index.manifest["documents"] == len(index.doc_lengths)
+        assert index.vectors is None or len(index.vectors) == len(index.documents)
+        index.search("overtime leave", top=3)
+        loads += 1
+    writer.join()
@@ -0,0 +1,65 @@
+"""
+The metrics registry (metrics.py): the copies shipped with the bot and the flow tools,
+counters and histograms, and the Prometheus text export.
+"""
+import os
+import urllib.request
+
+from metrics import MetricsRegistry, start_metrics_server
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _read(*parts):
+    with open(os.path.join(REPO_ROOT, *parts), encoding="utf-8") as f:
+        return f.read().replace("\r\n", "\n")
+
+
+def test_web_app_and_flow_ship_the_same_module():
+    assert _read("WebApp", "metrics.py") == _read("Flow2WithCleaner", "metrics.py")
+
+
+def test_counters_and_histograms():
+    registry = MetricsRegistry(prefix="test")
+    registry.inc("cache_total", cache="response", result="hit")
+    registry.inc("cache_total", 2, cache="response", result="hit")
+    registry.inc("responses_total", status=200)
+    for seconds in (0.1, 0.2, 0.3):
+        registry.observe("stage_seconds", seconds, stage="llm")
+    with registry.stage("search"):
+        pass
+
+    snapshot = registry.snapshot()
+    assert snapshot["counters"]['cache_total{cache="response",result="hit"}'] == 3
+    # Label values are stringified, so 200 and "200" are one series
+    registry.inc("responses_total", status="200")
+    assert registry.snapshot()["counters"]['responses_total{status="200"}'] == 2
+    llm = snapshot["histograms"]['stage_seconds{stage="llm"}']
+    assert llm["count"] == 3 and abs(llm["mean"] - 0.2) < 1e-9
+    assert snapshot["histograms"]['stage_seconds{stage="search"}']["count"] == 1
+
+
+def test_prometheus_export():
+    registry = MetricsRegistry(prefix="test")
+    registry.inc("errors_total", stage="search")
+    registry.observe("stage_seconds", 0.02, stage="search")
+
+    text = registry.render_prometheus()
+    assert "# TYPE test_errors_total counter" in text
+    assert 'test_errors_total{stage="search"} 1' in text
+    assert 'test_stage_seconds_bucket{stage="search",le="0.01"} 0' in text
+    assert 'test_stage_seconds_bucket{stage="search",le="0.025"} 1' in text
+    assert 'test_stage_seconds_count{stage="search"} 1' in text
+
+
+def test_metrics_server():
+    registry = MetricsRegistry(prefix="test")
+    registry.inc("requests_total")
+    server = start_metrics_server(0, registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert "test_requests_total 1" in response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
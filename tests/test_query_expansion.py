@@ -0,0 +1,68 @@
+"""
+QueryExpander (Flow2WithCleaner/query_expansion.py): whole-token, longest-match synonym
+expansion, and reloading the shared expander when the expansion file changes.
+"""
+import json
+import os
+
+import query_expansion
+from query_expansion import QueryExpander
+
+STATES = {"TX": "Texas", "IN": "Indiana", "NY": ["New York", "NYC"], "PTO": "paid time off"}
+
+
+def test_expands_whole_tokens_only():
+    expander = QueryExpander(STATES)
+
+    assert expander.expand("stores in TX") == "stores in TX Texas"
+    # Abbreviations are case-sensitive and never match inside a word
+    assert expander.expand("log in to TXT") == "log in to TXT"
+    assert expander.expand("hours in IN") == "hours in IN Indiana"
+
+
+def test_multiple_synonyms_and_terms():
+    expander = QueryExpander(STATES)
+
+    assert expander.expand("NY or TX") == "NY New York NYC or TX Texas"
+    assert expander.expand("PTO policy") == "PTO paid time off policy"
+
+
+def test_synonyms_already_in_the_query_are_not_repeated():
+    expander = QueryExpander(STATES)
+
+    assert expander.expand("Texas stores in TX") == "Texas stores in TX"
+    # A synonym must be present as whole tokens: "indianapolis" doesn't count as "Indiana"
+    assert expander.expand("indianapolis IN") == "indianapolis IN Indiana"
+
+
+def test_longest_multi_word_term_wins():
+    expander = QueryExpander({"time off": "leave", "paid time off": "PTO", "paid": "salaried"})
+
+    assert expander.expand("Paid time off rules") == "Paid time off PTO rules"
+    assert expander.expand("paid holidays") == "paid salaried holidays"
+
+
+def test_empty_table_returns_the_query():
+    assert QueryExpander().expand("anything at all") == "anything at all"
+
+
+def test_expansion_file_is_merged_and_reloaded(tmp_path, monkeypatch):
+    path = tmp_path / "expansions.json"
+    path.write_text(json.dumps({"WFH": "work from home"}), encoding="utf-8")
+    monkeypatch.setattr(query_expansion, "QUERY_EXPANSION_PATH", str(path))
+    monkeypatch.setattr(query_expansion, "QUERY_EXPANSION_RELOAD_SECONDS", 0)
+    monkeypatch.setattr(query_expansion, "_EXPANDER", None)
+    base = {"TX": "Texas"}
+
+    expander = query_expansion.get_query_expander(base)
+    assert expander.expand("WFH in TX") == "WFH work from home in TX Texas"
+    assert query_expansion.get_query_expander(base) is expander
+
+    path.write_text(json.dumps({"WFH": "remote"}), encoding="utf-8")
+    os.utime(path, (os.path.getmtime(path) + 5,) * 2)
+    assert query_expansion.get_query_expander(base).expand("WFH") == "WFH remote"
+
+    # A half-written file keeps the previous table
+    path.write_text("{", encoding="utf-8")
+    os.utime(path, (os.path.getmtime(path) + 10,) * 2)
+    assert query_expansion.get_query_expander(base).expand("WFH") == "WFH remote"
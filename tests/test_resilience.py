@@ -0,0 +1,284 @@
+"""
+The bot's Prompt Flow proxy (WebApp/app.py) against a local aiohttp stub that injects
+429/503, timeouts and broken streams: RetryPolicy, CircuitBreaker, parse_retry_after,
+no retry once part of a streamed answer has been shown, and /ready staying 503 until
+the Prompt Flow connections open.
+"""
+import asyncio
+import json
+import time
+from email.utils import formatdate
+
+import pytest
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+
+import app
+from bot import STREAM_INTERRUPTED_NOTE, MyBot
+from resilience import CircuitBreaker, CircuitOpenError, FlowCallError, RetryPolicy, parse_retry_after
+
+
+# --- Units ---
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert 28 <= parse_retry_after(formatdate(time.time() + 30, usegmt=True)) <= 30
+    assert parse_retry_after(formatdate(time.time() - 30, usegmt=True)) == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_retry_policy_limits():
+    policy = RetryPolicy(max_attempts=3, deadline_seconds=10, backoff_base=0.5, backoff_max=2)
+    deadline = policy.start()
+
+    assert policy.is_retryable(429) and policy.is_retryable(503)
+    assert not policy.is_retryable(400)
+    assert 0 <= policy.next_delay(0, deadline) <= 0.5
+    # Retry-After is honoured in full, even past backoff_max ...
+    assert policy.next_delay(0, deadline, retry_after=1.5) == 1.5
+    assert policy.next_delay(1, deadline, retry_after=5) == 5
+    # ... and a wait longer than the time left gives up instead of retrying early
+    assert policy.next_delay(1, deadline, retry_after=60) is None
+    # Out of attempts
+    assert policy.next_delay(2, deadline) is None
+    # Out of time: a delay that leaves less than a second for the attempt
+    assert policy.next_delay(0, time.monotonic() + 1.5, retry_after=1) is None
+
+
+def test_circuit_breaker_transitions():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()  # the half-open probe
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # only one probe at a time
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.consecutive_failures == 0
+
+
+# --- Proxy against a Prompt Flow stub ---
+
+class FlowStub:
+    """Prompt Flow /score stub answering each request with the next scripted behaviour."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+
+    async def score(self, request):
+        self.calls += 1
+        kind, *args = self.script.pop(0) if self.script else ("json",)
+        if kind == "status":
+            status, headers = args[0], (args[1] if len(args) > 1 else {})
+            return web.json_response({"error": "injected"}, status=status, headers=headers)
+        if kind == "hang":
+            await asyncio.sleep(args[0])
+            return web.json_response({"chat_output": "late"})
+        if kind in ("stream", "stream_cut"):
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            for chunk in ("Partial ", "answer"):
+                await response.write(f"data: {json.dumps({'chat_output': chunk})}\n\n".encode())
+            if kind == "stream_cut":
+                await asyncio.sleep(5)  # goes silent; the idle timeout cuts it off
+            await response.write_eof()
+            return response
+        return web.json_response({"chat_output": "stub answer"})
+
+
+@pytest.fixture
+def proxy(monkeypatch):
+    monkeypatch.setattr(app, "RETRY_POLICY", RetryPolicy(max_attempts=3, deadline_seconds=10,
+                                                         backoff_base=0.01, backoff_max=0.05))
+    monkeypatch.setattr(app, "CIRCUIT", CircuitBreaker(failure_threshold=3, reset_seconds=60))
+    monkeypatch.setattr(app.CONFIG, "AI_TIMEOUT", 0.3)
+    monkeypatch.setattr(app.CONFIG, "STREAMING", True)
+    monkeypatch.setattr(app.CONFIG, "STREAM_IDLE_TIMEOUT_SECONDS", 0.3)
+    monkeypatch.setattr(app.CONFIG, "STREAM_UPDATE_SECONDS", 0.0)
+    monkeypatch.setattr(app.FLOW, "endpoint", "stub")
+    monkeypatch.setattr(app.FLOW, "streaming", True)
+
+    def run(script, scenario):
+        async def main():
+            stub = FlowStub(script)
+            flow_app = web.Application()
+            flow_app.router.add_post("/score", stub.score)
+            server = TestServer(flow_app)
+            await server.start_server()
+            monkeypatch.setattr(app, "PF_ENDPOINT", str(server.make_url("/score")))
+            monkeypatch.setattr(app, "HTTP_SESSION", ClientSession())
+            try:
+                return stub, await scenario()
+            finally:
+                await app.HTTP_SESSION.close()
+                await server.close()
+        return asyncio.run(main())
+    return run
+
+
+def ask():
+    return app.FLOW.ask_prompt_flow(None, {"chat_input": "hi", "chat_history": []})
+
+
+def test_retries_503_then_succeeds(proxy):
+    stub, (reply, sent) = proxy([("status", 503)], ask)
+
+    assert (reply, sent) == ("stub answer", False)
+    assert stub.calls == 2
+    assert app.CIRCUIT.state == "closed"
+
+
+def test_retries_429_after_retry_after(proxy):
+    started = time.monotonic()
+    stub, (reply, _) = proxy([("status", 429, {"Retry-After": "0.03"})], ask)
+
+    assert reply == "stub answer"
+    assert stub.calls == 2
+    assert time.monotonic() - started >= 0.03
+
+
+def test_retry_after_past_the_deadline_fails_fast(proxy):
+    async def scenario():
+        started = time.monotonic()
+        with pytest.raises(FlowCallError, match="429"):
+            await ask()
+        return time.monotonic() - started
+
+    stub, elapsed = proxy([("status", 429, {"Retry-After": "60"})], scenario)
+
+    assert stub.calls == 1
+    assert elapsed < 1
+
+
+def test_retries_a_timeout(proxy):
+    stub, (reply, _) = proxy([("hang", 2)], ask)
+
+    assert reply == "stub answer"
+    assert stub.calls == 2
+
+
+def test_gives_up_after_max_attempts_and_opens_the_circuit(proxy):
+    async def twice():
+        with pytest.raises(FlowCallError, match="503"):
+            await ask()
+        # Three consecutive failures opened the circuit: the next turn fails fast
+        with pytest.raises(FlowCallError, match="temporarily unavailable"):
+            await ask()
+
+    stub, _ = proxy([("status", 503)] * 5, twice)
+
+    assert stub.calls == 3
+    assert app.CIRCUIT.state == "open"
+
+
+def test_client_error_is_not_retried(proxy):
+    async def scenario():
+        with pytest.raises(FlowCallError, match="400"):
+            await ask()
+
+    stub, _ = proxy([("status", 400)], scenario)
+
+    assert stub.calls == 1
+    assert app.CIRCUIT.state == "closed"
+
+
+def test_cancelled_probe_gives_its_slot_back(proxy, monkeypatch):
+    monkeypatch.setattr(app, "CIRCUIT", CircuitBreaker(failure_threshold=1, reset_seconds=0.01))
+
+    async def scenario():
+        app.CIRCUIT.record_failure()
+        await asyncio.sleep(0.02)
+        # The half-open probe is cancelled mid-call (the turn was abandoned)
+        probe = asyncio.ensure_future(ask())
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return await ask()
+
+    stub, (reply, _) = proxy([("hang", 2)], scenario)
+
+    assert reply == "stub answer"
+    assert stub.calls == 2
+    assert app.CIRCUIT.state == "closed"
+
+
+def _bot_turn(text):
+    from botbuilder.core import ConversationState, MemoryStorage, UserState
+    from botbuilder.core.adapters import TestAdapter
+
+    storage = MemoryStorage()
+    bot = MyBot(ConversationState(storage), UserState(storage), storage, app.FLOW)
+    adapter = TestAdapter(bot.on_turn)
+
+    async def scenario():
+        await adapter.send(text)
+        return adapter
+    return scenario
+
+
+def test_stream_relayed_in_full(proxy):
+    stub, adapter = proxy([("stream",)], _bot_turn("hi"))
+
+    messages = [a.text for a in adapter.activity_buffer if a.type == "message"]
+    assert stub.calls == 1
+    assert messages == ["Partial "]
+    assert adapter.updated_activities[-1].text == "Partial answer"
+
+
+def test_stream_cut_off_midway_is_not_retried(proxy):
+    stub, adapter = proxy([("stream_cut",)], _bot_turn("hi"))
+
+    messages = [a.text for a in adapter.activity_buffer if a.type == "message"]
+    # One Prompt Flow call and one message: the partial answer, finished with a note
+    assert stub.calls == 1
+    assert messages == ["Partial "]
+    assert adapter.updated_activities[-1].text == "Partial answer" + STREAM_INTERRUPTED_NOTE
+
+
+# --- Readiness ---
+
+def test_ready_waits_for_prompt_flow_connections(monkeypatch):
+    attempts = []
+
+    async def warm_connections():
+        attempts.append(app.READY)
+        if len(attempts) < 3:
+            raise ConnectionError("prompt flow unreachable")
+
+    monkeypatch.setattr(app, "load_bot", lambda: None)
+    monkeypatch.setattr(app, "warm_prompt_flow_connections", warm_connections)
+    monkeypatch.setattr(app, "PF_ENDPOINT", "http://prompt-flow.invalid/score")
+    monkeypatch.setattr(app.CONFIG, "WARMUP_RETRY_SECONDS", 0.01)
+    monkeypatch.setattr(app, "WARMUP", {"bot": None, "prompt_flow_connections": None})
+    monkeypatch.setattr(app, "WARMUP_ERRORS", {})
+    monkeypatch.setattr(app, "READY", False)
+
+    async def main():
+        monkeypatch.setattr(app, "HTTP_SESSION", ClientSession())
+        try:
+            await app.warm_up()
+        finally:
+            await app.HTTP_SESSION.close()
+
+    asyncio.run(main())
+
+    # Not ready while the connections failed; ready once they opened, with the error cleared
+    assert attempts == [False, False, False]
+    assert app.READY
+    assert app.WARMUP["prompt_flow_connections"] is not None
+    assert app.WARMUP_ERRORS == {}
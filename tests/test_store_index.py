@@ -0,0 +1,97 @@
+"""
+Direct store lookups (Flow2WithCleaner/store_index.py): which questions name a store,
+and lookup_indexed_knowledge answering exact ones without full-text search.
+"""
+import pytest
+
+import store_index
+import tool_lookup
+from store_index import StoreIndex, merge_direct_hits
+
+STORES = [
+    {"StoreId": "77", "StoreName": "Downtown", "Address": "1 Main St", "City": "Austin", "State": "TX",
+     "StoreLeader": "Kim Park", "StoreLeaderEmail": "kim@example.com", "DistrictName": "Central",
+     "DistrictLeader": "Lee Chan", "MondayHours": "8-8"},
+    {"StoreId": "0120", "StoreName": "Bayside", "Address": "9 Bay Rd", "City": "Mobile", "State": "AL",
+     "StoreLeader": "Ana Ruiz"},
+]
+
+
+@pytest.fixture
+def index():
+    index = StoreIndex()
+    index.upsert(STORES)
+    return index
+
+
+@pytest.mark.parametrize("query", [
+    "how do I return order #77 ?",
+    "what's the status of ticket #77",
+    "order 77 hours",
+    "hours for mobile orders",
+    "what is the PTO policy",
+])
+def test_questions_not_about_a_store(index, query):
+    assert index.answer(query) == (None, False)
+
+
+@pytest.mark.parametrize("query", [
+    "who is the leader of store 77",
+    "store #77 hours on monday",
+    "email for store no. 77",
+    "what district is Kim Park in",
+    "hours in Austin, TX",
+])
+def test_exact_store_questions(index, query):
+    hits, exact = index.answer(query)
+
+    assert exact
+    assert [hit["content"].split("\n", 1)[0] for hit in hits] == ["Store: Downtown (ID: 77)"]
+
+
+def test_partial_store_questions(index):
+    # A store named without a store field, or a city without its state
+    for query in ("return policy at store 120", "hours at the mobile store"):
+        hits, exact = index.answer(query)
+        assert not exact
+        assert hits[0]["content"].startswith("Store: Bayside (ID: 0120)")
+
+
+def test_only_the_asked_fields_are_sent(index):
+    hits, _ = index.answer("who is the leader of store 77")
+
+    assert "Kim Park" in hits[0]["content"]
+    assert "Hours" not in hits[0]["content"] and "District" not in hits[0]["content"]
+
+
+def test_exact_hit_skips_search(index, monkeypatch):
+    monkeypatch.setattr(store_index, "get_store_index", lambda factory=None: index)
+
+    def search(query):
+        raise AssertionError("full-text search ran for an exact store question")
+
+    monkeypatch.setattr(tool_lookup, "search_indexed_knowledge", search)
+    hits = tool_lookup.lookup_indexed_knowledge("who is the leader of store 77")
+
+    assert len(hits) == 1 and "Kim Park" in hits[0]["content"]
+
+
+def test_partial_hit_goes_ahead_of_search(index, monkeypatch):
+    monkeypatch.setattr(store_index, "get_store_index", lambda factory=None: index)
+    searched = []
+    policy = {"content": "Returns are accepted within 30 days.", "score": 3.0}
+    duplicate = {"content": "Store: Bayside (ID: 0120)\nLocation: ...", "score": 2.0}
+    monkeypatch.setattr(tool_lookup, "search_indexed_knowledge",
+                        lambda query: searched.append(query) or [policy, duplicate])
+
+    hits = tool_lookup.lookup_indexed_knowledge("return policy at store 120")
+
+    assert searched == ["return policy at store 120"]
+    assert hits[0]["content"].startswith("Store: Bayside") and hits[1:] == [policy]
+
+
+def test_merge_direct_hits_with_search_error():
+    direct = [{"content": "Store: Downtown (ID: 77)", "score": 100.0}]
+
+    assert merge_direct_hits(direct, "Error querying Azure Search: boom") == direct
+    assert merge_direct_hits(None, "No relevant information found.") == "No relevant information found."
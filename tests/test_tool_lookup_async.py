@@ -0,0 +1,44 @@
+"""
+The per-event-loop SearchClient registry of Flow2WithCleaner/tool_lookup_async.py:
+clients are shared within a loop, closed when the loop shuts down, and entries of
+loops closed without a shutdown are dropped on the next lookup.
+"""
+import asyncio
+
+import tool_lookup_async
+
+CLIENT_ARGS = ("http://127.0.0.1:1", "test-index", "test-key")
+
+
+async def open_client():
+    client = await tool_lookup_async.get_async_search_client(*CLIENT_ARGS)
+    assert await tool_lookup_async.get_async_search_client(*CLIENT_ARGS) is client
+    transport = tool_lookup_async._LOOP_CLIENTS[asyncio.get_running_loop()][0]
+    await transport.open()
+    return transport
+
+
+def test_clients_closed_when_loop_shuts_down():
+    transports = [asyncio.run(open_client()) for _ in range(3)]
+
+    assert tool_lookup_async._LOOP_CLIENTS == {}
+    assert all(transport.session is None for transport in transports)
+    assert len(set(map(id, transports))) == 3
+
+
+def test_explicit_close_and_closed_loop_eviction():
+    async def open_and_close():
+        transport = await open_client()
+        await tool_lookup_async.close_async_search_clients()
+        return transport
+
+    assert asyncio.run(open_and_close()).session is None
+    assert tool_lookup_async._LOOP_CLIENTS == {}
+
+    # A loop closed without shutdown_asyncgens() leaves its entry behind until the next lookup
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(open_client())
+    loop.close()
+    assert loop in tool_lookup_async._LOOP_CLIENTS
+    asyncio.run(open_client())
+    assert tool_lookup_async._LOOP_CLIENTS == {}